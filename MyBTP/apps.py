@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class MyBTPConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'MyBTP'
+    
+    def ready(self):
+        import MyBTP.signals  # noqa
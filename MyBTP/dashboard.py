@@ -0,0 +1,88 @@
+"""
+Dashboard KPIs, computed with one conditional aggregate per table and cached as a snapshot.
+
+The snapshot lives in the default cache for DASHBOARD_STATS_TIMEOUT. Saving or
+deleting a chantier, slot, lead, user or team also drops it once the
+transaction commits (receivers in MyBTP.signals), but only in the cache the
+writing process sees: with the default per-process LocMemCache, other server
+processes, and bulk writes that send no signals (bulk slot creation,
+repricing, aggregate recomputes), show the change once the snapshot expires.
+A shared cache backend in CACHES makes the drop reach every process.
+"""
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+
+from accounts.models import User
+from lead.models import Pistes
+from planning.models import Planning
+from projects.models import Chantiers
+from teams.models import Equipe
+
+
+DASHBOARD_STATS_CACHE_KEY = 'dashboard_stats'
+DASHBOARD_STATS_TIMEOUT = 120
+
+
+def compute_dashboard_stats(today=None):
+    """Compute the dashboard KPIs for the week of today"""
+    today = today or date.today()
+    week_start = today - timedelta(days=today.weekday())
+    week_end = week_start + timedelta(days=6)
+
+    chantiers = Chantiers.objects.order_by().aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(avancement_chantier__lt=100)),
+        revenue=Sum('devis_ht'),
+    )
+    week = Planning.objects.filter(date__gte=week_start, date__lte=week_end).order_by().aggregate(
+        minutes=Sum('duration_minutes'),
+        cost=Sum('cout_planning'),
+    )
+    leads = Pistes.objects.order_by().aggregate(
+        total=Count('id'),
+        qualified=Count('id', filter=Q(statut__in=['Qualifié', 'Devis'])),
+        won=Count('id', filter=Q(statut='Gagné')),
+        estimated=Sum('montant_estime'),
+    )
+    employees = User.objects.exclude(user_type__in=['Admin', 'Secrétaire']).order_by().aggregate(total=Count('id'))
+    teams = Equipe.objects.order_by().aggregate(total=Count('id'))
+
+    return {
+        'week_start': week_start,
+        'chantiers': {
+            'total': chantiers['total'],
+            'active': chantiers['active'],
+            'total_revenue': float(chantiers['revenue'] or 0),
+        },
+        'planning': {
+            'week_hours': round((week['minutes'] or 0) / 60.0, 2),
+            'week_cost': float(week['cost'] or 0),
+        },
+        'leads': {
+            'total': leads['total'],
+            'qualified': leads['qualified'],
+            'won': leads['won'],
+            'total_estimated': float(leads['estimated'] or 0),
+        },
+        'team': {
+            'total_employees': employees['total'],
+            'active_teams': teams['total'],
+        },
+    }
+
+
+def dashboard_stats():
+    """Return the cached KPI snapshot, recomputing it when missing or from a past week"""
+    today = date.today()
+    stats = cache.get(DASHBOARD_STATS_CACHE_KEY)
+    if stats is None or stats['week_start'] != today - timedelta(days=today.weekday()):
+        stats = compute_dashboard_stats(today)
+        cache.set(DASHBOARD_STATS_CACHE_KEY, stats, DASHBOARD_STATS_TIMEOUT)
+    return stats
+
+
+def drop_dashboard_stats():
+    """Forget the cached snapshot so the next load recomputes it"""
+    cache.delete(DASHBOARD_STATS_CACHE_KEY)
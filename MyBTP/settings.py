@@ -52,6 +52,7 @@ INSTALLED_APPS = [
     'stock',
     'api',  # API application
     'chat',  # Chatbot application
+    'MyBTP',  # Project-wide receivers (dashboard snapshot)
 ]
 
 MIDDLEWARE = [
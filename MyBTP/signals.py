@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from accounts.models import User
+from lead.models import Pistes
+from planning.models import Planning
+from projects.models import Chantiers
+from teams.models import Equipe
+from .dashboard import drop_dashboard_stats
+
+
+def invalidate_dashboard_stats(update_fields=None, **kwargs):
+    """Drop this process's KPI snapshot after the current transaction commits"""
+    # Logins save last_login only, which no KPI reads
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    transaction.on_commit(drop_dashboard_stats)
+
+
+for model in (Chantiers, Planning, Pistes, User, Equipe):
+    post_save.connect(invalidate_dashboard_stats, sender=model, dispatch_uid=f'dashboard_stats_save_{model.__name__}')
+    post_delete.connect(invalidate_dashboard_stats, sender=model, dispatch_uid=f'dashboard_stats_delete_{model.__name__}')
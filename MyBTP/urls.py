@@ -19,7 +19,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from . import views
-from projects.views import create_chantier, list_chantiers, chantier_detail, map_chantiers
+from projects.views import (
+    create_chantier, list_chantiers, search_chantiers, chantier_detail,
+    chantier_planning_history, chantier_planning_rollup, chantiers_profitability,
+    chantier_forecasts, refresh_chantier_forecasts,
+    map_chantiers, map_chantiers_geojson,
+)
 from accounts.views import create_employee, list_employees
 from teams.views import create_team, list_teams, update_team, delete_team
 
@@ -37,12 +42,26 @@ urlpatterns = [
     
     # Main views (must come after auth to avoid conflicts)
     path('', views.dashboard, name='dashboard'),
+    path('dashboard/trends/', views.dashboard_trends, name='dashboard_trends'),
     path('planning/', views.planning, name='planning'),
     path('planning/create/', views.create_planning_slot, name='create_planning_slot'),
+    path('planning/bulk-create/', views.bulk_create_planning_slots, name='bulk_create_planning_slots'),
     path('planning/list/', views.list_planning_slots, name='list_planning_slots'),
+    path('planning/sync/', views.sync_planning_slots, name='sync_planning_slots'),
+    path('planning/events/', views.planning_events, name='planning_events'),
+    path('planning/availability/', views.planning_availability, name='planning_availability'),
+    path('planning/nearest-employees/', views.planning_nearest_employees, name='planning_nearest_employees'),
+    path('planning/tours/', views.planning_tours, name='planning_tours'),
+    path('planning/capacity/', views.planning_capacity, name='planning_capacity'),
     path('chantiers/', views.chantiers, name='chantiers'),
     path('chantiers/<int:id>/', chantier_detail, name='chantier_detail'),
+    path('chantiers/<int:id>/plannings/', chantier_planning_history, name='chantier_planning_history'),
+    path('chantiers/<int:id>/plannings/rollup/', chantier_planning_rollup, name='chantier_planning_rollup'),
     path('chantiers/list/', list_chantiers, name='list_chantiers'),
+    path('chantiers/search/', search_chantiers, name='search_chantiers'),
+    path('chantiers/profitability/', chantiers_profitability, name='chantiers_profitability'),
+    path('chantiers/forecasts/', chantier_forecasts, name='chantier_forecasts'),
+    path('chantiers/forecasts/refresh/', refresh_chantier_forecasts, name='refresh_chantier_forecasts'),
     path('chantiers/create/', create_chantier, name='create_chantier'),
     path('team/', views.team, name='team'),
     path('team/<int:id>/', views.employee_detail, name='employee_detail'),
@@ -54,6 +73,7 @@ urlpatterns = [
     path('team/teams/<int:pk>/delete/', delete_team, name='delete_team'),
     path('pistes/', views.pistes, name='pistes'),
     path('map/', map_chantiers, name='map_chantiers'),
+    path('map/chantiers/', map_chantiers_geojson, name='map_chantiers_geojson'),
     path('fleet/', views.fleet, name='fleet'),
     path('fleet/<int:id>/', views.fleet_item_detail, name='fleet_item_detail'),
     
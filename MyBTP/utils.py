@@ -0,0 +1,49 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+
+def queryset_version(queryset, field='updated_at'):
+    """
+    Return a cheap (count, max(field)) fingerprint of a queryset, in one aggregate query.
+
+    The max catches inserts and updates, the count catches deletes.
+    """
+    version = queryset.order_by().aggregate(count=Count('pk'), latest=Max(field))
+    return version['count'], version['latest']
+
+
+def make_etag(*parts):
+    """Hash fingerprint parts into an ETag value"""
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def conditional_json(fingerprint_func):
+    """
+    Answer 304 Not Modified when the fingerprint matches the client's If-None-Match.
+
+    fingerprint_func(request, *args, **kwargs) returns a tuple of version parts
+    (see queryset_version()), or None to skip conditional handling. It runs
+    before the view, so an unchanged reload costs only the fingerprint queries.
+    The parts are kept on request.fingerprint for views that reuse them.
+    Responses are marked no-cache so browsers always revalidate.
+    """
+    def etag_func(request, *args, **kwargs):
+        parts = request.fingerprint = fingerprint_func(request, *args, **kwargs)
+        if parts is None:
+            return None
+        return make_etag(request.get_full_path(), *parts)
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -1,79 +1,93 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponseNotAllowed
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from asgiref.sync import sync_to_async
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import datetime, timedelta, date
+import asyncio
+import json
 
 from projects.models import Chantiers
-from planning.models import Planning
-from lead.models import Pistes
+from planning.models import Planning, PlanningOccupancy, PlanningTombstone, free_windows, slot_mask
+from planning.utils import bulk_create_plannings
+from planning.distances import nearest_free_employees
+from planning.routes import daily_tours
+from planning.capacity import CAPACITY_MAX_WEEKS, CAPACITY_WEEKS, capacity_heatmap
+from planning.events import get_broker
+from planning.trends import planning_trend, va_trend, with_changes
 from accounts.models import User
-from teams.models import Equipe
+from .dashboard import dashboard_stats
+from .utils import conditional_json, queryset_version
+
+
+# How far before the client's cursor a sync re-reads changes (see sync_planning_slots)
+PLANNING_SYNC_OVERLAP = timedelta(seconds=5)
+
+# Seconds between keep-alive comments on an idle planning event stream
+PLANNING_EVENTS_KEEPALIVE = 15
+
+# Seconds before a planning event stream is closed; EventSource then reconnects.
+# Django 4.2 does not notice a client disconnect while streaming, so this bounds
+# how long the subscription of a closed tab can linger.
+PLANNING_EVENTS_MAX_AGE = 300
 
 
 @login_required
 def dashboard(request):
     """Dashboard view with statistics"""
-    # Chantiers stats
-    total_chantiers = Chantiers.objects.count()
-    active_chantiers = Chantiers.objects.filter(avancement_chantier__lt=100).count()
-    total_revenue = Chantiers.objects.aggregate(Sum('devis_ht'))['devis_ht__sum'] or 0
-    
-    # Planning stats
-    today = date.today()
-    week_start = today - timedelta(days=today.weekday())
-    week_end = week_start + timedelta(days=6)
-    week_planning = Planning.objects.filter(date__gte=week_start, date__lte=week_end)
-    
-    # Calculate week_hours
-    week_hours = 0
-    for p in week_planning:
-        start = datetime.combine(p.date, p.start_hour)
-        end = datetime.combine(p.date, p.end_hour)
-        if end < start:
-            end += timedelta(days=1)
-        delta = end - start
-        week_hours += delta.total_seconds() / 3600.0
-    
-    week_cost = week_planning.aggregate(Sum('cout_planning'))['cout_planning__sum'] or 0
-    
-    # Leads stats
-    total_leads = Pistes.objects.count()
-    qualified_leads = Pistes.objects.filter(statut__in=['Qualifié', 'Devis']).count()
-    won_leads = Pistes.objects.filter(statut='Gagné').count()
-    total_estimated = Pistes.objects.aggregate(Sum('montant_estime'))['montant_estime__sum'] or 0
-    
-    # Team stats
-    total_employees = User.objects.exclude(user_type__in=['Admin', 'Secrétaire']).count()
-    active_teams = Equipe.objects.count()
-    
-    context = {
-        'chantiers': {
-            'total': total_chantiers,
-            'active': active_chantiers,
-            'total_revenue': float(total_revenue)
-        },
-        'planning': {
-            'week_hours': round(week_hours, 2),
-            'week_cost': float(week_cost)
-        },
-        'leads': {
-            'total': total_leads,
-            'qualified': qualified_leads,
-            'won': won_leads,
-            'total_estimated': float(total_estimated)
-        },
-        'team': {
-            'total_employees': total_employees,
-            'active_teams': active_teams
-        }
-    }
+    context = dashboard_stats()
     
     return render(request, 'dashboard.html', context)
 
 
+# Default window of dashboard_trends per period
+TREND_DEFAULT_SPANS = {
+    'day': timedelta(days=30),
+    'week': timedelta(weeks=12),
+    'month': timedelta(days=365),
+}
+
+
+@login_required
+@require_http_methods(["GET"])
+def dashboard_trends(request):
+    """Get hours, cost and VA trends per period from the daily rollups"""
+    try:
+        period = request.GET.get('period', 'week')
+        group_by = request.GET.get('group_by') or None
+        if period not in TREND_DEFAULT_SPANS:
+            return JsonResponse({'error': 'period doit être day, week ou month'}, status=400)
+        
+        date_to_str = request.GET.get('date_to')
+        date_from_str = request.GET.get('date_from')
+        date_to = datetime.strptime(date_to_str, '%Y-%m-%d').date() if date_to_str else date.today()
+        date_from = (
+            datetime.strptime(date_from_str, '%Y-%m-%d').date() if date_from_str
+            else date_to - TREND_DEFAULT_SPANS[period]
+        )
+        
+        series = with_changes(planning_trend(period, group_by, date_from, date_to), period)
+        va = va_trend(period, group_by, date_from, date_to) if group_by in (None, 'chantier', 'chef') else None
+        
+        return JsonResponse({
+            'success': True,
+            'period': period,
+            'group_by': group_by,
+            'date_from': date_from,
+            'date_to': date_to,
+            'series': series,
+            'va': va,
+        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
 @login_required
 def planning(request):
     """Planning page with users and chantiers for form"""
@@ -87,8 +101,40 @@ def planning(request):
     return render(request, 'planning.html', context)
 
 
+def _serialize_slot(slot):
+    """Serialize a Planning (with user and chantier selected) for the planning grid"""
+    return {
+        'id': slot.id,
+        'user_id': slot.user.id,
+        'user_name': slot.user.full_name,
+        'chantier_id': slot.chantier.id,
+        'chantier_name': slot.chantier.name_chantier,
+        'date': slot.date.strftime('%Y-%m-%d'),
+        'start_hour': slot.start_hour.strftime('%H:%M'),
+        'end_hour': slot.end_hour.strftime('%H:%M'),
+        'hours': round(slot.duration_minutes / 60.0, 2),
+        'cost': float(slot.cout_planning) if slot.cout_planning else 0,
+    }
+
+
+def _planning_list_version(request):
+    """Slots of the requested range plus the users and chantiers listed in the grid"""
+    try:
+        date_from = datetime.strptime(request.GET['date_from'], '%Y-%m-%d').date()
+        date_to = datetime.strptime(request.GET['date_to'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        return None
+    
+    return (
+        queryset_version(Planning.objects.filter(date__gte=date_from, date__lte=date_to))
+        + queryset_version(User.objects.all())
+        + queryset_version(Chantiers.objects.all())
+    )
+
+
 @login_required
 @require_http_methods(["GET"])
+@conditional_json(_planning_list_version)
 def list_planning_slots(request):
     """Get planning slots for a date range"""
     try:
@@ -102,6 +148,9 @@ def list_planning_slots(request):
         date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
         date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date()
         
+        # Sync cursor taken before reading so concurrent writes are picked up by the next sync
+        cursor = timezone.now()
+        
         # Get planning slots in date range
         slots = Planning.objects.filter(
             date__gte=date_from_obj,
@@ -113,27 +162,7 @@ def list_planning_slots(request):
         chantiers = Chantiers.objects.all().order_by('name_chantier')
         
         # Build slots data
-        slots_data = []
-        for slot in slots:
-            start = datetime.combine(slot.date, slot.start_hour)
-            end = datetime.combine(slot.date, slot.end_hour)
-            if end < start:
-                end += timedelta(days=1)
-            delta = end - start
-            hours = delta.total_seconds() / 3600.0
-            
-            slots_data.append({
-                'id': slot.id,
-                'user_id': slot.user.id,
-                'user_name': slot.user.full_name,
-                'chantier_id': slot.chantier.id,
-                'chantier_name': slot.chantier.name_chantier,
-                'date': slot.date.strftime('%Y-%m-%d'),
-                'start_hour': slot.start_hour.strftime('%H:%M'),
-                'end_hour': slot.end_hour.strftime('%H:%M'),
-                'hours': round(hours, 2),
-                'cost': float(slot.cout_planning) if slot.cout_planning else 0,
-            })
+        slots_data = [_serialize_slot(slot) for slot in slots]
         
         # Build users data
         users_data = []
@@ -157,6 +186,7 @@ def list_planning_slots(request):
         
         return JsonResponse({
             'success': True,
+            'cursor': cursor.isoformat(),
             'slots': slots_data,
             'users': users_data,
             'chantiers': chantiers_data,
@@ -165,6 +195,299 @@ def list_planning_slots(request):
         return JsonResponse({'error': str(e)}, status=400)
 
 
+@login_required
+@require_http_methods(["GET"])
+def sync_planning_slots(request):
+    """
+    Get planning changes in a date range since a cursor returned by a previous call
+    (or by list_planning_slots), so the grid can patch itself instead of reloading.
+    
+    Clients upsert "created" and "updated" slots by id and drop the ids listed in
+    "deleted" (tombstones) and "moved_out" (slots edited to a date outside the range).
+    """
+    try:
+        since = request.GET.get('since')
+        date_from = request.GET.get('date_from')
+        date_to = request.GET.get('date_to')
+        
+        if not since or not date_from or not date_to:
+            return JsonResponse({'error': 'since, date_from et date_to sont requis'}, status=400)
+        
+        since_obj = parse_datetime(since)
+        if since_obj is None:
+            return JsonResponse({'error': 'Curseur invalide'}, status=400)
+        date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
+        date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date()
+        
+        cursor = timezone.now()
+        if since_obj < cursor - PlanningTombstone.RETENTION:
+            # Deletions that old may have been pruned: ask for a full reload
+            return JsonResponse({'success': True, 'full_reload': True, 'cursor': cursor.isoformat()})
+        
+        # Re-read a short overlap before the cursor: rows committed late with an older
+        # updated_at are not missed, and re-sent rows are harmless upserts
+        changed_since = since_obj - PLANNING_SYNC_OVERLAP
+        
+        changed = Planning.objects.filter(updated_at__gte=changed_since)
+        changed_in_range = changed.filter(
+            date__gte=date_from_obj,
+            date__lte=date_to_obj
+        ).select_related('user', 'chantier').order_by('date', 'start_hour')
+        
+        created_data = []
+        updated_data = []
+        for slot in changed_in_range:
+            if slot.created_at >= changed_since:
+                created_data.append(_serialize_slot(slot))
+            else:
+                updated_data.append(_serialize_slot(slot))
+        
+        # Slots edited to a date outside the range: only their ids, for the client to drop
+        moved_out_ids = list(
+            changed.exclude(date__gte=date_from_obj, date__lte=date_to_obj)
+            .filter(created_at__lt=changed_since)
+            .values_list('id', flat=True)
+        )
+        
+        deleted_ids = list(
+            PlanningTombstone.objects.filter(
+                deleted_at__gte=changed_since,
+                date__gte=date_from_obj,
+                date__lte=date_to_obj
+            ).values_list('planning_id', flat=True)
+        )
+        
+        return JsonResponse({
+            'success': True,
+            'full_reload': False,
+            'cursor': cursor.isoformat(),
+            'created': created_data,
+            'updated': updated_data,
+            'deleted': deleted_ids,
+            'moved_out': moved_out_ids,
+        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+async def planning_events(request):
+    """
+    Server-Sent Events stream of planning changes (slot created/updated/deleted)
+    for an optional date_from..date_to window.
+    
+    Async view: it needs the ASGI application (MyBTP.asgi) so an open stream does
+    not hold a worker thread. Streams end after PLANNING_EVENTS_MAX_AGE and the
+    client reconnects, catching up through a delta sync. Django's login_required/require_http_methods are
+    sync-only in this version, hence the inline checks.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': "Le flux d'événements nécessite le serveur ASGI"}, status=501)
+    
+    is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not is_authenticated:
+        return JsonResponse({'error': 'Authentification requise'}, status=401)
+    
+    try:
+        date_from = request.GET.get('date_from')
+        date_to = request.GET.get('date_to')
+        date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    broker = get_broker()
+    subscription = broker.subscribe(date_from_obj, date_to_obj)
+    
+    async def event_stream():
+        loop = asyncio.get_running_loop()
+        closes_at = loop.time() + PLANNING_EVENTS_MAX_AGE
+        try:
+            # Tell EventSource how long to wait before reconnecting
+            yield 'retry: 5000\n\n'
+            while loop.time() < closes_at:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(),
+                        timeout=min(PLANNING_EVENTS_KEEPALIVE, closes_at - loop.time()),
+                    )
+                except asyncio.TimeoutError:
+                    # Comment line keeping proxies from closing an idle stream
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+    
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@require_http_methods(["GET"])
+def planning_availability(request):
+    """Get free time windows of employees for a date, optionally filtered on a time window"""
+    try:
+        date_str = request.GET.get('date')
+        start_hour = request.GET.get('start_hour')
+        end_hour = request.GET.get('end_hour')
+        
+        if not date_str:
+            return JsonResponse({'error': 'date est requis'}, status=400)
+        
+        day = datetime.strptime(date_str, '%Y-%m-%d').date()
+        users = User.objects.exclude(user_type__in=['Admin', 'Secrétaire']).order_by('nom', 'prenom')
+        user_ids = [user.id for user in users]
+        
+        # One read of the occupancy bitmaps for every employee of the day
+        masks = PlanningOccupancy.get_masks(user_ids, day, day)
+        wanted = 0
+        if start_hour and end_hour:
+            wanted = slot_mask(
+                datetime.strptime(start_hour, '%H:%M').time(),
+                datetime.strptime(end_hour, '%H:%M').time()
+            )
+        
+        employees_data = []
+        for user in users:
+            mask = masks.get((user.id, day), 0)
+            if mask & wanted:
+                continue
+            employees_data.append({
+                'id': user.id,
+                'full_name': user.full_name,
+                'free_windows': [
+                    [f'{start // 60:02d}:{start % 60:02d}', f'{end // 60:02d}:{end % 60:02d}']
+                    for start, end in free_windows(mask)
+                ],
+            })
+        
+        return JsonResponse({
+            'success': True,
+            'date': date_str,
+            'employees': employees_data,
+        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+@login_required
+@require_http_methods(["GET"])
+def planning_nearest_employees(request):
+    """Get the employees free on a time window, nearest to a chantier first"""
+    try:
+        chantier_id = request.GET.get('chantier_id')
+        date_str = request.GET.get('date')
+        start_hour = request.GET.get('start_hour')
+        end_hour = request.GET.get('end_hour')
+        
+        if not all([chantier_id, date_str, start_hour, end_hour]):
+            return JsonResponse({'error': 'chantier_id, date, start_hour et end_hour sont requis'}, status=400)
+        
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+        max_km = request.GET.get('max_km')
+        
+        nearest = nearest_free_employees(
+            int(chantier_id),
+            datetime.strptime(date_str, '%Y-%m-%d').date(),
+            datetime.strptime(start_hour, '%H:%M').time(),
+            datetime.strptime(end_hour, '%H:%M').time(),
+            limit=limit,
+            max_km=float(max_km) if max_km else None,
+        )
+        users = User.objects.in_bulk([employee_id for employee_id, _ in nearest])
+        
+        return JsonResponse({
+            'success': True,
+            'employees': [
+                {
+                    'id': employee_id,
+                    'full_name': users[employee_id].full_name,
+                    'distance_km': round(km, 1),
+                }
+                for employee_id, km in nearest if employee_id in users
+            ],
+        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+def _tour_stop_data(site):
+    chantier = site['chantier']
+    return {
+        'chantier_id': chantier.id,
+        'name': chantier.name_chantier or 'Sans nom',
+        'adresse': chantier.adresse_chantier or '',
+        'cp_ville': chantier.cp_ville_chantier or '',
+        'latitude': site['coordinates'][0] if site['coordinates'] else None,
+        'longitude': site['coordinates'][1] if site['coordinates'] else None,
+        'first_start': site['first_start'].strftime('%H:%M'),
+        'crew': [
+            {'id': user.id, 'full_name': user.full_name}
+            for user in site['employees'].values()
+        ],
+    }
+
+
+@login_required
+@require_http_methods(["GET"])
+def planning_tours(request):
+    """Get the optimized van tours of the licensed drivers for a date"""
+    try:
+        date_str = request.GET.get('date')
+        if not date_str:
+            return JsonResponse({'error': 'date est requis'}, status=400)
+        
+        tours = daily_tours(datetime.strptime(date_str, '%Y-%m-%d').date())
+        
+        return JsonResponse({
+            'success': True,
+            'date': date_str,
+            'tours': [
+                {
+                    'driver': {'id': tour['driver'].id, 'full_name': tour['driver'].full_name},
+                    'home': list(tour['home']) if tour['home'] else None,
+                    'distance_km': tour['distance_km'],
+                    'stops': [_tour_stop_data(site) for site in tour['stops']],
+                }
+                for tour in tours['tours']
+            ],
+            'unserved': [_tour_stop_data(site) for site in tours['unserved']],
+        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+def _capacity_version(request):
+    """Chantiers (hours, windows), slots and employees the heatmap is computed from, for today"""
+    return (
+        (date.today(), request.GET.get('weeks'))
+        + queryset_version(Chantiers.objects.all())
+        + queryset_version(Planning.objects.filter(date__gte=date.today()))
+        + queryset_version(User.objects.all())
+    )
+
+
+@login_required
+@require_http_methods(["GET"])
+@conditional_json(_capacity_version)
+def planning_capacity(request):
+    """Get the weekly capacity vs remaining demand heatmap (?weeks=12)"""
+    try:
+        weeks = min(max(int(request.GET.get('weeks', CAPACITY_WEEKS)), 1), CAPACITY_MAX_WEEKS)
+    except ValueError:
+        return JsonResponse({'error': 'weeks doit être un entier'}, status=400)
+    
+    heatmap = capacity_heatmap(weeks)
+    for week in heatmap['weeks']:
+        week['week_start'] = week['week_start'].strftime('%Y-%m-%d')
+    
+    return JsonResponse({'success': True, **heatmap})
+
+
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -196,6 +519,48 @@ def create_planning_slot(request):
         return JsonResponse({'error': str(e)}, status=400)
 
 
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def bulk_create_planning_slots(request):
+    """Create planning slots for several employees over a range of days"""
+    try:
+        user_ids = request.POST.getlist('users')
+        chantier_id = request.POST.get('chantier')
+        date_from = request.POST.get('date_from')
+        date_to = request.POST.get('date_to')
+        start_hour = request.POST.get('start_hour')
+        end_hour = request.POST.get('end_hour')
+        # Weekday mask: 0 = lundi ... 6 = dimanche, defaults to lundi-vendredi
+        weekdays = [int(d) for d in request.POST.getlist('weekdays')] or [0, 1, 2, 3, 4]
+        
+        if not all([user_ids, chantier_id, date_from, date_to, start_hour, end_hour]):
+            return JsonResponse({'error': 'Tous les champs sont requis'}, status=400)
+        
+        users = User.objects.filter(id__in=user_ids)
+        chantier = Chantiers.objects.get(id=chantier_id)
+        
+        result = bulk_create_plannings(
+            chantier=chantier,
+            users=users,
+            date_from=datetime.strptime(date_from, '%Y-%m-%d').date(),
+            date_to=datetime.strptime(date_to, '%Y-%m-%d').date(),
+            weekdays=weekdays,
+            start_hour=datetime.strptime(start_hour, '%H:%M').time(),
+            end_hour=datetime.strptime(end_hour, '%H:%M').time(),
+        )
+        
+        return JsonResponse({
+            'success': True,
+            'created': [planning.id for planning in result['created']],
+            'conflicts': result['conflicts'],
+        })
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
 @login_required
 def chantiers(request):
     from projects.forms import ChantierForm
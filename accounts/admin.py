@@ -1,10 +1,18 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User
+from .models import User, HourlyRate
+
+
+class HourlyRateInline(admin.TabularInline):
+    model = HourlyRate
+    extra = 0
+    fields = ['effective_from', 'rate', 'created_at']
+    readonly_fields = ['created_at']
 
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
+    inlines = [HourlyRateInline]
     list_display = ['email', 'prenom', 'nom', 'user_type', 'equipe', 'is_active', 'is_staff']
     list_filter = ['user_type', 'is_active', 'is_staff', 'equipe']
     search_fields = ['email', 'prenom', 'nom']
@@ -14,6 +22,7 @@ class UserAdmin(BaseUserAdmin):
         (None, {'fields': ('email', 'password')}),
         ('Personal info', {'fields': ('prenom', 'nom', 'numero_telephone', 'user_type')}),
         ('Work info', {'fields': ('cout_h', 'cout_j', 'competences', 'permis_de_conduire', 'equipe')}),
+        ('Home base', {'fields': ('home_latitude', 'home_longitude')}),
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
         ('Important dates', {'fields': ('last_login', 'date_joined')}),
     )
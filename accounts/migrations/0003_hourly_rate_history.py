@@ -0,0 +1,54 @@
+# Generated by Django 4.2.26 on 2026-10-17 13:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_baseline_rates(apps, schema_editor):
+    """Record each user's current cout_h as the rate in force since their first slot"""
+    User = apps.get_model('accounts', 'User')
+    Planning = apps.get_model('planning', 'Planning')
+    HourlyRate = apps.get_model('accounts', 'HourlyRate')
+    first_days = dict(
+        Planning.objects.values('user_id')
+        .annotate(first_day=models.Min('date'))
+        .values_list('user_id', 'first_day')
+    )
+    HourlyRate.objects.bulk_create([
+        HourlyRate(
+            user_id=user.id,
+            rate=user.cout_h,
+            effective_from=min(filter(None, [first_days.get(user.id), user.date_joined.date()])),
+        )
+        for user in User.objects.filter(cout_h__isnull=False).only('id', 'cout_h', 'date_joined')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_initial'),
+        ('planning', '0003_planning_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rate', models.DecimalField(decimal_places=2, help_text='Coût horaire en euros', max_digits=8)),
+                ('effective_from', models.DateField(help_text="Date d'application du taux")),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_rates', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Taux horaire',
+                'verbose_name_plural': 'Taux horaires',
+                'db_table': 'user_hourly_rates',
+                'ordering': ['user', '-effective_from'],
+                'unique_together': {('user', 'effective_from')},
+            },
+        ),
+        migrations.RunPython(backfill_baseline_rates, migrations.RunPython.noop),
+    ]
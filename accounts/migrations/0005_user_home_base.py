@@ -0,0 +1,23 @@
+# Generated by Django 4.2.26 on 2026-10-17 13:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_user_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='home_latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, help_text='Latitude du point de départ (domicile ou dépôt)', max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='home_longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, help_text='Longitude du point de départ (domicile ou dépôt)', max_digits=9, null=True),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, Permis
 from django.db import models
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
+from collections import defaultdict
 
 
 class UserManager(BaseUserManager):
@@ -84,10 +85,25 @@ class User(AbstractBaseUser, PermissionsMixin):
         blank=True,
         related_name='members_set'
     )
+    home_latitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        help_text="Latitude du point de départ (domicile ou dépôt)"
+    )
+    home_longitude = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        help_text="Longitude du point de départ (domicile ou dépôt)"
+    )
     
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     date_joined = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     objects = UserManager()
     
@@ -109,3 +125,89 @@ class User(AbstractBaseUser, PermissionsMixin):
     
     def __str__(self):
         return f"{self.prenom} {self.nom}"
+
+
+class HourlyRate(models.Model):
+    """
+    Effective-dated hourly cost of a user.
+    
+    A rate applies from effective_from until the next entry of the same user.
+    Slots dated before the first entry (or users without history) fall back
+    to User.cout_h.
+    """
+    
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='hourly_rates'
+    )
+    rate = models.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        help_text="Coût horaire en euros"
+    )
+    effective_from = models.DateField(help_text="Date d'application du taux")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'user_hourly_rates'
+        verbose_name = 'Taux horaire'
+        verbose_name_plural = 'Taux horaires'
+        ordering = ['user', '-effective_from']
+        # Also serves as the (user, effective_from) index used by rate lookups
+        unique_together = [['user', 'effective_from']]
+    
+    @classmethod
+    def rate_for(cls, user, day):
+        """Return the hourly rate applicable to user on day"""
+        rate = (
+            cls.objects.filter(user=user, effective_from__lte=day)
+            .order_by('-effective_from')
+            .values_list('rate', flat=True)
+            .first()
+        )
+        return rate if rate is not None else user.cout_h
+    
+    @classmethod
+    def resolver(cls, users):
+        """Return a rate(user, day) function backed by a single query for all users"""
+        history = defaultdict(list)
+        for user_id, effective_from, rate in (
+            cls.objects.filter(user__in=users)
+            .order_by('effective_from')
+            .values_list('user_id', 'effective_from', 'rate')
+        ):
+            history[user_id].append((effective_from, rate))
+        
+        def resolve(user, day):
+            rate = user.cout_h
+            for effective_from, period_rate in history.get(user.id, ()):
+                if effective_from > day:
+                    break
+                rate = period_rate
+            return rate
+        
+        return resolve
+    
+    @classmethod
+    def periods(cls, user):
+        """
+        Return the user's rate periods as (start, end, rate) tuples.
+        
+        start is None for the fallback period before the first entry and end is
+        None for the open-ended current period; end is exclusive.
+        """
+        entries = list(
+            cls.objects.filter(user=user)
+            .order_by('effective_from')
+            .values_list('effective_from', 'rate')
+        )
+        boundaries = [None] + [effective_from for effective_from, _ in entries] + [None]
+        rates = [user.cout_h] + [rate for _, rate in entries]
+        return [
+            (boundaries[i], boundaries[i + 1], rates[i])
+            for i in range(len(rates))
+        ]
+    
+    def __str__(self):
+        return f"{self.user} - {self.rate} € / h depuis le {self.effective_from}"
@@ -5,6 +5,8 @@ from django.contrib.auth.forms import AuthenticationForm
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
+from teams.models import Equipe
+from MyBTP.utils import conditional_json, queryset_version
 from .models import User
 from .forms import EmployeeForm
 
@@ -38,9 +40,15 @@ def logout_view(request):
     return redirect('accounts:login')
 
 
+def _employees_list_version(request):
+    """Users plus teams, whose names appear as equipe"""
+    return queryset_version(User.objects.all()) + queryset_version(Equipe.objects.all())
+
+
 @login_required
 @require_http_methods(["GET"])
 @ensure_csrf_cookie
+@conditional_json(_employees_list_version)
 def list_employees(request):
     """Get list of employees via AJAX"""
     employees_list = User.objects.exclude(user_type__in=['Admin', 'Secrétaire']).order_by('nom', 'prenom')
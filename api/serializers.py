@@ -5,7 +5,7 @@ from rest_framework import serializers
 from projects.models import Chantiers
 from teams.models import Equipe
 from accounts.models import User
-from planning.models import Planning
+from planning.models import Planning, PlanningOccupancy
 
 
 class ProjectSerializer(serializers.ModelSerializer):
@@ -133,6 +133,21 @@ class EmployeeSerializer(serializers.ModelSerializer):
         return value
 
 
+class ProjectEmployeeRollupSerializer(serializers.Serializer):
+    """Serializer for an employee's totals on a project (see chantier_employee_rollup)"""
+    
+    id = serializers.IntegerField()
+    prenom = serializers.CharField()
+    nom = serializers.CharField()
+    full_name = serializers.CharField()
+    user_type = serializers.CharField()
+    hours = serializers.FloatField()
+    cost = serializers.FloatField()
+    slots = serializers.IntegerField()
+    first_day = serializers.DateField()
+    last_day = serializers.DateField()
+
+
 class PlanningSerializer(serializers.ModelSerializer):
     """Serializer for Planning (time slots)"""
     
@@ -150,12 +165,14 @@ class PlanningSerializer(serializers.ModelSerializer):
             'date',
             'start_hour',
             'end_hour',
+            'duration_minutes',
             'cout_planning',
             'created_at',
             'updated_at',
         ]
         read_only_fields = [
             'id',
+            'duration_minutes',  # Auto-computed
             'cout_planning',  # Auto-computed
             'created_at',
             'updated_at',
@@ -202,23 +219,29 @@ class PlanningSerializer(serializers.ModelSerializer):
             # Use the instance's pk if updating, None if creating
             instance_pk = self.instance.pk if self.instance else None
             
-            overlapping = Planning.objects.filter(
-                user=user,
-                date=date
-            )
-            
-            if instance_pk:
-                overlapping = overlapping.exclude(pk=instance_pk)
-            
-            overlapping = overlapping.filter(
-                start_hour__lt=end_hour,
-                end_hour__gt=start_hour
-            )
-            
-            if overlapping.exists():
+            if not PlanningOccupancy.is_free(user.pk, date, start_hour, end_hour, exclude_pk=instance_pk):
                 raise serializers.ValidationError({
                     '__all__': "Conflit de planning détecté pour cet employé à cette date et heure"
                 })
         
         return data
 
+
+class PlanningBulkCreateSerializer(serializers.Serializer):
+    """
+    Serializer for bulk planning creation over a range of days x employees.
+    
+    Only field types are checked here: hours, date range and batch size are
+    validated by planning.utils.bulk_create_plannings().
+    """
+    
+    chantier = serializers.PrimaryKeyRelatedField(queryset=Chantiers.objects.all())
+    users = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), many=True)
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    weekdays = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6),
+        default=[0, 1, 2, 3, 4],  # lundi-vendredi
+    )
+    start_hour = serializers.TimeField()
+    end_hour = serializers.TimeField()
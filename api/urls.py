@@ -10,6 +10,7 @@ from .views import (
     EmployeeViewSet,
     PlanningViewSet,
     PlanningCreateView,
+    PlanningBulkCreateView,
     TeamEmployeesView,
 )
 
@@ -23,6 +24,9 @@ router.register(r'planning', PlanningViewSet, basename='planning')
 app_name = 'api'
 
 urlpatterns = [
+    # POST /api/planning/bulk/ (before the router so "bulk" is not taken as a planning id)
+    path('planning/bulk/', PlanningBulkCreateView.as_view(), name='planning-bulk-create'),
+    
     # Router URLs for standard CRUD endpoints
     path('', include(router.urls)),
     
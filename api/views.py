@@ -7,17 +7,22 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
 from django.http import Http404
+from django.core.exceptions import ValidationError as DjangoValidationError
 
 from projects.models import Chantiers
 from teams.models import Equipe
 from accounts.models import User
 from planning.models import Planning
+from planning.utils import bulk_create_plannings
+from projects.utils import chantier_employee_rollup
 
 from .serializers import (
     ProjectSerializer,
     TeamSerializer,
     EmployeeSerializer,
+    ProjectEmployeeRollupSerializer,
     PlanningSerializer,
+    PlanningBulkCreateSerializer,
 )
 from .permissions import IsPublicOrAPIKey, IsAPIKeyAuthenticated
 
@@ -30,6 +35,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
     - GET /api/projects/ -> list all projects (PUBLIC)
     - GET /api/projects/{id}/ -> get one project (AUTH required)
     - POST /api/projects/ -> create a project (AUTH required)
+    - GET /api/projects/{id}/employees/ -> assigned employees with their totals (AUTH required)
     """
     queryset = Chantiers.objects.all()
     serializer_class = ProjectSerializer
@@ -58,6 +64,13 @@ class ProjectViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         """Create a project - AUTH required"""
         return super().create(request, *args, **kwargs)
+    
+    @action(detail=True, methods=['get'])
+    def employees(self, request, pk=None):
+        """Assigned employees with hours, cost, first and last day on the project - AUTH required"""
+        project = self.get_object()
+        serializer = ProjectEmployeeRollupSerializer(chantier_employee_rollup(project.id), many=True)
+        return Response(serializer.data)
 
 
 class TeamViewSet(viewsets.ModelViewSet):
@@ -184,3 +197,32 @@ class PlanningCreateView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
+class PlanningBulkCreateView(APIView):
+    """
+    Custom view for POST /api/planning/bulk/
+    Create planning entries for a range of days x employees (AUTH required)
+    
+    Conflicting (employee, day) pairs are reported in "conflicts" and skipped,
+    the rest of the batch is still created.
+    """
+    authentication_classes = []
+    permission_classes = [IsAPIKeyAuthenticated]
+    
+    def post(self, request):
+        """Create planning entries in bulk"""
+        serializer = PlanningBulkCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            result = bulk_create_plannings(**serializer.validated_data)
+        except DjangoValidationError as e:
+            # Same shape as serializer errors: field -> messages
+            errors = e.message_dict if hasattr(e, 'error_dict') else {'non_field_errors': e.messages}
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'created': PlanningSerializer(result['created'], many=True).data,
+            'conflicts': result['conflicts'],
+        }, status=status.HTTP_201_CREATED)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Planning
+from .models import Planning, PlanningDailyRollup, PlanningOccupancy
 
 
 @admin.register(Planning)
@@ -7,5 +7,22 @@ class PlanningAdmin(admin.ModelAdmin):
     list_display = ['user', 'chantier', 'date', 'start_hour', 'end_hour', 'cout_planning']
     list_filter = ['date', 'chantier', 'user']
     search_fields = ['user__email', 'chantier__name_chantier']
-    readonly_fields = ['cout_planning', 'created_at', 'updated_at']
+    readonly_fields = ['duration_minutes', 'cout_planning', 'created_at', 'updated_at']
+    date_hierarchy = 'date'
+
+
+@admin.register(PlanningOccupancy)
+class PlanningOccupancyAdmin(admin.ModelAdmin):
+    list_display = ['user', 'date']
+    list_filter = ['date']
+    search_fields = ['user__email']
+    readonly_fields = ['user', 'date', 'bitmap']
+
+
+@admin.register(PlanningDailyRollup)
+class PlanningDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'chantier', 'user', 'minutes', 'cost', 'slots']
+    list_filter = ['date']
+    search_fields = ['user__email', 'chantier__name_chantier']
+    readonly_fields = ['date', 'chantier', 'user', 'minutes', 'cost', 'slots']
     date_hierarchy = 'date'
@@ -0,0 +1,141 @@
+"""
+Workforce capacity against remaining chantier demand, week by week.
+
+capacity_heatmap() works on a day grid from the Monday of the current week:
+- capacity is CAPACITY_HOURS_PER_DAY per dispatchable employee and open day
+  (business days from today on);
+- booked hours are the slots already planned, read from the daily rollups;
+- demand is what is left to plan on each active chantier (number_hour_planned
+  minus every hour already planned on it), spread evenly over the open days of
+  its date_debut_chantier..date_fin_prevue_chantier window. Overdue chantiers
+  are due on the next open day; chantiers without an end date are reported
+  apart, as unscheduled.
+
+The chantier x day demand matrix is built with NumPy broadcasting and summed
+per week with a reshape, so a few months of horizon answer interactively.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from django.db.models import Sum
+
+from projects.models import Chantiers
+from .distances import employee_queryset
+from .models import PlanningDailyRollup
+
+
+CAPACITY_HOURS_PER_DAY = 8
+CAPACITY_WEEKS = 12
+CAPACITY_MAX_WEEKS = 52
+
+# Load (booked + demand over capacity) below this share marks an under-booked week
+CAPACITY_UNDER_PERCENT = 70
+
+
+def _week_status(load_percent):
+    if load_percent is None:
+        return 'unknown'
+    if load_percent > 100:
+        return 'over'
+    if load_percent < CAPACITY_UNDER_PERCENT:
+        return 'under'
+    return 'ok'
+
+
+def _weekly(values, weeks):
+    """Sum the last (day) axis of values into weeks"""
+    return values.reshape(*values.shape[:-1], weeks, 7).sum(axis=-1)
+
+
+def capacity_heatmap(weeks=CAPACITY_WEEKS, today=None):
+    """
+    Capacity, booked hours and remaining demand for the next weeks.
+
+    Returns {'weeks': [...], 'chantiers': [...], 'unscheduled': [...]}: one
+    row per week with its balance and load, the weekly demand of every
+    scheduled chantier, and the chantiers whose demand has no end date.
+    """
+    today = today or date.today()
+    first_day = today - timedelta(days=today.weekday())
+    days = np.arange(np.datetime64(first_day), np.datetime64(first_day + timedelta(weeks=weeks)))
+    open_days = np.is_busday(days) & (days >= np.datetime64(today))
+
+    employees = employee_queryset()
+    capacity = open_days * (employees.count() * CAPACITY_HOURS_PER_DAY)
+
+    booked = np.zeros(len(days))
+    for day, minutes in (
+        PlanningDailyRollup.objects
+        .filter(user__in=employees, date__gte=today, date__lt=first_day + timedelta(weeks=weeks))
+        .order_by()
+        .values('date')
+        .annotate(total=Sum('minutes'))
+        .values_list('date', 'total')
+    ):
+        booked[(day - first_day).days] = (minutes or 0) / 60.0
+
+    rows = [
+        (chantier_id, name, float(planned or 0) - float(spent or 0), start, end)
+        for chantier_id, name, planned, spent, start, end in Chantiers.objects.filter(
+            avancement_chantier__lt=100
+        ).values_list(
+            'id', 'name_chantier', 'number_hour_planned', 'number_hour_spent_on_project',
+            'date_debut_chantier', 'date_fin_prevue_chantier',
+        )
+    ]
+    rows = [row for row in rows if row[2] > 0]
+    scheduled = [row for row in rows if row[4] is not None]
+    unscheduled = [row for row in rows if row[4] is None]
+
+    demand = np.zeros((len(scheduled), len(days)))
+    if scheduled:
+        remaining = np.array([row[2] for row in scheduled])
+        today64 = np.datetime64(today)
+        starts = np.array([np.datetime64(row[3] or today) for row in scheduled])
+        starts = np.busday_offset(np.maximum(starts, today64), 0, roll='forward')
+        ends = np.busday_offset(np.maximum(np.array([np.datetime64(row[4]) for row in scheduled]), starts), 0, roll='backward')
+        ends = np.maximum(ends, starts)
+        # Hours per open day over the whole window, including days past the horizon
+        rate = remaining / np.busday_count(starts, ends + 1)
+        in_window = (days[None, :] >= starts[:, None]) & (days[None, :] <= ends[:, None]) & open_days[None, :]
+        demand = in_window * rate[:, None]
+
+    chantier_weeks = _weekly(demand, weeks)
+    week_capacity, week_booked, week_demand = _weekly(capacity, weeks), _weekly(booked, weeks), chantier_weeks.sum(axis=0)
+
+    week_rows = []
+    for w in range(weeks):
+        load = (week_booked[w] + week_demand[w]) / week_capacity[w] * 100 if week_capacity[w] else None
+        week_rows.append({
+            'week_start': first_day + timedelta(weeks=w),
+            'capacity': round(float(week_capacity[w]), 1),
+            'booked': round(float(week_booked[w]), 1),
+            'demand': round(float(week_demand[w]), 1),
+            'free': round(float(week_capacity[w] - week_booked[w]), 1),
+            'balance': round(float(week_capacity[w] - week_booked[w] - week_demand[w]), 1),
+            'load_percent': round(float(load), 1) if load is not None else None,
+            'status': _week_status(load),
+        })
+
+    chantier_rows = sorted(
+        (
+            {
+                'id': chantier_id,
+                'name': name or 'Sans nom',
+                'remaining': round(hours, 1),
+                'weeks': [round(float(value), 1) for value in chantier_weeks[i]],
+            }
+            for i, (chantier_id, name, hours, _, _) in enumerate(scheduled)
+            if chantier_weeks[i].any()
+        ),
+        key=lambda row: -sum(row['weeks']),
+    )
+
+    return {
+        'weeks': week_rows,
+        'chantiers': chantier_rows,
+        'unscheduled': [
+            {'id': chantier_id, 'name': name or 'Sans nom', 'remaining': round(hours, 1)}
+            for chantier_id, name, hours, _, _ in unscheduled
+        ],
+    }
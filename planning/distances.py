@@ -0,0 +1,158 @@
+"""
+Chantier x employee distance matrix.
+
+Distances are great-circle (haversine) kilometres between each chantier and
+each employee home base, computed with NumPy. The matrix lives in the process
+and is kept current incrementally: every access re-reads only the chantiers and
+employees whose updated_at moved since the last sync and recomputes their row
+or column, O(n + m) instead of O(n x m). Deletions force a full rebuild.
+Missing coordinates give NaN distances.
+"""
+import threading
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from accounts.models import User
+from projects.models import Chantiers
+from .models import PlanningOccupancy
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Re-read rows touched slightly before the watermark, for transactions committing late
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def haversine_matrix(lat1, lng1, lat2, lng2):
+    """
+    Distances in km between n points (lat1, lng1) and m points (lat2, lng2), as an n x m array.
+
+    Inputs are 1-d arrays of degrees; NaN coordinates give NaN distances.
+    """
+    lat1, lng1 = np.radians(np.asarray(lat1, dtype=float))[:, None], np.radians(np.asarray(lng1, dtype=float))[:, None]
+    lat2, lng2 = np.radians(np.asarray(lat2, dtype=float))[None, :], np.radians(np.asarray(lng2, dtype=float))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _coordinate(value):
+    return float(value) if value is not None else np.nan
+
+
+def employee_queryset():
+    """Employees that can be dispatched to a chantier"""
+    return User.objects.filter(is_active=True).exclude(user_type__in=['Admin', 'Secrétaire'])
+
+
+class DistanceMatrix:
+    """Incrementally maintained chantier x employee distance matrix (see module docstring)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self.chantier_index = {}
+        self.employee_index = {}
+        self.chantier_coords = np.empty((0, 2))
+        self.employee_coords = np.empty((0, 2))
+        self.distances = np.empty((0, 0))
+
+    def _rebuild(self):
+        chantiers = list(Chantiers.objects.values_list('id', 'latitude', 'longitude'))
+        employees = list(employee_queryset().values_list('id', 'home_latitude', 'home_longitude'))
+        self.chantier_index = {row[0]: i for i, row in enumerate(chantiers)}
+        self.employee_index = {row[0]: j for j, row in enumerate(employees)}
+        self.chantier_coords = np.array([[_coordinate(lat), _coordinate(lng)] for _, lat, lng in chantiers]).reshape(-1, 2)
+        self.employee_coords = np.array([[_coordinate(lat), _coordinate(lng)] for _, lat, lng in employees]).reshape(-1, 2)
+        self.distances = haversine_matrix(
+            self.chantier_coords[:, 0], self.chantier_coords[:, 1],
+            self.employee_coords[:, 0], self.employee_coords[:, 1],
+        )
+
+    def _apply_changes(self, since):
+        """Recompute rows and columns changed since the watermark; False when a rebuild is needed"""
+        changed_chantiers = list(
+            Chantiers.objects.filter(updated_at__gte=since).values_list('id', 'latitude', 'longitude')
+        )
+        changed_employees = list(
+            User.objects.filter(updated_at__gte=since).values_list(
+                'id', 'home_latitude', 'home_longitude', 'is_active', 'user_type'
+            )
+        )
+        if any(
+            (user_id in self.employee_index) != (is_active and user_type not in ('Admin', 'Secrétaire'))
+            for user_id, _, _, is_active, user_type in changed_employees
+        ):
+            # Employee added, deactivated or changed role: columns move, rebuild
+            return False
+        changed_employees = [row for row in changed_employees if row[0] in self.employee_index]
+
+        new_chantiers = [row for row in changed_chantiers if row[0] not in self.chantier_index]
+        if new_chantiers:
+            start = len(self.chantier_index)
+            for offset, (chantier_id, _, _) in enumerate(new_chantiers):
+                self.chantier_index[chantier_id] = start + offset
+            self.chantier_coords = np.vstack([self.chantier_coords, np.full((len(new_chantiers), 2), np.nan)])
+            self.distances = np.vstack([self.distances, np.full((len(new_chantiers), self.distances.shape[1]), np.nan)])
+
+        if changed_chantiers:
+            rows = np.array([self.chantier_index[row[0]] for row in changed_chantiers])
+            self.chantier_coords[rows] = [[_coordinate(lat), _coordinate(lng)] for _, lat, lng in changed_chantiers]
+            self.distances[rows] = haversine_matrix(
+                self.chantier_coords[rows, 0], self.chantier_coords[rows, 1],
+                self.employee_coords[:, 0], self.employee_coords[:, 1],
+            )
+
+        if changed_employees:
+            columns = np.array([self.employee_index[row[0]] for row in changed_employees])
+            self.employee_coords[columns] = [[_coordinate(lat), _coordinate(lng)] for _, lat, lng, _, _ in changed_employees]
+            self.distances[:, columns] = haversine_matrix(
+                self.chantier_coords[:, 0], self.chantier_coords[:, 1],
+                self.employee_coords[columns, 0], self.employee_coords[columns, 1],
+            )
+
+        # Deleted rows are only visible as a count mismatch
+        return (
+            Chantiers.objects.count() == len(self.chantier_index)
+            and employee_queryset().count() == len(self.employee_index)
+        )
+
+    def sync(self):
+        """Bring the matrix up to date with the database"""
+        with self._lock:
+            now = timezone.now()
+            if self._synced_at is None or not self._apply_changes(self._synced_at - SYNC_OVERLAP):
+                self._rebuild()
+            self._synced_at = now
+
+    def chantier_distances(self, chantier_id):
+        """Return {employee_id: km} for a chantier (NaN where a coordinate is missing)"""
+        self.sync()
+        row = self.chantier_index.get(chantier_id)
+        if row is None:
+            return {}
+        distances = self.distances[row]
+        return {employee_id: float(distances[column]) for employee_id, column in self.employee_index.items()}
+
+
+distance_matrix = DistanceMatrix()
+
+
+def nearest_free_employees(chantier_id, day, start_hour, end_hour, limit=10, max_km=None):
+    """
+    Employees free on day between start_hour and end_hour, nearest to the chantier first.
+
+    Employees without a home base, or a chantier without coordinates, give no
+    result. Returns (employee_id, km) pairs.
+    """
+    distances = distance_matrix.chantier_distances(chantier_id)
+    candidates = [
+        (employee_id, km) for employee_id, km in distances.items()
+        if not np.isnan(km) and (max_km is None or km <= max_km)
+    ]
+    free = set(PlanningOccupancy.free_users([employee_id for employee_id, _ in candidates], day, start_hour, end_hour))
+    return sorted(
+        ((employee_id, km) for employee_id, km in candidates if employee_id in free),
+        key=lambda pair: pair[1],
+    )[:limit]
@@ -0,0 +1,121 @@
+"""
+Publish/subscribe of planning change events for the Server-Sent Events stream.
+
+Planning signals publish small slot events once their transaction commits, and
+the planning_events view streams them to connected grids. The default broker
+lives in the current process, so it needs no external service; with several
+server processes each one only sees its own writes, and a shared broker can be
+plugged in through the PLANNING_EVENT_BROKER setting.
+"""
+import asyncio
+import threading
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """One connected stream: an asyncio queue bound to its event loop and date window"""
+    
+    # Events beyond this backlog are dropped for a slow client, which resyncs instead
+    MAX_PENDING = 500
+    
+    def __init__(self, loop, date_from=None, date_to=None):
+        self.loop = loop
+        self.date_from = date_from
+        self.date_to = date_to
+        self.queue = asyncio.Queue(maxsize=self.MAX_PENDING)
+    
+    def wants(self, event):
+        """Return True if one of the event dates falls in the subscription window"""
+        for day in event.get('dates') or []:
+            if (self.date_from is None or day >= self.date_from) and \
+               (self.date_to is None or day <= self.date_to):
+                return True
+        return not event.get('dates')
+    
+    def push(self, event):
+        """Enqueue an event from the loop thread"""
+        if self.queue.full():
+            # Collapse the backlog into a single resync request
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({'type': 'resync', 'dates': []})
+            return
+        self.queue.put_nowait(event)
+
+
+class LocalEventBroker:
+    """Thread-safe in-process broker delivering events to asyncio subscribers"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+    
+    def subscribe(self, date_from=None, date_to=None):
+        """Register a subscription for the running event loop"""
+        subscription = Subscription(asyncio.get_running_loop(), date_from, date_to)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+    
+    def publish(self, event):
+        """Deliver an event to every interested subscriber, from any thread"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        
+        for subscription in subscriptions:
+            if not subscription.wants(event):
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, event)
+            except RuntimeError:
+                # Event loop already closed: the stream is gone
+                self.unsubscribe(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return the configured broker (LocalEventBroker unless PLANNING_EVENT_BROKER is set)"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_path = getattr(settings, 'PLANNING_EVENT_BROKER', 'planning.events.LocalEventBroker')
+                _broker = import_string(broker_path)()
+    return _broker
+
+
+def slot_event_data(planning):
+    """Compact representation of a slot; clients resolve names from their grid data"""
+    return {
+        'id': planning.pk,
+        'user_id': planning.user_id,
+        'chantier_id': planning.chantier_id,
+        'date': planning.date.strftime('%Y-%m-%d'),
+        'start_hour': planning.start_hour.strftime('%H:%M'),
+        'end_hour': planning.end_hour.strftime('%H:%M'),
+        'hours': round(planning.duration_minutes / 60.0, 2),
+        'cost': float(planning.cout_planning) if planning.cout_planning else 0,
+    }
+
+
+def publish_planning_event(event_type, planning=None, dates=()):
+    """
+    Publish a planning event once the current transaction commits.
+    
+    event_type is 'created', 'updated', 'deleted' or 'resync' (many slots changed
+    at once, clients should fetch /planning/sync/). dates lists every day the
+    change touches, used to filter subscribers by date window.
+    """
+    event = {'type': event_type, 'dates': sorted({day for day in dates if day})}
+    if planning is not None:
+        event['slot'] = slot_event_data(planning)
+    transaction.on_commit(lambda: get_broker().publish(event))
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from planning.routes import daily_tours
+
+
+class Command(BaseCommand):
+    """Print the optimized van tours of the licensed drivers for a day (tomorrow by default)"""
+    
+    help = "Calcule les tournées des conducteurs pour une journée de planning (demain par défaut)"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Date au format AAAA-MM-JJ")
+    
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("La date doit être au format AAAA-MM-JJ.")
+        else:
+            day = timezone.localdate() + timedelta(days=1)
+        
+        tours = daily_tours(day)
+        
+        for tour in tours['tours']:
+            self.stdout.write(f"{tour['driver'].full_name} - {tour['distance_km']} km")
+            for position, site in enumerate(tour['stops'], start=1):
+                crew = ', '.join(user.full_name for user in site['employees'].values())
+                self.stdout.write(
+                    f"  {position}. {site['chantier'].name_chantier or 'Sans nom'} "
+                    f"({site['chantier'].cp_ville_chantier or ''}) dès {site['first_start']:%H:%M} - {crew}"
+                )
+        for site in tours['unserved']:
+            self.stdout.write(self.style.WARNING(
+                f"Sans conducteur ou sans coordonnées : {site['chantier'].name_chantier or 'Sans nom'}"
+            ))
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(tours['tours'])} tournée(s) pour le {day:%d/%m/%Y}, "
+            f"{len(tours['unserved'])} chantier(s) non desservi(s)."
+        ))
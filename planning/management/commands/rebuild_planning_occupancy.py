@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from planning.models import Planning, PlanningOccupancy, slot_mask
+
+
+class Command(BaseCommand):
+    """Rebuild every quarter-hour occupancy bitmap from the Planning table"""
+    
+    help = "Reconstruit les bitmaps d'occupation (utilisateur, jour) à partir des plannings"
+    
+    def handle(self, *args, **options):
+        masks = {}
+        for user_id, day, start_hour, end_hour in Planning.objects.values_list(
+            'user_id', 'date', 'start_hour', 'end_hour'
+        ).iterator():
+            masks[(user_id, day)] = masks.get((user_id, day), 0) | slot_mask(start_hour, end_hour)
+        
+        with transaction.atomic():
+            PlanningOccupancy.objects.all().delete()
+            PlanningOccupancy.set_masks(masks)
+        
+        self.stdout.write(self.style.SUCCESS(f"{len(masks)} journée(s) reconstruite(s)."))
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from planning.models import PlanningDailyRollup
+
+
+class Command(BaseCommand):
+    """Rebuild the (date, chantier, user) daily rollups from the Planning table"""
+    
+    help = "Reconstruit les cumuls journaliers (date, chantier, employé) à partir des plannings"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', help="Première date à reconstruire (AAAA-MM-JJ)")
+        parser.add_argument('--date-to', help="Dernière date à reconstruire (AAAA-MM-JJ)")
+    
+    def handle(self, *args, **options):
+        filters = {}
+        try:
+            if options['date_from']:
+                filters['date__gte'] = datetime.strptime(options['date_from'], '%Y-%m-%d').date()
+            if options['date_to']:
+                filters['date__lte'] = datetime.strptime(options['date_to'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError("Les dates doivent être au format AAAA-MM-JJ.")
+        
+        with transaction.atomic():
+            count = PlanningDailyRollup.rebuild(**filters)
+        
+        self.stdout.write(self.style.SUCCESS(f"{count} cumul(s) journalier(s) reconstruit(s)."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from projects.models import Chantiers
+from planning.utils import update_chantier_aggregates
+
+
+class Command(BaseCommand):
+    """Rebuild chantier hours/cost/VA aggregates from their Planning entries"""
+    
+    help = "Recalcule entièrement les heures, coûts et VA des chantiers à partir des plannings"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'chantier_ids',
+            nargs='*',
+            type=int,
+            help="IDs des chantiers à recalculer (tous si omis)"
+        )
+    
+    def handle(self, *args, **options):
+        chantier_ids = options['chantier_ids'] or list(
+            Chantiers.objects.values_list('id', flat=True)
+        )
+        
+        for chantier_id in chantier_ids:
+            update_chantier_aggregates(chantier_id)
+        
+        self.stdout.write(self.style.SUCCESS(f"{len(chantier_ids)} chantier(s) recalculé(s)."))
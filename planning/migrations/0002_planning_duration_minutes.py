@@ -0,0 +1,35 @@
+# Generated by Django 4.2.26 on 2026-10-17 13:03
+
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+
+
+def backfill_duration_minutes(apps, schema_editor):
+    Planning = apps.get_model('planning', 'Planning')
+    plannings = Planning.objects.only('id', 'date', 'start_hour', 'end_hour')
+    to_update = []
+    for planning in plannings.iterator():
+        start = datetime.combine(planning.date, planning.start_hour)
+        end = datetime.combine(planning.date, planning.end_hour)
+        if end < start:
+            end += timedelta(days=1)
+        planning.duration_minutes = int((end - start).total_seconds() // 60)
+        to_update.append(planning)
+    Planning.objects.bulk_update(to_update, ['duration_minutes'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planning', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planning',
+            name='duration_minutes',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, help_text="Durée du créneau en minutes (calculée à l'enregistrement)"),
+        ),
+        migrations.RunPython(backfill_duration_minutes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.26 on 2026-10-17 13:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_occupancy(apps, schema_editor):
+    Planning = apps.get_model('planning', 'Planning')
+    PlanningOccupancy = apps.get_model('planning', 'PlanningOccupancy')
+    masks = {}
+    for user_id, day, start_hour, end_hour in Planning.objects.values_list(
+        'user_id', 'date', 'start_hour', 'end_hour'
+    ).iterator():
+        start = (start_hour.hour * 60 + start_hour.minute) // 15
+        end = (end_hour.hour * 60 + end_hour.minute) // 15
+        if end > start:
+            masks[(user_id, day)] = masks.get((user_id, day), 0) | (((1 << (end - start)) - 1) << start)
+    PlanningOccupancy.objects.bulk_create(
+        [
+            PlanningOccupancy(user_id=user_id, date=day, bitmap=mask.to_bytes(12, 'little'))
+            for (user_id, day), mask in masks.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('planning', '0002_planning_duration_minutes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanningOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bitmap', models.BinaryField(max_length=12)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='planning_occupancy', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Occupation planning',
+                'verbose_name_plural': 'Occupations planning',
+                'db_table': 'planning_occupancy',
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
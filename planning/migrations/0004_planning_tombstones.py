@@ -0,0 +1,34 @@
+# Generated by Django 4.2.26 on 2026-10-17 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planning', '0003_planning_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanningTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('planning_id', models.BigIntegerField()),
+                ('user_id', models.BigIntegerField()),
+                ('chantier_id', models.BigIntegerField()),
+                ('date', models.DateField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Planning supprimé',
+                'verbose_name_plural': 'Plannings supprimés',
+                'db_table': 'planning_tombstones',
+                'ordering': ['deleted_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='planning',
+            index=models.Index(fields=['updated_at'], name='planning_updated_b21779_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.26 on 2026-10-17 13:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_daily_rollup(apps, schema_editor):
+    Planning = apps.get_model('planning', 'Planning')
+    PlanningDailyRollup = apps.get_model('planning', 'PlanningDailyRollup')
+    rows = (
+        Planning.objects.order_by()
+        .values('date', 'chantier_id', 'user_id')
+        .annotate(
+            total_minutes=models.Sum('duration_minutes'),
+            total_cost=models.Sum('cout_planning'),
+            total_slots=models.Count('id'),
+        )
+    )
+    PlanningDailyRollup.objects.bulk_create(
+        [
+            PlanningDailyRollup(
+                date=row['date'], chantier_id=row['chantier_id'], user_id=row['user_id'],
+                minutes=row['total_minutes'] or 0,
+                cost=round(row['total_cost'] or 0, 2),
+                slots=row['total_slots'],
+            )
+            for row in rows.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('projects', '0009_geocoded_addresses'),
+        ('planning', '0004_planning_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanningDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('minutes', models.PositiveIntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('slots', models.PositiveIntegerField(default=0)),
+                ('chantier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='planning_rollups', to='projects.chantiers')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='planning_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Cumul journalier planning',
+                'verbose_name_plural': 'Cumuls journaliers planning',
+                'db_table': 'planning_daily_rollup',
+                'indexes': [models.Index(fields=['chantier', 'date'], name='planning_da_chantie_f2a6ab_idx'), models.Index(fields=['date'], name='planning_da_date_cd52b7_idx')],
+                'unique_together': {('date', 'chantier', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_rollup, migrations.RunPython.noop),
+    ]
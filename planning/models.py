@@ -1,8 +1,40 @@
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.db.models import Q
+from functools import reduce
+import operator
 from datetime import datetime, timedelta
 from decimal import Decimal
+from accounts.models import HourlyRate
+
+
+# Occupancy bitmaps split a day into 96 quarter-hours: bit n covers minutes [15n, 15n + 15)
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+
+def slot_mask(start_hour, end_hour):
+    """Return the quarter-hour bitmask covered by [start_hour, end_hour)"""
+    start = (start_hour.hour * 60 + start_hour.minute) // SLOT_MINUTES
+    end = (end_hour.hour * 60 + end_hour.minute) // SLOT_MINUTES
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+def free_windows(mask, min_minutes=SLOT_MINUTES):
+    """Return the free (start_minute, end_minute) windows of an occupancy bitmask"""
+    windows = []
+    start = None
+    for index in range(SLOTS_PER_DAY + 1):
+        busy = index == SLOTS_PER_DAY or mask >> index & 1
+        if not busy and start is None:
+            start = index
+        elif busy and start is not None:
+            if (index - start) * SLOT_MINUTES >= min_minutes:
+                windows.append((start * SLOT_MINUTES, index * SLOT_MINUTES))
+            start = None
+    return windows
 
 
 class Planning(models.Model):
@@ -21,6 +53,11 @@ class Planning(models.Model):
     date = models.DateField()
     start_hour = models.TimeField()
     end_hour = models.TimeField()
+    duration_minutes = models.PositiveSmallIntegerField(
+        default=0,
+        db_index=True,
+        help_text="Durée du créneau en minutes (calculée à l'enregistrement)"
+    )
     cout_planning = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -37,6 +74,7 @@ class Planning(models.Model):
         indexes = [
             models.Index(fields=['user', 'date']),
             models.Index(fields=['chantier', 'date']),
+            models.Index(fields=['updated_at']),
         ]
         unique_together = [['user', 'date', 'start_hour', 'end_hour']]
     
@@ -59,31 +97,39 @@ class Planning(models.Model):
         if self.end_hour <= self.start_hour:
             errors['end_hour'] = "L'heure de fin doit être postérieure à l'heure de début"
         
-        # Check for overlaps
-        if self.pk:
-            # Exclude self when checking for overlaps during update
-            overlapping = Planning.objects.filter(
-                user=self.user,
-                date=self.date
-            ).exclude(pk=self.pk).filter(
-                Q(start_hour__lt=self.end_hour, end_hour__gt=self.start_hour)
-            )
-        else:
-            overlapping = Planning.objects.filter(
-                user=self.user,
-                date=self.date
-            ).filter(
-                Q(start_hour__lt=self.end_hour, end_hour__gt=self.start_hour)
-            )
-        
-        if overlapping.exists():
+        # Check for overlaps against the user's occupancy bitmap for the day
+        if self.user_id and self.date and not PlanningOccupancy.is_free(
+            self.user_id, self.date, self.start_hour, self.end_hour, exclude_pk=self.pk
+        ):
             errors['__all__'] = "Conflit de planning détecté pour cet employé."
         
         if errors:
             raise ValidationError(errors)
     
-    def _compute_cout_planning(self):
-        """Compute cout_planning from hours and user.cout_h"""
+    def _compute_duration_minutes(self):
+        """Compute duration_minutes from start_hour and end_hour"""
+        if self.start_hour and self.end_hour:
+            start = datetime.combine(self.date, self.start_hour)
+            end = datetime.combine(self.date, self.end_hour)
+            if end < start:
+                # Handle overnight shifts (shouldn't happen with validation, but safety check)
+                end += timedelta(days=1)
+            self.duration_minutes = int((end - start).total_seconds() // 60)
+        else:
+            self.duration_minutes = 0
+    
+    @property
+    def hours(self):
+        """Return the slot duration in hours"""
+        return Decimal(self.duration_minutes) / Decimal('60')
+    
+    def _compute_cout_planning(self, rate=None):
+        """
+        Compute cout_planning from hours and the user's hourly rate at the slot date.
+        
+        The rate is resolved from the user's HourlyRate history unless the caller
+        already resolved it (bulk paths resolve rates for many slots at once).
+        """
         if self.start_hour and self.end_hour and self.user:
             # Check if it's a full day (08:00-17:00) - bill only 8 hours (1h unpaid lunch break)
             is_full_day = (
@@ -95,19 +141,14 @@ class Planning(models.Model):
                 # Full day preset: bill 8 hours instead of 9
                 hours = Decimal('8.0')
             else:
-                # Calculate hours difference normally
-                start = datetime.combine(self.date, self.start_hour)
-                end = datetime.combine(self.date, self.end_hour)
-                if end < start:
-                    # Handle overnight shifts (shouldn't happen with validation, but safety check)
-                    end += timedelta(days=1)
-                
-                delta = end - start
-                hours = Decimal(str(delta.total_seconds() / 3600.0))  # Convert to hours
+                hours = self.hours
             
-            # Get user hourly cost
-            if self.user.cout_h:
-                self.cout_planning = hours * self.user.cout_h
+            # Get user hourly cost applicable on the slot date
+            if rate is None:
+                rate = HourlyRate.rate_for(self.user, self.date)
+            if rate:
+                # Quantize to the field precision so a later full_clean() accepts it
+                self.cout_planning = (hours * Decimal(str(rate))).quantize(Decimal('0.01'))
             else:
                 self.cout_planning = Decimal('0')
         else:
@@ -116,8 +157,275 @@ class Planning(models.Model):
     def save(self, *args, **kwargs):
         """Override save to run validation and compute cost"""
         self.full_clean()
+        self._compute_duration_minutes()
         self._compute_cout_planning()
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.user} - {self.chantier} - {self.date} ({self.start_hour}-{self.end_hour})"
+
+
+class PlanningTombstone(models.Model):
+    """
+    Trace of a deleted Planning, kept for a few days so delta-sync clients
+    (see list_planning_slots / sync_planning_slots) can drop it from their grid.
+    """
+    
+    # Plain integers: the user or chantier may be gone with the slot
+    planning_id = models.BigIntegerField()
+    user_id = models.BigIntegerField()
+    chantier_id = models.BigIntegerField()
+    date = models.DateField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    # Tombstones older than this are pruned; clients syncing from an older cursor reload fully
+    RETENTION = timedelta(days=7)
+    
+    class Meta:
+        db_table = 'planning_tombstones'
+        verbose_name = 'Planning supprimé'
+        verbose_name_plural = 'Plannings supprimés'
+        ordering = ['deleted_at']
+    
+    def __str__(self):
+        return f"Planning {self.planning_id} supprimé le {self.deleted_at}"
+
+
+class PlanningOccupancy(models.Model):
+    """
+    Quarter-hour occupancy bitmap of one user for one day.
+    
+    Bit n is set when a Planning of the user covers minutes [15n, 15n + 15) of the
+    date. Rows are rebuilt from the user's slots whenever a Planning is saved or
+    deleted, so overlap checks and free-slot searches become bitwise operations.
+    """
+    
+    user = models.ForeignKey(
+        'accounts.User',
+        on_delete=models.CASCADE,
+        related_name='planning_occupancy'
+    )
+    date = models.DateField()
+    bitmap = models.BinaryField(max_length=SLOTS_PER_DAY // 8)
+    
+    class Meta:
+        db_table = 'planning_occupancy'
+        verbose_name = 'Occupation planning'
+        verbose_name_plural = 'Occupations planning'
+        unique_together = [['user', 'date']]
+    
+    @staticmethod
+    def to_bytes(mask):
+        return mask.to_bytes(SLOTS_PER_DAY // 8, 'little')
+    
+    @property
+    def mask(self):
+        return int.from_bytes(bytes(self.bitmap), 'little')
+    
+    @classmethod
+    def get_masks(cls, user_ids, date_from, date_to):
+        """Return {(user_id, date): mask} for many users and days in one query"""
+        rows = cls.objects.filter(
+            user_id__in=user_ids,
+            date__gte=date_from,
+            date__lte=date_to
+        ).values_list('user_id', 'date', 'bitmap')
+        return {
+            (user_id, day): int.from_bytes(bytes(bitmap), 'little')
+            for user_id, day, bitmap in rows
+        }
+    
+    @classmethod
+    def get_mask(cls, user_id, date):
+        """Return the occupancy mask of a single user-day (0 when free)"""
+        return cls.get_masks([user_id], date, date).get((user_id, date), 0)
+    
+    @classmethod
+    def is_free(cls, user_id, date, start_hour, end_hour, exclude_pk=None):
+        """
+        Check that [start_hour, end_hour) does not overlap another slot of the user.
+        
+        exclude_pk is the Planning being updated: its stored position is cleared
+        from the bitmap so a slot never conflicts with itself.
+        """
+        occupied = cls.get_mask(user_id, date)
+        if occupied and exclude_pk:
+            previous = Planning.objects.filter(
+                pk=exclude_pk, user_id=user_id, date=date
+            ).values_list('start_hour', 'end_hour').first()
+            if previous:
+                occupied &= ~slot_mask(*previous)
+        return not occupied & slot_mask(start_hour, end_hour)
+    
+    @classmethod
+    def free_users(cls, user_ids, date, start_hour, end_hour):
+        """Return the subset of user_ids with no slot overlapping the window on date"""
+        wanted = slot_mask(start_hour, end_hour)
+        masks = cls.get_masks(user_ids, date, date)
+        return [
+            user_id for user_id in user_ids
+            if not masks.get((user_id, date), 0) & wanted
+        ]
+    
+    @classmethod
+    def rebuild(cls, user_id, date):
+        """Recompute the bitmap of a user-day from its Planning rows"""
+        mask = 0
+        for start_hour, end_hour in Planning.objects.filter(
+            user_id=user_id, date=date
+        ).values_list('start_hour', 'end_hour'):
+            mask |= slot_mask(start_hour, end_hour)
+        
+        if mask:
+            cls.objects.update_or_create(
+                user_id=user_id, date=date,
+                defaults={'bitmap': cls.to_bytes(mask)}
+            )
+        else:
+            cls.objects.filter(user_id=user_id, date=date).delete()
+    
+    @classmethod
+    def rebuild_many(cls, user_days):
+        """Recompute the bitmaps of many (user_id, date) pairs from one Planning query"""
+        user_days = set(user_days)
+        if not user_days:
+            return
+        
+        user_ids = {user_id for user_id, _ in user_days}
+        dates = [day for _, day in user_days]
+        masks = dict.fromkeys(user_days, 0)
+        for user_id, day, start_hour, end_hour in Planning.objects.filter(
+            user_id__in=user_ids,
+            date__gte=min(dates),
+            date__lte=max(dates)
+        ).values_list('user_id', 'date', 'start_hour', 'end_hour'):
+            if (user_id, day) in masks:
+                masks[(user_id, day)] |= slot_mask(start_hour, end_hour)
+        
+        empty = [Q(user_id=user_id, date=day) for (user_id, day), mask in masks.items() if not mask]
+        if empty:
+            cls.objects.filter(reduce(operator.or_, empty)).delete()
+        cls.set_masks({user_day: mask for user_day, mask in masks.items() if mask})
+    
+    @classmethod
+    def set_masks(cls, masks):
+        """Upsert many {(user_id, date): mask} bitmaps in one statement"""
+        cls.objects.bulk_create(
+            [
+                cls(user_id=user_id, date=day, bitmap=cls.to_bytes(mask))
+                for (user_id, day), mask in masks.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['user', 'date'],
+            update_fields=['bitmap'],
+        )
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.date}"
+
+
+class PlanningDailyRollup(models.Model):
+    """
+    Planning pre-summed per (date, chantier, user) for trend charts.
+    
+    Rows are recomputed from the Planning table for every key a write touches
+    (see planning.signals), so trend queries read a handful of rows per day
+    instead of every slot. rebuild() recomputes any range from scratch.
+    """
+    
+    date = models.DateField()
+    chantier = models.ForeignKey(
+        'projects.Chantiers',
+        on_delete=models.CASCADE,
+        related_name='planning_rollups'
+    )
+    user = models.ForeignKey(
+        'accounts.User',
+        on_delete=models.CASCADE,
+        related_name='planning_rollups'
+    )
+    minutes = models.PositiveIntegerField(default=0)
+    cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    slots = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'planning_daily_rollup'
+        verbose_name = 'Cumul journalier planning'
+        verbose_name_plural = 'Cumuls journaliers planning'
+        unique_together = [['date', 'chantier', 'user']]
+        indexes = [
+            models.Index(fields=['chantier', 'date']),
+            models.Index(fields=['date']),
+        ]
+    
+    @staticmethod
+    def _totals(plannings):
+        """Return {(date, chantier_id, user_id): (minutes, cost, slots)} from one GROUP BY"""
+        rows = (
+            plannings.order_by()
+            .values('date', 'chantier_id', 'user_id')
+            .annotate(
+                total_minutes=models.Sum('duration_minutes'),
+                total_cost=models.Sum('cout_planning'),
+                total_slots=models.Count('id'),
+            )
+        )
+        return {
+            (row['date'], row['chantier_id'], row['user_id']): (
+                row['total_minutes'] or 0,
+                Decimal(str(row['total_cost'] or 0)).quantize(Decimal('0.01')),
+                row['total_slots'],
+            )
+            for row in rows
+        }
+    
+    @classmethod
+    def _store(cls, totals):
+        cls.objects.bulk_create(
+            [
+                cls(date=day, chantier_id=chantier_id, user_id=user_id, minutes=minutes, cost=cost, slots=slots)
+                for (day, chantier_id, user_id), (minutes, cost, slots) in totals.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['date', 'chantier', 'user'],
+            update_fields=['minutes', 'cost', 'slots'],
+        )
+    
+    @classmethod
+    def rebuild_many(cls, keys):
+        """Recompute the rows of many (date, chantier_id, user_id) keys from one Planning query"""
+        keys = {tuple(key) for key in keys if key and all(key)}
+        if not keys:
+            return
+        
+        dates = [day for day, _, _ in keys]
+        totals = cls._totals(Planning.objects.filter(
+            date__gte=min(dates),
+            date__lte=max(dates),
+            chantier_id__in={chantier_id for _, chantier_id, _ in keys},
+            user_id__in={user_id for _, _, user_id in keys},
+        ))
+        totals = {key: value for key, value in totals.items() if key in keys}
+        
+        empty = [
+            Q(date=day, chantier_id=chantier_id, user_id=user_id)
+            for day, chantier_id, user_id in keys - set(totals)
+        ]
+        if empty:
+            cls.objects.filter(reduce(operator.or_, empty)).delete()
+        cls._store(totals)
+    
+    @classmethod
+    def rebuild(cls, **filters):
+        """
+        Recompute every row matching filters (lookups on date, chantier_id, user_id).
+        
+        The same lookups select the Planning rows, e.g. rebuild(user_id=3, date__gte=day).
+        """
+        totals = cls._totals(Planning.objects.filter(**filters))
+        cls.objects.filter(**filters).delete()
+        cls._store(totals)
+        return len(totals)
+    
+    def __str__(self):
+        return f"{self.date} - {self.chantier_id} - {self.user_id}"
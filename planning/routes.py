@@ -0,0 +1,145 @@
+"""
+Daily van tours for licensed drivers.
+
+daily_tours(day) reads the planning of a day and gives every geocoded
+chantier of that day to one licensed driver planned on it (the one living
+nearest). Each driver then gets a multi-stop tour over their chantiers,
+ordered by a nearest-neighbour construction improved with 2-opt. Tours start
+and end at the driver's home base; without one, they start at the driver's
+earliest chantier and end wherever is shortest. The other employees planned
+on a chantier are listed as its crew.
+
+Distances are great-circle kilometres (see planning.distances), good enough to
+order a few dozen stops in well under a second.
+"""
+import math
+
+import numpy as np
+
+from .distances import haversine_matrix
+from .models import Planning
+
+
+def has_driving_licence(user):
+    """Whether the employee holds at least one driving licence"""
+    return bool(user.permis_de_conduire)
+
+
+def nearest_neighbour_route(distances, start=0):
+    """Visit every node of the distance matrix from start, always going to the nearest unvisited node"""
+    route = [start]
+    remaining = set(range(len(distances))) - {start}
+    while remaining:
+        here = route[-1]
+        following = min(remaining, key=lambda node: (distances[here, node], node))
+        route.append(following)
+        remaining.remove(following)
+    return route
+
+
+def two_opt(route, distances):
+    """Reverse segments of route while it gets shorter; the first and last nodes stay in place"""
+    route = list(route)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(route) - 2):
+            for j in range(i + 1, len(route) - 1):
+                a, b, c, d = route[i - 1], route[i], route[j], route[j + 1]
+                if distances[a, c] + distances[b, d] < distances[a, b] + distances[c, d] - 1e-9:
+                    route[i:j + 1] = route[i:j + 1][::-1]
+                    improved = True
+    return route
+
+
+def route_length(route, distances):
+    return float(sum(distances[a, b] for a, b in zip(route, route[1:])))
+
+
+def optimize_tour(points, home=None):
+    """
+    Order points [(lat, lng), ...] into a short tour.
+
+    With home, the tour is closed on it; without, it starts at points[0] and
+    ends anywhere. Returns (indices of points in visiting order, length in km).
+    """
+    if not points:
+        return [], 0.0
+
+    coords = np.array(([home] if home else []) + list(points), dtype=float)
+    distances = haversine_matrix(coords[:, 0], coords[:, 1], coords[:, 0], coords[:, 1])
+    if home:
+        route = two_opt(nearest_neighbour_route(distances) + [0], distances)
+        return [node - 1 for node in route[1:-1]], route_length(route, distances)
+
+    # A free end is a closed tour through a node at zero distance from every point
+    distances = np.pad(distances, ((0, 1), (0, 1)))
+    route = two_opt(nearest_neighbour_route(distances[:-1, :-1]) + [len(points)], distances)
+    return route[:-1], route_length(route, distances)
+
+
+def _coordinates(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    return float(latitude), float(longitude)
+
+
+def _distance_km(origin, destination):
+    if origin is None or destination is None:
+        return math.inf
+    return float(haversine_matrix([origin[0]], [origin[1]], [destination[0]], [destination[1]])[0, 0])
+
+
+def daily_tours(day):
+    """
+    Van tours for the licensed drivers planned on day.
+
+    Returns {'date', 'tours', 'unserved'}: one tour per driver with its
+    ordered stops and length in km, and the chantiers of the day that no
+    licensed driver is planned on (or that have no coordinates).
+    """
+    slots = (
+        Planning.objects.filter(date=day)
+        .select_related('user', 'chantier')
+        .order_by('start_hour', 'id')
+    )
+
+    chantiers = {}
+    for slot in slots:
+        site = chantiers.setdefault(slot.chantier_id, {
+            'chantier': slot.chantier,
+            'coordinates': _coordinates(slot.chantier.latitude, slot.chantier.longitude),
+            'first_start': slot.start_hour,
+            'employees': {},
+        })
+        site['employees'].setdefault(slot.user_id, slot.user)
+
+    tours = {}
+    unserved = []
+    for site in chantiers.values():
+        drivers = [user for user in site['employees'].values() if has_driving_licence(user)]
+        if site['coordinates'] is None or not drivers:
+            unserved.append(site)
+            continue
+
+        driver = min(drivers, key=lambda user: (
+            _distance_km(_coordinates(user.home_latitude, user.home_longitude), site['coordinates']),
+            user.nom, user.prenom, user.id,
+        ))
+        tours.setdefault(driver.id, {'driver': driver, 'sites': []})['sites'].append(site)
+
+    results = []
+    for tour in sorted(tours.values(), key=lambda tour: (tour['driver'].nom, tour['driver'].prenom)):
+        driver = tour['driver']
+        # Sites are in order of their first slot, so an open tour starts at the earliest one
+        sites = tour['sites']
+        home = _coordinates(driver.home_latitude, driver.home_longitude)
+        order, length = optimize_tour([site['coordinates'] for site in sites], home)
+        results.append({
+            'driver': driver,
+            'home': home,
+            'stops': [sites[index] for index in order],
+            'distance_km': round(length, 1),
+        })
+
+    return {'date': day, 'tours': results, 'unserved': unserved}
@@ -1,27 +1,193 @@
+from decimal import Decimal
 from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import Planning
-from .utils import update_chantier_aggregates
-from accounts.models import User
+from django.db import connection
+from django.utils import timezone
+from .models import Planning, PlanningDailyRollup, PlanningOccupancy, PlanningTombstone
+from .events import publish_planning_event
+from .utils import (
+    apply_chantier_delta,
+    minutes_to_hours,
+    reprice_user_plannings,
+    record_hourly_rate_change,
+    schedule_chantier_recompute,
+    planning_signals_suspended,
+    defer_planning_maintenance,
+)
+from accounts.models import User, HourlyRate
+
+
+def _slot_contribution(chantier_id, duration_minutes, cout_planning):
+    """Return the (chantier_id, hours, cost) a slot contributes to its chantier"""
+    return chantier_id, minutes_to_hours(duration_minutes), cout_planning or Decimal('0')
+
+
+def _update_occupancy(instance):
+    """Rebuild the occupancy bitmaps of the slot's current and previous user-day"""
+    user_day = (instance.user_id, instance.date)
+    PlanningOccupancy.rebuild(*user_day)
+    
+    previous_user_day = getattr(instance, '_previous_user_day', None)
+    instance._previous_user_day = None
+    if previous_user_day and tuple(previous_user_day) != user_day:
+        PlanningOccupancy.rebuild(*previous_user_day)
+
+
+def _record_tombstone(instance):
+    """Leave a tombstone for delta-sync clients and prune expired ones"""
+    PlanningTombstone.objects.create(
+        planning_id=instance.pk,
+        user_id=instance.user_id,
+        chantier_id=instance.chantier_id,
+        date=instance.date,
+    )
+    PlanningTombstone.objects.filter(
+        deleted_at__lt=timezone.now() - PlanningTombstone.RETENTION
+    ).delete()
+
+
+@receiver(pre_save, sender=User)
+def detect_user_cost_change(sender, instance, update_fields=None, **kwargs):
+    """Flag the user when cout_h is about to change"""
+    instance._cout_h_changed = False
+    if instance.pk is None:
+        return
+    # Partial saves such as update_last_login() never touch the hourly cost
+    if update_fields is not None and 'cout_h' not in update_fields:
+        return
+    
+    previous = User.objects.filter(pk=instance.pk).values_list('cout_h', flat=True).first()
+    new = Decimal(str(instance.cout_h)) if instance.cout_h is not None else None
+    instance._cout_h_changed = previous != new
+    instance._previous_cout_h = previous
 
 
 @receiver(post_save, sender=User)
 def update_planning_costs_on_user_change(sender, instance, **kwargs):
-    """Update planning costs when user.cout_h changes"""
-    # Get all plannings for this user and recalculate costs
-    plannings = Planning.objects.filter(user=instance)
-    for planning in plannings:
-        planning.save()  # This will recompute cout_planning
+    """Record a new effective-dated rate when user.cout_h changes"""
+    if getattr(instance, '_cout_h_changed', False):
+        instance._cout_h_changed = False
+        # The HourlyRate post_save below reprices the slots the new rate applies to
+        record_hourly_rate_change(instance, instance._previous_cout_h)
+
+
+@receiver(pre_save, sender=HourlyRate)
+def hourly_rate_pre_save(sender, instance, **kwargs):
+    """Remember the stored effective date so a moved entry reprices both periods"""
+    instance._previous_effective_from = None
+    if instance.pk is not None:
+        instance._previous_effective_from = (
+            HourlyRate.objects.filter(pk=instance.pk)
+            .values_list('effective_from', flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=HourlyRate)
+def hourly_rate_post_save(sender, instance, **kwargs):
+    """Reprice the slots affected by a new or edited rate entry"""
+    if getattr(instance, '_skip_repricing', False):
+        instance._skip_repricing = False
+        return
+    date_from = instance.effective_from
+    previous = getattr(instance, '_previous_effective_from', None)
+    if previous is not None:
+        date_from = min(date_from, previous)
+    reprice_user_plannings(instance.user, date_from=date_from)
+
+
+@receiver(post_delete, sender=HourlyRate)
+def hourly_rate_post_delete(sender, instance, **kwargs):
+    """Reprice the slots that fall back to the previous rate"""
+    # Entries are cascade-deleted with their user, whose slots are gone too
+    if User.objects.filter(pk=instance.user_id).exists():
+        reprice_user_plannings(instance.user, date_from=instance.effective_from)
+
+
+@receiver(pre_save, sender=Planning)
+def planning_pre_save(sender, instance, **kwargs):
+    """Remember the stored state of a Planning so post_save can apply a delta"""
+    instance._previous_contribution = None
+    instance._previous_user_day = None
+    if instance.pk is None:
+        return
+    
+    previous = (
+        Planning.objects.filter(pk=instance.pk)
+        .values_list('chantier_id', 'duration_minutes', 'cout_planning', 'user_id', 'date')
+        .first()
+    )
+    if previous is not None:
+        instance._previous_contribution = _slot_contribution(*previous[:3])
+        instance._previous_user_day = previous[3:]
 
 
 @receiver(post_save, sender=Planning)
 def planning_post_save(sender, instance, **kwargs):
-    """Update chantier aggregates when a Planning is saved"""
-    update_chantier_aggregates(instance.chantier_id)
+    """Apply the old/new delta of the saved Planning to chantier aggregates"""
+    new_chantier_id, new_hours, new_cost = _slot_contribution(
+        instance.chantier_id, instance.duration_minutes, instance.cout_planning
+    )
+    previous = getattr(instance, '_previous_contribution', None)
+    instance._previous_contribution = None
+    old_chantier_id = previous[0] if previous else None
+    previous_user_day = getattr(instance, '_previous_user_day', None)
+    rollup_keys = [(instance.date, new_chantier_id, instance.user_id)]
+    if previous and previous_user_day:
+        rollup_keys.append((previous_user_day[1], old_chantier_id, previous_user_day[0]))
+    
+    if planning_signals_suspended():
+        # Bulk import in progress: only remember what to rebuild at the end
+        defer_planning_maintenance(
+            user_days=[(instance.user_id, instance.date), previous_user_day],
+            chantier_ids=[new_chantier_id, old_chantier_id],
+            rollup_keys=rollup_keys,
+        )
+        instance._previous_user_day = None
+        return
+    
+    publish_planning_event(
+        'created' if kwargs.get('created') else 'updated',
+        instance,
+        dates=[instance.date, previous_user_day[1] if previous_user_day else None],
+    )
+    _update_occupancy(instance)
+    PlanningDailyRollup.rebuild_many(rollup_keys)
+    
+    if connection.in_atomic_block:
+        # Several slots may be written in this transaction: recompute once on commit
+        schedule_chantier_recompute(new_chantier_id, old_chantier_id)
+        return
+    
+    if previous is None:
+        apply_chantier_delta(new_chantier_id, new_hours, new_cost)
+        return
+    
+    old_chantier_id, old_hours, old_cost = previous
+    if old_chantier_id == new_chantier_id:
+        apply_chantier_delta(new_chantier_id, new_hours - old_hours, new_cost - old_cost)
+    else:
+        # Slot moved to another chantier: remove it from the old one, add it to the new one
+        apply_chantier_delta(old_chantier_id, -old_hours, -old_cost)
+        apply_chantier_delta(new_chantier_id, new_hours, new_cost)
 
 
 @receiver(post_delete, sender=Planning)
 def planning_post_delete(sender, instance, **kwargs):
-    """Update chantier aggregates when a Planning is deleted"""
-    update_chantier_aggregates(instance.chantier_id)
-
+    """Remove the deleted Planning from derived data and recompute its chantier on commit"""
+    _record_tombstone(instance)
+    
+    if planning_signals_suspended():
+        defer_planning_maintenance(
+            user_days=[(instance.user_id, instance.date)],
+            chantier_ids=[instance.chantier_id],
+            rollup_keys=[(instance.date, instance.chantier_id, instance.user_id)],
+        )
+        return
+    
+    publish_planning_event('deleted', instance, dates=[instance.date])
+    PlanningOccupancy.rebuild(instance.user_id, instance.date)
+    PlanningDailyRollup.rebuild_many([(instance.date, instance.chantier_id, instance.user_id)])
+    # Model deletes always run inside transaction.atomic(), so queryset and
+    # admin bulk deletes coalesce into one recompute per chantier
+    schedule_chantier_recompute(instance.chantier_id)
@@ -1,3 +1,812 @@
-from django.test import TestCase
+import asyncio
+import math
+import random
+from time import perf_counter
+from decimal import Decimal
+from unittest import mock
+from datetime import date, time, timedelta
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase
+from django.utils import timezone
+from projects.models import Chantiers
+from accounts.models import User, HourlyRate
+from MyBTP.dashboard import dashboard_stats
+from MyBTP.views import planning_events
+from .models import Planning, PlanningDailyRollup, PlanningOccupancy, free_windows, slot_mask
+from .events import LocalEventBroker
+from .distances import DistanceMatrix, haversine_matrix, nearest_free_employees
+from .routes import daily_tours, optimize_tour
+from .trends import planning_trend, va_trend, with_changes
+from .capacity import capacity_heatmap
+from .utils import update_chantier_aggregates, bulk_create_plannings, suspend_planning_signals
 
-# Create your tests here.
+
+class ChantierAggregatesTestCase(TransactionTestCase):
+    """Test incremental maintenance of chantier aggregates (autocommit writes)"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            email='worker@example.com',
+            password='testpass123',
+            prenom='Test',
+            nom='Worker',
+            cout_h=Decimal('20.00')
+        )
+        self.chantier = Chantiers.objects.create(
+            contact='Client A',
+            adresse_chantier='1 rue A',
+            cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris',
+            devis_ht='1000.00',
+        )
+        self.other_chantier = Chantiers.objects.create(
+            contact='Client B',
+            adresse_chantier='2 rue B',
+            cp_ville_chantier='69001 Lyon',
+            ville_chantier='Lyon',
+            devis_ht='500.00',
+        )
+    
+    def assertAggregates(self, chantier, hours, cost):
+        chantier.refresh_from_db()
+        self.assertEqual(chantier.number_hour_spent_on_project, Decimal(hours))
+        self.assertEqual(chantier.cost_spent_on_project, Decimal(cost))
+        self.assertEqual(chantier.va, chantier.devis_ht - Decimal(cost))
+    
+    def test_create_update_move_delete(self):
+        """Aggregates follow create, update, chantier change and delete"""
+        slot = Planning.objects.create(
+            user=self.user, chantier=self.chantier,
+            date='2024-01-15', start_hour='08:00', end_hour='12:00'
+        )
+        self.assertAggregates(self.chantier, '4', '80')
+        
+        slot.end_hour = '10:00'
+        slot.save()
+        self.assertAggregates(self.chantier, '2', '40')
+        
+        slot.chantier = self.other_chantier
+        slot.save()
+        self.assertAggregates(self.chantier, '0', '0')
+        self.assertAggregates(self.other_chantier, '2', '40')
+        
+        slot.delete()
+        self.assertAggregates(self.other_chantier, '0', '0')
+    
+    def test_full_recompute_repairs_drift(self):
+        """update_chantier_aggregates rebuilds totals from scratch"""
+        Planning.objects.create(
+            user=self.user, chantier=self.chantier,
+            date='2024-01-15', start_hour='08:00', end_hour='17:00'
+        )
+        Chantiers.objects.filter(id=self.chantier.id).update(
+            number_hour_spent_on_project=0, cost_spent_on_project=0
+        )
+        update_chantier_aggregates(self.chantier.id)
+        self.assertAggregates(self.chantier, '9', '160')
+    
+    def test_full_recompute_is_one_update_without_validation(self):
+        """The recompute writes through a single UPDATE and skips Chantiers.full_clean()"""
+        Planning.objects.create(
+            user=self.user, chantier=self.chantier,
+            date='2024-01-15', start_hour='08:00', end_hour='12:00'
+        )
+        # A row that would fail model validation must not block aggregate writes
+        Chantiers.objects.filter(id=self.chantier.id).update(gdrive_urls=['not a url'])
+        with self.assertNumQueries(1):
+            update_chantier_aggregates(self.chantier.id)
+        self.assertAggregates(self.chantier, '4', '80')
+    
+    def test_duration_minutes_stored_on_save(self):
+        """duration_minutes is persisted and follows edits"""
+        slot = Planning.objects.create(
+            user=self.user, chantier=self.chantier,
+            date='2024-01-15', start_hour='08:00', end_hour='10:45'
+        )
+        slot.refresh_from_db()
+        self.assertEqual(slot.duration_minutes, 165)
+        self.assertEqual(slot.hours, Decimal('2.75'))
+
+
+class BulkPlanningTestCase(TestCase):
+    """Test bulk creation of planning slots"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.users = [
+            User.objects.create_user(
+                email=f'worker{i}@example.com',
+                password='testpass123',
+                prenom='Test',
+                nom=f'Worker{i}',
+                cout_h=Decimal('20.00')
+            )
+            for i in range(2)
+        ]
+        self.chantier = Chantiers.objects.create(
+            contact='Client A',
+            adresse_chantier='1 rue A',
+            cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris',
+            devis_ht='10000.00',
+        )
+    
+    def test_bulk_create_reports_conflicts(self):
+        """Weekdays are expanded, conflicts skipped and aggregates recomputed once"""
+        Planning.objects.create(
+            user=self.users[0], chantier=self.chantier,
+            date=date(2024, 1, 16), start_hour='10:00', end_hour='11:00'
+        )
+        
+        # Monday 15 -> Sunday 21 January 2024, Monday to Friday only
+        with self.captureOnCommitCallbacks(execute=True):
+            result = bulk_create_plannings(
+                chantier=self.chantier,
+                users=self.users,
+                date_from=date(2024, 1, 15),
+                date_to=date(2024, 1, 21),
+                weekdays=[0, 1, 2, 3, 4],
+                start_hour=time(8, 0),
+                end_hour=time(12, 0),
+            )
+        
+        self.assertEqual(len(result['created']), 9)
+        self.assertEqual(result['conflicts'], [{
+            'user_id': self.users[0].id,
+            'date': '2024-01-16',
+            'error': "Conflit de planning détecté pour cet employé.",
+        }])
+        self.chantier.refresh_from_db()
+        self.assertEqual(self.chantier.number_hour_spent_on_project, Decimal('37'))
+        self.assertEqual(self.chantier.cost_spent_on_project, Decimal('740'))
+    
+    def test_bulk_create_deduplicates_users(self):
+        """A user listed twice is planned once and the batch publishes a single resync"""
+        with mock.patch('planning.events.get_broker') as get_broker:
+            with self.captureOnCommitCallbacks(execute=True):
+                result = bulk_create_plannings(
+                    chantier=self.chantier,
+                    users=[self.users[0], self.users[0]],
+                    date_from=date(2024, 1, 15),
+                    date_to=date(2024, 1, 16),
+                    weekdays=[0, 1],
+                    start_hour=time(8, 0),
+                    end_hour=time(12, 0),
+                )
+        
+        self.assertEqual(len(result['created']), 2)
+        self.assertEqual(result['conflicts'], [])
+        events = [call[0][0] for call in get_broker.return_value.publish.call_args_list]
+        self.assertEqual(events, [{'type': 'resync', 'dates': [date(2024, 1, 15), date(2024, 1, 16)]}])
+
+
+class PlanningOccupancyTestCase(TestCase):
+    """Test the quarter-hour occupancy bitmaps"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            email='worker@example.com',
+            password='testpass123',
+            prenom='Test',
+            nom='Worker',
+            cout_h=Decimal('20.00')
+        )
+        self.chantier = Chantiers.objects.create(
+            contact='Client A',
+            adresse_chantier='1 rue A',
+            cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris',
+        )
+        self.day = date(2024, 1, 15)
+    
+    def test_slot_mask_and_free_windows(self):
+        """Masks cover [start, end) and free windows are their complement"""
+        mask = slot_mask(time(8, 0), time(12, 0)) | slot_mask(time(13, 0), time(17, 0))
+        self.assertEqual(bin(mask).count('1'), 32)
+        self.assertEqual(free_windows(mask, min_minutes=60), [(0, 480), (720, 780), (1020, 1440)])
+    
+    def test_bitmap_follows_saves_and_deletes(self):
+        """Overlaps are rejected and the bitmap tracks moved and deleted slots"""
+        slot = Planning.objects.create(
+            user=self.user, chantier=self.chantier,
+            date=self.day, start_hour='08:00', end_hour='12:00'
+        )
+        self.assertEqual(PlanningOccupancy.get_mask(self.user.id, self.day), slot_mask(time(8), time(12)))
+        
+        with self.assertRaises(ValidationError):
+            Planning.objects.create(
+                user=self.user, chantier=self.chantier,
+                date=self.day, start_hour='11:45', end_hour='13:00'
+            )
+        
+        # Updating a slot onto its own former position is not a conflict
+        slot.start_hour = '09:00'
+        slot.save()
+        self.assertEqual(PlanningOccupancy.get_mask(self.user.id, self.day), slot_mask(time(9), time(12)))
+        
+        slot.delete()
+        self.assertFalse(PlanningOccupancy.objects.filter(user=self.user, date=self.day).exists())
+
+
+class UserRepricingTestCase(TestCase):
+    """Test repricing of plannings when an employee's hourly cost changes"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            email='worker@example.com',
+            password='testpass123',
+            prenom='Test',
+            nom='Worker',
+            cout_h=Decimal('20.00')
+        )
+        self.chantier = Chantiers.objects.create(
+            contact='Client A',
+            adresse_chantier='1 rue A',
+            cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris',
+            devis_ht='1000.00',
+        )
+        self.past_slot = Planning.objects.create(
+            user=self.user, chantier=self.chantier,
+            date=date.today() - timedelta(days=10), start_hour='08:00', end_hour='17:00'
+        )
+        self.future_slot = Planning.objects.create(
+            user=self.user, chantier=self.chantier,
+            date=date.today() + timedelta(days=1), start_hour='08:00', end_hour='09:15'
+        )
+    
+    def test_cost_change_reprices_future_plannings_only(self):
+        """A new cout_h becomes a dated rate: past costs are kept, later ones rewritten"""
+        past_updated_at = self.past_slot.updated_at
+        self.user.cout_h = Decimal('30.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        
+        self.past_slot.refresh_from_db()
+        self.future_slot.refresh_from_db()
+        self.assertEqual(self.past_slot.cout_planning, Decimal('160.00'))
+        # Recording the baseline rate leaves the slot history untouched
+        self.assertEqual(self.past_slot.updated_at, past_updated_at)
+        self.assertEqual(self.future_slot.cout_planning, Decimal('37.50'))
+        self.assertEqual(
+            list(self.user.hourly_rates.order_by('effective_from').values_list('rate', 'effective_from')),
+            [(Decimal('20.00'), self.past_slot.date), (Decimal('30.00'), date.today())]
+        )
+        self.chantier.refresh_from_db()
+        self.assertEqual(self.chantier.cost_spent_on_project, Decimal('197.50'))
+        self.assertEqual(self.chantier.va, Decimal('802.50'))
+        
+        # Re-saving a past slot keeps the rate that applied on its date
+        self.past_slot.save()
+        self.assertEqual(self.past_slot.cout_planning, Decimal('160.00'))
+    
+    def test_backdated_rate_reprices_its_period(self):
+        """Inserting a rate in the past rewrites the slots it now covers"""
+        with self.captureOnCommitCallbacks(execute=True):
+            HourlyRate.objects.create(
+                user=self.user, rate=Decimal('10.00'),
+                effective_from=date.today() - timedelta(days=20)
+            )
+        self.past_slot.refresh_from_db()
+        self.assertEqual(self.past_slot.cout_planning, Decimal('80.00'))
+    
+    def test_unrelated_save_does_not_reprice(self):
+        """Saving a user without changing cout_h runs no planning UPDATE"""
+        with self.assertNumQueries(1):
+            self.user.save(update_fields=['last_login'])
+        with self.assertNumQueries(2):
+            self.user.save()
+
+
+class CoalescedMaintenanceTestCase(TestCase):
+    """Test transaction-scoped coalescing and suspension of Planning maintenance"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            email='worker@example.com',
+            password='testpass123',
+            prenom='Test',
+            nom='Worker',
+            cout_h=Decimal('20.00')
+        )
+        self.chantier = Chantiers.objects.create(
+            contact='Client A',
+            adresse_chantier='1 rue A',
+            cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris',
+            devis_ht='1000.00',
+        )
+    
+    def test_recompute_runs_once_per_transaction(self):
+        """Slots written or deleted in one transaction trigger one recompute per chantier on commit"""
+        other = Chantiers.objects.create(
+            contact='Client B',
+            adresse_chantier='2 rue B',
+            cp_ville_chantier='69001 Lyon',
+            ville_chantier='Lyon',
+        )
+        with mock.patch('planning.utils.update_chantier_aggregates') as recompute:
+            with self.captureOnCommitCallbacks(execute=True):
+                for day in range(15, 20):
+                    for chantier, start_hour, end_hour in [(self.chantier, '08:00', '12:00'), (other, '13:00', '17:00')]:
+                        Planning.objects.create(
+                            user=self.user, chantier=chantier,
+                            date=date(2024, 1, day), start_hour=start_hour, end_hour=end_hour
+                        )
+                recompute.assert_not_called()
+            
+            self.assertEqual(recompute.call_args_list, [mock.call(self.chantier.id), mock.call(other.id)])
+            recompute.reset_mock()
+            
+            with self.captureOnCommitCallbacks(execute=True):
+                Planning.objects.all().delete()
+            
+            self.assertEqual(recompute.call_args_list, [mock.call(self.chantier.id), mock.call(other.id)])
+    
+    def test_suspended_signals_rebuild_once_on_exit(self):
+        """Inside suspend_planning_signals() derived data is rebuilt at the end"""
+        with suspend_planning_signals():
+            for day in range(15, 20):
+                Planning.objects.create(
+                    user=self.user, chantier=self.chantier,
+                    date=date(2024, 1, day), start_hour='08:00', end_hour='12:00'
+                )
+            self.assertFalse(PlanningOccupancy.objects.exists())
+        
+        self.assertEqual(PlanningOccupancy.objects.count(), 5)
+        self.chantier.refresh_from_db()
+        self.assertEqual(self.chantier.number_hour_spent_on_project, Decimal('20'))
+        self.assertEqual(self.chantier.cost_spent_on_project, Decimal('400'))
+
+
+class PlanningSyncTestCase(TestCase):
+    """Test the delta-sync endpoint of the planning grid"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            email='worker@example.com',
+            password='testpass123',
+            prenom='Test',
+            nom='Worker',
+            cout_h=Decimal('20.00')
+        )
+        self.chantier = Chantiers.objects.create(
+            contact='Client A',
+            adresse_chantier='1 rue A',
+            cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris',
+        )
+        self.client.force_login(self.user)
+        self.range = {'date_from': '2024-01-15', 'date_to': '2024-01-21'}
+    
+    def test_sync_returns_changes_and_tombstones(self):
+        """Created slots and deleted slot ids are returned since the cursor"""
+        doomed = Planning.objects.create(
+            user=self.user, chantier=self.chantier,
+            date='2024-01-15', start_hour='08:00', end_hour='12:00'
+        )
+        doomed_id = doomed.id
+        cursor = self.client.get('/planning/list/', self.range).json()['cursor']
+        
+        doomed.delete()
+        created = Planning.objects.create(
+            user=self.user, chantier=self.chantier,
+            date='2024-01-16', start_hour='08:00', end_hour='12:00'
+        )
+        
+        result = self.client.get('/planning/sync/', {'since': cursor, **self.range}).json()
+        self.assertFalse(result['full_reload'])
+        self.assertEqual([slot['id'] for slot in result['created']], [created.id])
+        self.assertEqual(result['deleted'], [doomed_id])
+        self.assertEqual(result['moved_out'], [])
+    
+    def test_list_answers_not_modified_until_slots_change(self):
+        """The list endpoint answers 304 for a matching ETag and 200 once a slot changes"""
+        slot = Planning.objects.create(
+            user=self.user, chantier=self.chantier,
+            date='2024-01-15', start_hour='08:00', end_hour='12:00'
+        )
+        etag = self.client.get('/planning/list/', self.range)['ETag']
+        
+        response = self.client.get('/planning/list/', self.range, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        slot.delete()
+        response = self.client.get('/planning/list/', self.range, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['slots'], [])
+
+
+class PlanningEventsTestCase(TestCase):
+    """Test the in-process planning event broker"""
+    
+    def test_broker_filters_on_date_window(self):
+        """Subscribers only receive events touching their date window"""
+        broker = LocalEventBroker()
+        
+        async def scenario():
+            subscription = broker.subscribe(date(2024, 1, 15), date(2024, 1, 21))
+            broker.publish({'type': 'created', 'dates': [date(2024, 2, 1)]})
+            broker.publish({'type': 'updated', 'dates': [date(2024, 2, 1), date(2024, 1, 16)]})
+            broker.publish({'type': 'resync', 'dates': []})
+            received = [await asyncio.wait_for(subscription.queue.get(), 1) for _ in range(2)]
+            broker.unsubscribe(subscription)
+            return [event['type'] for event in received], subscription.queue.empty()
+        
+        self.assertEqual(asyncio.run(scenario()), (['updated', 'resync'], True))
+    
+    def test_slot_events_published_on_commit(self):
+        """Saving a slot publishes a created event after the transaction commits"""
+        user = User.objects.create_user(
+            email='worker@example.com', password='testpass123', prenom='Test', nom='Worker'
+        )
+        chantier = Chantiers.objects.create(
+            contact='Client A',
+            adresse_chantier='1 rue A',
+            cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris',
+        )
+        with mock.patch('planning.events.get_broker') as get_broker:
+            with self.captureOnCommitCallbacks(execute=True):
+                slot = Planning.objects.create(
+                    user=user, chantier=chantier,
+                    date='2024-01-15', start_hour='08:00', end_hour='12:00'
+                )
+                get_broker.return_value.publish.assert_not_called()
+        
+        event = get_broker.return_value.publish.call_args[0][0]
+        self.assertEqual(event['type'], 'created')
+        self.assertEqual(event['slot']['id'], slot.id)
+        self.assertEqual(event['dates'], [date(2024, 1, 15)])
+    
+    def test_stream_closes_and_unsubscribes(self):
+        """An event stream ends after its maximum age and drops its subscription"""
+        user = User.objects.create_user(
+            email='worker@example.com', password='testpass123', prenom='Test', nom='Worker'
+        )
+        broker = LocalEventBroker()
+        request = AsyncRequestFactory().get('/planning/events/', {'date_from': '2024-01-15'})
+        request.user = user
+        
+        async def scenario():
+            response = await planning_events(request)
+            chunks = [chunk async for chunk in response.streaming_content]
+            return chunks, len(broker._subscriptions)
+        
+        with mock.patch('MyBTP.views.get_broker', return_value=broker), \
+             mock.patch('MyBTP.views.PLANNING_EVENTS_MAX_AGE', 0.05):
+            chunks, subscriptions = asyncio.run(scenario())
+        
+        self.assertEqual(chunks[0], b'retry: 5000\n\n')
+        self.assertEqual(subscriptions, 0)
+
+
+class DistanceMatrixTestCase(TestCase):
+    """Test the chantier x employee distance matrix"""
+    
+    def setUp(self):
+        """Set up employees around Paris and a chantier in Paris"""
+        self.chantier = Chantiers.objects.create(
+            contact='Client A',
+            adresse_chantier='1 rue de Rivoli',
+            cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris',
+            latitude=Decimal('48.856600'),
+            longitude=Decimal('2.352200'),
+        )
+        homes = {
+            'near': (Decimal('48.860000'), Decimal('2.350000')),
+            'busy': (Decimal('48.850000'), Decimal('2.350000')),
+            'far': (Decimal('49.440000'), Decimal('1.100000')),
+            'nohome': (None, None),
+        }
+        self.users = {
+            name: User.objects.create_user(
+                email=f'{name}@example.com', password='testpass123', prenom=name, nom='Worker',
+                home_latitude=latitude, home_longitude=longitude,
+            )
+            for name, (latitude, longitude) in homes.items()
+        }
+        Planning.objects.create(
+            user=self.users['busy'], chantier=self.chantier,
+            date='2024-01-15', start_hour='08:00', end_hour='12:00'
+        )
+    
+    def test_haversine_matrix(self):
+        """Paris - Lyon is about 392 km and NaN coordinates give NaN"""
+        distances = haversine_matrix([48.8566, 45.764], [2.3522, 4.8357], [45.764, float('nan')], [4.8357, 0.0])
+        self.assertEqual(distances.shape, (2, 2))
+        self.assertAlmostEqual(distances[0, 0], 392, delta=2)
+        self.assertAlmostEqual(distances[1, 0], 0.0)
+        self.assertTrue(all(value != value for value in distances[:, 1]))
+    
+    def test_nearest_free_employees(self):
+        """Busy employees and employees without a home base are left out"""
+        with mock.patch('planning.distances.distance_matrix', DistanceMatrix()):
+            nearest = nearest_free_employees(self.chantier.id, date(2024, 1, 15), time(9, 0), time(10, 0))
+            within = nearest_free_employees(
+                self.chantier.id, date(2024, 1, 15), time(9, 0), time(10, 0), max_km=50
+            )
+        
+        self.assertEqual([user_id for user_id, _ in nearest], [self.users['near'].id, self.users['far'].id])
+        self.assertLess(nearest[0][1], 1)
+        self.assertEqual([user_id for user_id, _ in within], [self.users['near'].id])
+    
+    def test_incremental_sync(self):
+        """Moved chantiers and employees are picked up without a rebuild"""
+        matrix = DistanceMatrix()
+        matrix.sync()
+        
+        Chantiers.objects.filter(id=self.chantier.id).update(
+            latitude=Decimal('49.440000'), longitude=Decimal('1.100000'), updated_at=timezone.now()
+        )
+        far = self.users['far']
+        far.home_latitude, far.home_longitude = Decimal('49.441000'), Decimal('1.101000')
+        far.save()
+        
+        with mock.patch.object(matrix, '_rebuild', wraps=matrix._rebuild) as rebuild:
+            distances = matrix.chantier_distances(self.chantier.id)
+        
+        rebuild.assert_not_called()
+        self.assertLess(distances[far.id], 1)
+        self.assertGreater(distances[self.users['near'].id], 100)
+
+
+class DailyToursTestCase(TestCase):
+    """Test the van tour optimizer"""
+    
+    def test_optimize_tour_untangles_route(self):
+        """Points on a circle are visited around it, whatever their input order"""
+        angles = [0, 4, 1, 6, 3, 7, 2, 5]
+        points = [(48.0 + 0.1 * math.sin(k * math.pi / 4), 2.0 + 0.1 * math.cos(k * math.pi / 4)) for k in angles]
+        
+        order, length = optimize_tour(points, home=(48.0, 2.1))
+        
+        visited = [angles[index] for index in order]
+        self.assertIn(visited, [[0, 1, 2, 3, 4, 5, 6, 7], [0, 7, 6, 5, 4, 3, 2, 1]])
+        self.assertLess(length, 70)
+    
+    def test_optimize_tour_is_fast(self):
+        """A few dozen stops are ordered well under a second"""
+        rng = random.Random(42)
+        points = [(48.5 + rng.random(), 1.8 + rng.random()) for _ in range(40)]
+        
+        started = perf_counter()
+        order, _ = optimize_tour(points)
+        
+        self.assertLess(perf_counter() - started, 1)
+        self.assertEqual(sorted(order), list(range(40)))
+        self.assertEqual(order[0], 0)
+    
+    def test_daily_tours(self):
+        """Each chantier goes to the nearest licensed driver planned on it, with its crew"""
+        driver = User.objects.create_user(
+            email='driver@example.com', password='testpass123', prenom='Paul', nom='Driver',
+            permis_de_conduire=['B'], home_latitude=Decimal('48.850000'), home_longitude=Decimal('2.300000'),
+        )
+        helper = User.objects.create_user(
+            email='helper@example.com', password='testpass123', prenom='Marc', nom='Helper'
+        )
+        sites = [
+            Chantiers.objects.create(
+                contact=f'Client {index}', adresse_chantier=f'{index} rue A', cp_ville_chantier='75001 Paris',
+                ville_chantier='Paris', latitude=latitude, longitude=Decimal('2.300000'),
+            )
+            for index, latitude in enumerate([Decimal('48.950000'), Decimal('48.870000'), None])
+        ]
+        for site, start, end in [(sites[0], '08:00', '10:00'), (sites[1], '10:30', '12:00'), (sites[2], '13:00', '15:00')]:
+            Planning.objects.create(user=driver, chantier=site, date='2024-01-15', start_hour=start, end_hour=end)
+        Planning.objects.create(user=helper, chantier=sites[1], date='2024-01-15', start_hour='08:00', end_hour='09:00')
+        
+        tours = daily_tours(date(2024, 1, 15))
+        
+        self.assertEqual(len(tours['tours']), 1)
+        tour = tours['tours'][0]
+        self.assertEqual(tour['driver'], driver)
+        self.assertEqual([site['chantier'] for site in tour['stops']], [sites[1], sites[0]])
+        self.assertEqual(set(tour['stops'][0]['employees']), {driver.id, helper.id})
+        self.assertAlmostEqual(tour['distance_km'], 22.2, delta=0.5)
+        self.assertEqual([site['chantier'] for site in tours['unserved']], [sites[2]])
+
+
+class DashboardStatsTestCase(TestCase):
+    """Test the cached dashboard KPI snapshot"""
+    
+    def setUp(self):
+        """Start from an empty cache with one chantier and one slot this week"""
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='worker@example.com', password='testpass123', prenom='Test', nom='Worker',
+            cout_h=Decimal('20.00')
+        )
+        self.chantier = Chantiers.objects.create(
+            contact='Client A',
+            adresse_chantier='1 rue A',
+            cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris',
+        )
+        self.today = date.today()
+    
+    def test_snapshot_cached_until_a_write(self):
+        """A repeat load runs no query and a saved slot refreshes the snapshot"""
+        with self.assertNumQueries(5):
+            stats = dashboard_stats()
+        self.assertEqual(stats['chantiers'], {'total': 1, 'active': 1, 'total_revenue': 0.0})
+        self.assertEqual(stats['team']['total_employees'], 1)
+        
+        with self.assertNumQueries(0):
+            dashboard_stats()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Planning.objects.create(
+                user=self.user, chantier=self.chantier,
+                date=self.today, start_hour='08:00', end_hour='10:00'
+            )
+        
+        stats = dashboard_stats()
+        self.assertEqual(stats['planning'], {'week_hours': 2.0, 'week_cost': 40.0})
+    
+    def test_login_keeps_snapshot(self):
+        """Saving last_login alone does not drop the snapshot"""
+        dashboard_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.login(email='worker@example.com', password='testpass123')
+        
+        with self.assertNumQueries(0):
+            dashboard_stats()
+
+
+class PlanningDailyRollupTestCase(TestCase):
+    """Test the (date, chantier, user) daily rollups and the trends read from them"""
+    
+    def setUp(self):
+        """Set up two chantiers and one employee at 20 EUR/h"""
+        self.user = User.objects.create_user(
+            email='worker@example.com', password='testpass123', prenom='Test', nom='Worker',
+            cout_h=Decimal('20.00')
+        )
+        self.chantiers = [
+            Chantiers.objects.create(
+                contact=f'Client {name}',
+                adresse_chantier='1 rue A',
+                cp_ville_chantier='75001 Paris',
+                ville_chantier='Paris',
+                devis_ht='1000.00',
+            )
+            for name in 'AB'
+        ]
+    
+    def rollups(self):
+        return sorted(
+            PlanningDailyRollup.objects.values_list('date', 'chantier_id', 'minutes', 'cost', 'slots')
+        )
+    
+    def test_rollups_follow_slot_writes(self):
+        """Creates, moves and deletes keep the rollups equal to a full rebuild"""
+        first = Planning.objects.create(
+            user=self.user, chantier=self.chantiers[0],
+            date='2024-01-15', start_hour='08:00', end_hour='10:00'
+        )
+        Planning.objects.create(
+            user=self.user, chantier=self.chantiers[0],
+            date='2024-01-15', start_hour='13:00', end_hour='14:00'
+        )
+        self.assertEqual(self.rollups(), [
+            (date(2024, 1, 15), self.chantiers[0].id, 180, Decimal('60.00'), 2),
+        ])
+        
+        # Moving a slot updates both the key it leaves and the key it joins
+        first.chantier = self.chantiers[1]
+        first.date = date(2024, 1, 16)
+        first.save()
+        self.assertEqual(self.rollups(), [
+            (date(2024, 1, 15), self.chantiers[0].id, 60, Decimal('20.00'), 1),
+            (date(2024, 1, 16), self.chantiers[1].id, 120, Decimal('40.00'), 1),
+        ])
+        
+        first.delete()
+        incremental = self.rollups()
+        self.assertEqual(incremental, [(date(2024, 1, 15), self.chantiers[0].id, 60, Decimal('20.00'), 1)])
+        
+        PlanningDailyRollup.rebuild()
+        self.assertEqual(self.rollups(), incremental)
+    
+    def test_bulk_and_suspended_writes(self):
+        """Bulk creation and suspended signals rebuild the rollups they touch once"""
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_create_plannings(
+                chantier=self.chantiers[0], users=[self.user],
+                date_from=date(2024, 1, 15), date_to=date(2024, 1, 16), weekdays=[0, 1],
+                start_hour=time(8, 0), end_hour=time(12, 0),
+            )
+        with suspend_planning_signals():
+            Planning.objects.create(
+                user=self.user, chantier=self.chantiers[1],
+                date='2024-01-17', start_hour='08:00', end_hour='09:00'
+            )
+            self.assertEqual(len(self.rollups()), 2)
+        
+        self.assertEqual([row[:3] for row in self.rollups()], [
+            (date(2024, 1, 15), self.chantiers[0].id, 240),
+            (date(2024, 1, 16), self.chantiers[0].id, 240),
+            (date(2024, 1, 17), self.chantiers[1].id, 60),
+        ])
+    
+    def test_trends(self):
+        """Weekly series give week-over-week changes and a running VA"""
+        for day, end_hour in [(8, '12:00'), (15, '10:00'), (16, '10:00')]:
+            Planning.objects.create(
+                user=self.user, chantier=self.chantiers[0],
+                date=date(2024, 1, day), start_hour='08:00', end_hour=end_hour
+            )
+        
+        series = with_changes(planning_trend('week', 'chantier', date(2024, 1, 8), date(2024, 1, 21)))
+        self.assertEqual([(row['period'], row['hours'], row['hours_change']) for row in series], [
+            (date(2024, 1, 8), 4.0, None),
+            (date(2024, 1, 15), 4.0, 0.0),
+        ])
+        
+        va = va_trend('week', 'chantier', date(2024, 1, 15), date(2024, 1, 21))
+        self.assertEqual([(row['key'], row['va']) for row in va], [(self.chantiers[0].id, 840.0)])
+        
+        with self.assertRaises(ValueError):
+            va_trend('week', 'team')
+
+
+class CapacityHeatmapTestCase(TestCase):
+    """Test the weekly capacity vs demand heatmap"""
+    
+    def setUp(self):
+        """One employee (the admin does not count) and three chantiers around Wednesday 17 January 2024"""
+        self.user = User.objects.create_user(
+            email='worker@example.com', password='testpass123', prenom='Test', nom='Worker',
+            cout_h=Decimal('20.00')
+        )
+        User.objects.create_user(
+            email='admin@example.com', password='testpass123', prenom='Test', nom='Admin', user_type='Admin'
+        )
+        # 1500 EUR of devis plans 24 hours
+        specs = [
+            ('Client A', '1500.00', date(2024, 1, 22), date(2024, 1, 26)),
+            ('Client B', '3000.00', None, date(2024, 1, 10)),
+            ('Client C', '1500.00', None, None),
+        ]
+        self.chantiers = [
+            Chantiers.objects.create(
+                contact=contact,
+                adresse_chantier='1 rue A',
+                cp_ville_chantier='75001 Paris',
+                ville_chantier='Paris',
+                devis_ht=devis,
+                date_debut_chantier=start,
+                date_fin_prevue_chantier=end,
+            )
+            for contact, devis, start, end in specs
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            Planning.objects.create(
+                user=self.user, chantier=self.chantiers[0],
+                date='2024-01-23', start_hour='08:00', end_hour='12:00'
+            )
+    
+    def test_heatmap(self):
+        """Remaining hours spread over each window and weeks compare them with free capacity"""
+        heatmap = capacity_heatmap(weeks=3, today=date(2024, 1, 17))
+        
+        self.assertEqual(
+            [(week['capacity'], week['booked'], week['demand'], week['status']) for week in heatmap['weeks']],
+            [(24.0, 0.0, 48.0, 'over'), (40.0, 4.0, 20.0, 'under'), (40.0, 0.0, 0.0, 'under')]
+        )
+        self.assertEqual(heatmap['weeks'][1]['balance'], 16.0)
+        # Overdue chantier B is due on the next open day, chantier A over its own week
+        self.assertEqual(
+            [(row['id'], row['weeks']) for row in heatmap['chantiers']],
+            [(self.chantiers[1].id, [48.0, 0.0, 0.0]), (self.chantiers[0].id, [0.0, 20.0, 0.0])]
+        )
+        self.assertEqual(heatmap['unscheduled'], [{'id': self.chantiers[2].id, 'name': self.chantiers[2].name_chantier, 'remaining': 24.0}])
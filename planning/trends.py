@@ -0,0 +1,143 @@
+"""
+Time series of planned hours, cost and VA, read from the daily rollups.
+
+Every helper runs GROUP BY queries on PlanningDailyRollup, which holds at most
+one row per (date, chantier, user), so a trend over months reads pre-summed
+rows instead of every Planning slot. Series can be split per chantier, team,
+chef de chantier or employee (see TREND_GROUPS).
+"""
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from projects.models import Chantiers
+from .models import PlanningDailyRollup
+
+
+TREND_PERIODS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# group_by name -> (key field, label fields) on PlanningDailyRollup
+TREND_GROUPS = {
+    'chantier': ('chantier_id', ('chantier__name_chantier',)),
+    'team': ('user__equipe_id', ('user__equipe__name',)),
+    'chef': ('chantier__chef_chantier_id', ('chantier__chef_chantier__prenom', 'chantier__chef_chantier__nom')),
+    'user': ('user_id', ('user__prenom', 'user__nom')),
+}
+
+
+def previous_period(period_start, period):
+    """Return the start of the period before the one starting on period_start"""
+    if period == 'day':
+        return period_start - timedelta(days=1)
+    if period == 'week':
+        return period_start - timedelta(days=7)
+    return (period_start - timedelta(days=1)).replace(day=1)
+
+
+def _rollups(date_from=None, date_to=None, **filters):
+    rollups = PlanningDailyRollup.objects.filter(**filters)
+    if date_from:
+        rollups = rollups.filter(date__gte=date_from)
+    if date_to:
+        rollups = rollups.filter(date__lte=date_to)
+    return rollups.order_by()
+
+
+def _label(row, label_fields):
+    parts = [str(row[field]) for field in label_fields if row[field]]
+    return ' '.join(parts) or 'Non renseigné'
+
+
+def planning_trend(period='week', group_by=None, date_from=None, date_to=None, **filters):
+    """
+    Hours, cost and slot count per period, optionally split by group_by.
+
+    filters are extra lookups on PlanningDailyRollup (e.g. chantier_id=3).
+    Each row has period, key, label, hours, cost and slots, ordered by period.
+    """
+    if period not in TREND_PERIODS:
+        raise ValueError(f"Période inconnue : {period}")
+    if group_by is not None and group_by not in TREND_GROUPS:
+        raise ValueError(f"Regroupement inconnu : {group_by}")
+
+    key_field, label_fields = TREND_GROUPS[group_by] if group_by else (None, ())
+    group_fields = ([key_field] if key_field else []) + list(label_fields)
+    rows = (
+        _rollups(date_from, date_to, **filters)
+        .annotate(period_start=TREND_PERIODS[period]('date'))
+        .values('period_start', *group_fields)
+        .annotate(total_minutes=Sum('minutes'), total_cost=Sum('cost'), total_slots=Sum('slots'))
+        .order_by('period_start', *group_fields)
+    )
+    return [
+        {
+            'period': row['period_start'],
+            'key': row[key_field] if key_field else None,
+            'label': _label(row, label_fields) if key_field else 'Total',
+            'hours': round((row['total_minutes'] or 0) / 60.0, 2),
+            'cost': round(float(row['total_cost'] or 0), 2),
+            'slots': row['total_slots'] or 0,
+        }
+        for row in rows
+    ]
+
+
+def with_changes(rows, period='week'):
+    """
+    Add hours_change and cost_change to planning_trend() rows, in percent.
+
+    Each row is compared with the previous period of the same key
+    (week-over-week, month-over-month); the change is None when that period
+    has no rows or a zero total.
+    """
+    by_period = {(row['key'], row['period']): row for row in rows}
+    for row in rows:
+        before = by_period.get((row['key'], previous_period(row['period'], period)))
+        for metric in ('hours', 'cost'):
+            previous_value = before[metric] if before else 0
+            row[f'{metric}_change'] = (
+                round((row[metric] - previous_value) / previous_value * 100, 1) if previous_value else None
+            )
+    return rows
+
+
+def va_trend(period='week', group_by=None, date_from=None, date_to=None):
+    """
+    VA (devis HT minus cost spent to date) at the end of each period.
+
+    group_by is None, 'chantier' or 'chef': VA belongs to chantiers, so it
+    cannot be split per team or employee. Costs spent before date_from are
+    included in the running total.
+    """
+    if group_by not in (None, 'chantier', 'chef'):
+        raise ValueError(f"La VA ne peut pas être regroupée par {group_by}")
+
+    key_field = TREND_GROUPS[group_by][0] if group_by else None
+    devis_field = {'chantier': 'id', 'chef': 'chef_chantier_id'}.get(group_by)
+
+    if devis_field:
+        devis = {
+            row[devis_field]: row['total']
+            for row in Chantiers.objects.order_by().values(devis_field).annotate(total=Sum('devis_ht'))
+        }
+    else:
+        devis = {None: Chantiers.objects.aggregate(total=Sum('devis_ht'))['total']}
+
+    spent = {}
+    if date_from:
+        earlier = PlanningDailyRollup.objects.filter(date__lt=date_from).order_by()
+        if key_field:
+            spent = {row[key_field]: float(row['total'] or 0) for row in earlier.values(key_field).annotate(total=Sum('cost'))}
+        else:
+            spent = {None: float(earlier.aggregate(total=Sum('cost'))['total'] or 0)}
+
+    rows = planning_trend(period, group_by, date_from, date_to)
+    for row in rows:
+        spent[row['key']] = spent.get(row['key'], 0.0) + row['cost']
+        row['va'] = round(float(devis.get(row['key']) or 0) - spent[row['key']], 2)
+    return rows
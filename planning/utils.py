@@ -1,45 +1,362 @@
+import threading
+from contextlib import contextmanager
 from decimal import Decimal
-from datetime import datetime, timedelta
+from datetime import timedelta, time
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import (
+    F, Sum, Min, Case, When, Value, DecimalField, FloatField, IntegerField, OuterRef, Subquery
+)
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
 from projects.models import Chantiers
-from .models import Planning
+from accounts.models import HourlyRate
+from .models import Planning, PlanningDailyRollup, PlanningOccupancy, slot_mask
+from .events import publish_planning_event
+
+
+def minutes_to_hours(minutes):
+    """Convert a number of minutes (possibly None from an empty Sum) to Decimal hours"""
+    return Decimal(minutes or 0) / Decimal('60')
+
+
+def apply_chantier_delta(chantier_id, hours_delta, cost_delta):
+    """
+    Apply an incremental change to a chantier's aggregates.
+    
+    The hours, cost and VA columns are shifted in a single UPDATE statement using
+    F() expressions, so concurrent writers never overwrite each other and no
+    Planning rows need to be read.
+    """
+    if not chantier_id:
+        return
+    
+    if not hours_delta and not cost_delta:
+        # Totals unchanged (e.g. a slot shifted in time) but cached views list the slot
+        Chantiers.objects.filter(id=chantier_id).update(revision=F('revision') + 1)
+        return
+    
+    # In an UPDATE, the right-hand side sees the old row values, so VA is derived
+    # from the new cost as devis_ht - (old cost + delta).
+    Chantiers.objects.filter(id=chantier_id).update(
+        number_hour_spent_on_project=F('number_hour_spent_on_project') + hours_delta,
+        cost_spent_on_project=F('cost_spent_on_project') + cost_delta,
+        va=F('devis_ht') - (F('cost_spent_on_project') + cost_delta),
+        revision=F('revision') + 1,
+        updated_at=timezone.now(),
+    )
 
 
 def update_chantier_aggregates(chantier_id):
     """
     Update chantier aggregates (hours spent and cost spent) from all Planning entries.
     
-    This function:
-    - Sums all hours from Planning entries for the chantier
-    - Sums all cout_planning values from Planning entries
-    - Updates the chantier using queryset.update() to avoid recursive saves
+    This is the full recompute used as a repair path and by coalesced/bulk
+    writes and deletes; autocommit Planning saves go through apply_chantier_delta().
+    
+    Everything happens in one UPDATE ... WHERE id = statement:
+    - hours and cost are summed from Planning by correlated subqueries
+    - VA is devis_ht - cost, computed in the same statement
+    - Chantiers.save() is bypassed, so no full_clean() (gdrive_urls URL checks,
+      chef user_type lookup) or derived-field recomputation runs on this hot path
+    """
+    slots = Planning.objects.filter(chantier_id=OuterRef('pk')).order_by().values('chantier_id')
+    total_minutes = Subquery(
+        slots.annotate(total=Sum('duration_minutes')).values('total'),
+        output_field=IntegerField(),
+    )
+    total_cost = Coalesce(
+        Subquery(
+            slots.annotate(total=Sum('cout_planning')).values('total'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        Value(Decimal('0')),
+    )
+    
+    # Minutes are summed as integers: cast before dividing so no backend truncates
+    Chantiers.objects.filter(id=chantier_id).update(
+        number_hour_spent_on_project=Cast(
+            Coalesce(total_minutes, Value(0)), FloatField()
+        ) / Value(60.0),
+        cost_spent_on_project=total_cost,
+        va=F('devis_ht') - total_cost,
+        revision=F('revision') + 1,
+        updated_at=timezone.now(),
+    )
+
+# Per-thread bookkeeping for coalesced and suspended Planning maintenance
+_maintenance = threading.local()
+
+
+def _maintenance_state():
+    if not hasattr(_maintenance, 'pending_chantiers'):
+        _maintenance.pending_chantiers = set()
+        _maintenance.suspended = 0
+        _maintenance.deferred_chantiers = set()
+        _maintenance.deferred_user_days = set()
+        _maintenance.deferred_rollup_keys = set()
+    return _maintenance
+
+
+def schedule_chantier_recompute(*chantier_ids):
+    """
+    Mark chantiers dirty and recompute them once when the transaction commits.
+    
+    IDs are deduplicated across the whole transaction, so writing N slots of the
+    same chantier costs one update_chantier_aggregates() call. Outside a
+    transaction the recompute runs immediately.
+    """
+    state = _maintenance_state()
+    chantier_ids = {chantier_id for chantier_id in chantier_ids if chantier_id}
+    if not chantier_ids:
+        return
+    
+    if state.suspended:
+        state.deferred_chantiers |= chantier_ids
+        return
+    
+    state.pending_chantiers |= chantier_ids
+    # Registered on every call: if a savepoint rolls back and drops a callback, a
+    # later one still flushes the shared set (recomputing is idempotent)
+    transaction.on_commit(_flush_chantier_recomputes)
+
+
+def _flush_chantier_recomputes():
+    state = _maintenance_state()
+    chantier_ids, state.pending_chantiers = state.pending_chantiers, set()
+    for chantier_id in sorted(chantier_ids):
+        update_chantier_aggregates(chantier_id)
+
+
+def planning_signals_suspended():
+    """Return True inside suspend_planning_signals()"""
+    return bool(_maintenance_state().suspended)
+
+
+def defer_planning_maintenance(user_days=(), chantier_ids=(), rollup_keys=()):
+    """Record user-days, chantiers and daily rollups to rebuild when suspend_planning_signals() exits"""
+    state = _maintenance_state()
+    state.deferred_user_days |= {tuple(user_day) for user_day in user_days if user_day}
+    state.deferred_chantiers |= {chantier_id for chantier_id in chantier_ids if chantier_id}
+    state.deferred_rollup_keys |= {tuple(key) for key in rollup_keys if key}
+
+
+@contextmanager
+def suspend_planning_signals():
+    """
+    Suspend per-row Planning signal work for bulk importers and management commands.
+    
+    Inside the block, Planning saves and deletes only record the user-days and
+    chantiers they touch. When the outermost block exits, the occupancy bitmaps,
+    daily rollups and chantier aggregates are rebuilt once for everything that
+    was touched.
+    
+        with suspend_planning_signals():
+            for row in rows:
+                Planning.objects.create(**row)
+    
+    Overlap validation inside the block reads the bitmaps as they were on entry,
+    so importers must not rely on it to catch overlaps within their own batch.
+    """
+    state = _maintenance_state()
+    state.suspended += 1
+    try:
+        yield
+    finally:
+        state.suspended -= 1
+        if not state.suspended:
+            user_days, state.deferred_user_days = state.deferred_user_days, set()
+            chantier_ids, state.deferred_chantiers = state.deferred_chantiers, set()
+            rollup_keys, state.deferred_rollup_keys = state.deferred_rollup_keys, set()
+            PlanningOccupancy.rebuild_many(user_days)
+            PlanningDailyRollup.rebuild_many(rollup_keys)
+            for chantier_id in sorted(chantier_ids):
+                update_chantier_aggregates(chantier_id)
+            if user_days:
+                publish_planning_event('resync', dates=[day for _, day in user_days])
+
+
+# Upper bound on the number of slots a single bulk request may generate
+BULK_PLANNING_MAX_SLOTS = 2000
+
+
+def bulk_create_plannings(chantier, users, date_from, date_to, weekdays, start_hour, end_hour):
+    """
+    Create one Planning per (user, day) over a date range in a single batch.
+    
+    - weekdays is an iterable of ISO weekday indexes (0 = lundi ... 6 = dimanche)
+    - users are deduplicated by id
+    - Overlaps are detected for the whole batch from one read of the occupancy bitmaps,
+      plus the slots already accepted in the batch
+    - Conflicting (user, day) pairs are reported and skipped, the others are inserted
+      with bulk_create() and the chantier aggregates are recomputed once
+    
+    Returns a dict with the created Planning objects and the list of conflicts.
+    Raises ValidationError when the request itself is invalid (hours, range, size).
+    """
+    allowed_minutes = [0, 15, 30, 45]
+    errors = {}
+    if start_hour.minute not in allowed_minutes:
+        errors['start_hour'] = "L'heure de début doit être un multiple de 15 minutes (00, 15, 30, 45)"
+    if end_hour.minute not in allowed_minutes:
+        errors['end_hour'] = "L'heure de fin doit être un multiple de 15 minutes (00, 15, 30, 45)"
+    if end_hour <= start_hour:
+        errors['end_hour'] = "L'heure de fin doit être postérieure à l'heure de début"
+    if date_to < date_from:
+        errors['date_to'] = "La date de fin ne peut pas être antérieure à la date de début"
+    if errors:
+        raise ValidationError(errors)
+    
+    weekdays = set(weekdays)
+    days = []
+    current = date_from
+    while current <= date_to:
+        if current.weekday() in weekdays:
+            days.append(current)
+        current += timedelta(days=1)
+    
+    # A user listed twice would break the (user, date, start_hour, end_hour) unique constraint
+    users = list({user.id: user for user in users}.values())
+    if len(days) * len(users) > BULK_PLANNING_MAX_SLOTS:
+        raise ValidationError(
+            f"Trop de créneaux demandés (maximum {BULK_PLANNING_MAX_SLOTS} par requête)"
+        )
+    
+    # One read of the occupancy bitmaps for every (user, day) of the batch
+    wanted = slot_mask(start_hour, end_hour)
+    masks = PlanningOccupancy.get_masks([user.id for user in users], date_from, date_to)
+    
+    # Hourly rates of every user of the batch, resolved from one query
+    rate_for = HourlyRate.resolver(users)
+    
+    to_create = []
+    new_masks = {}
+    conflicts = []
+    for user in users:
+        for day in days:
+            occupied = new_masks.get((user.id, day), masks.get((user.id, day), 0))
+            if occupied & wanted:
+                conflicts.append({
+                    'user_id': user.id,
+                    'date': day.strftime('%Y-%m-%d'),
+                    'error': "Conflit de planning détecté pour cet employé.",
+                })
+                continue
+            
+            planning = Planning(
+                user=user,
+                chantier=chantier,
+                date=day,
+                start_hour=start_hour,
+                end_hour=end_hour,
+            )
+            planning._compute_duration_minutes()
+            planning._compute_cout_planning(rate=rate_for(user, day) or 0)
+            to_create.append(planning)
+            new_masks[(user.id, day)] = occupied | wanted
+    
+    with transaction.atomic():
+        created = Planning.objects.bulk_create(to_create)
+        # bulk_create() does not send post_save, so maintain derived data once here
+        if created:
+            PlanningOccupancy.set_masks(new_masks)
+            PlanningDailyRollup.rebuild_many(
+                (planning.date, chantier.id, planning.user_id) for planning in created
+            )
+            schedule_chantier_recompute(chantier.id)
+            # One resync for the batch instead of an event per slot
+            publish_planning_event('resync', dates=[planning.date for planning in created])
+    
+    return {'created': created, 'conflicts': conflicts}
+
+
+def reprice_user_plannings(user, date_from=None, date_to=None):
     """
-    plannings = Planning.objects.filter(chantier_id=chantier_id)
+    Recompute cout_planning of a user's Plannings dated in [date_from, date_to).
     
-    total_hours = Decimal('0')
-    total_cost = Decimal('0')
+    Within one HourlyRate period the cost only depends on the slot duration, so
+    the cost of each distinct duration is computed in Python with the same rule
+    and rounding as Planning._compute_cout_planning (a full 08:00-17:00 day bills
+    8 hours). Each rate period overlapping the window is then rewritten with one
+    UPDATE ... CASE, and each affected chantier is recomputed once.
+    """
+    window_filters = {'user_id': user.pk}
+    if date_from is not None:
+        window_filters['date__gte'] = date_from
+    if date_to is not None:
+        window_filters['date__lt'] = date_to
+    window = Planning.objects.filter(**window_filters)
     
-    for p in plannings:
-        # Calculate hours using the same logic as Planning._compute_cout_planning
-        start = datetime.combine(p.date, p.start_hour)
-        end = datetime.combine(p.date, p.end_hour)
-        if end < start:
-            end += timedelta(days=1)
+    with transaction.atomic():
+        chantier_ids = list(window.values_list('chantier_id', flat=True).distinct())
+        if not chantier_ids:
+            return []
         
-        delta = end - start
-        hours = Decimal(str(delta.total_seconds() / 3600.0))
-        total_hours += hours
+        for start, end, rate in HourlyRate.periods(user):
+            plannings = window
+            if start is not None:
+                plannings = plannings.filter(date__gte=start)
+            if end is not None:
+                plannings = plannings.filter(date__lt=end)
+            _reprice_period(plannings, Decimal(str(rate)) if rate else Decimal('0'))
         
-        # Sum cout_planning (already computed by Planning.save())
-        total_cost += p.cout_planning or Decimal('0')
+        PlanningDailyRollup.rebuild(**window_filters)
+        schedule_chantier_recompute(*chantier_ids)
+        # Only costs changed: let open grids refresh through a delta sync
+        publish_planning_event('resync')
     
-    # Update the chantier via save() to trigger automatic VA recalculation
-    # This ensures va is recalculated when cost_spent_on_project changes
-    try:
-        chantier = Chantiers.objects.get(id=chantier_id)
-        chantier.number_hour_spent_on_project = total_hours
-        chantier.cost_spent_on_project = total_cost
-        # save() will automatically recalculate va via _compute_va()
-        chantier.save()
-    except Chantiers.DoesNotExist:
-        pass
+    return chantier_ids
+
 
+def _reprice_period(plannings, rate):
+    """Rewrite cout_planning of plannings billed at a single hourly rate"""
+    def cost_for(hours):
+        return (hours * rate).quantize(Decimal('0.01'))
+    
+    durations = list(plannings.values_list('duration_minutes', flat=True).distinct())
+    if not durations:
+        return
+    
+    whens = [
+        When(start_hour=time(8, 0), end_hour=time(17, 0), then=Value(cost_for(Decimal('8.0'))))
+    ] + [
+        When(duration_minutes=minutes, then=Value(cost_for(minutes_to_hours(minutes))))
+        for minutes in durations
+    ]
+    plannings.update(
+        cout_planning=Case(
+            *whens,
+            default=F('cout_planning'),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def record_hourly_rate_change(user, previous_rate):
+    """
+    Record a change of User.cout_h as a new HourlyRate effective today.
+    
+    Past slots keep the rate that applied to them: the first time a user's rate
+    changes, the previous rate is stored as a baseline entry covering their
+    history. Saving the HourlyRate reprices the slots from today onward.
+    """
+    today = timezone.localdate()
+    if previous_rate is not None and not user.hourly_rates.exists():
+        first_day = Planning.objects.filter(user=user).aggregate(first=Min('date'))['first']
+        baseline = min(filter(None, [first_day, timezone.localtime(user.date_joined).date() if user.date_joined else None, today]))
+        if baseline >= today:
+            baseline = today - timedelta(days=1)
+        # The slots already carry the previous rate: the baseline needs no repricing
+        baseline_entry = HourlyRate(user=user, rate=previous_rate, effective_from=baseline)
+        baseline_entry._skip_repricing = True
+        baseline_entry.save()
+    
+    rate_entry, created = HourlyRate.objects.get_or_create(
+        user=user, effective_from=today,
+        defaults={'rate': user.cout_h or Decimal('0')}
+    )
+    if not created:
+        rate_entry.rate = user.cout_h or Decimal('0')
+        rate_entry.save()
+    return rate_entry
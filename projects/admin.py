@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Chantiers
+from .models import ChantierForecast, Chantiers, GeocodedAddress
 
 
 @admin.register(Chantiers)
@@ -32,3 +32,19 @@ class ChantiersAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(GeocodedAddress)
+class GeocodedAddressAdmin(admin.ModelAdmin):
+    list_display = ['normalized_address', 'latitude', 'longitude', 'score', 'provider', 'created_at']
+    list_filter = ['provider']
+    search_fields = ['normalized_address']
+    readonly_fields = ['created_at']
+
+
+@admin.register(ChantierForecast)
+class ChantierForecastAdmin(admin.ModelAdmin):
+    list_display = ['chantier', 'completion_date', 'cost_at_completion', 'final_va', 'final_va_percent', 'below_threshold', 'computed_at']
+    list_filter = ['below_threshold']
+    search_fields = ['chantier__name_chantier']
+    readonly_fields = [field.name for field in ChantierForecast._meta.fields]
@@ -0,0 +1,196 @@
+"""
+Portfolio profitability cube: devis HT, cost and VA sliced across chantiers.
+
+The cube keeps one entry per chantier in NumPy arrays: a dictionary code per
+dimension (chef, ville, client, month) and the devis, cost and VA measures.
+travaux_type is multi-valued, so it is a boolean chantier x type matrix; a
+chantier with several types counts in each of them when sliced by travaux.
+
+Slicing is vectorized: filters are np.isin masks, groups are np.unique keys
+and totals are np.bincount sums, so any slice of years of history answers
+without touching the database. Like planning.distances.DistanceMatrix, the
+cube lives in the process and refreshes incrementally: each access re-reads
+only the chantiers whose updated_at moved since the last sync (every aggregate
+and geocoding write bumps it); deletions force a rebuild.
+"""
+import threading
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from accounts.models import User
+from .models import Chantiers
+
+
+CUBE_DIMENSIONS = ('chef', 'ville', 'client', 'month', 'travaux')
+
+# Single-valued dimensions, encoded as one code per chantier
+_CODED_DIMENSIONS = ('chef', 'ville', 'client', 'month')
+
+CUBE_FIELDS = (
+    'id', 'chef_chantier_id', 'ville_chantier', 'client_final_type', 'date_debut_chantier',
+    'travaux_type', 'devis_ht', 'cost_spent_on_project', 'va',
+)
+
+# Re-read rows touched slightly before the watermark, for transactions committing late
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def _dimension_values(row):
+    _, chef_id, ville, client, start, _, _, _, _ = row
+    return {
+        'chef': chef_id,
+        'ville': (ville or '').strip() or None,
+        'client': client or None,
+        'month': start.strftime('%Y-%m') if start else None,
+    }
+
+
+def _travaux_values(row):
+    travaux = row[5]
+    if not isinstance(travaux, list) or not travaux:
+        return [None]
+    return sorted({str(value) for value in travaux})
+
+
+class ProfitabilityCube:
+    """Incrementally maintained chantier profitability cube (see module docstring)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._reset()
+
+    def _reset(self):
+        self.index = {}
+        self.values = {dimension: [] for dimension in CUBE_DIMENSIONS}
+        self._codes_of = {dimension: {} for dimension in CUBE_DIMENSIONS}
+        self.codes = {dimension: np.empty(0, dtype=np.int32) for dimension in _CODED_DIMENSIONS}
+        self.travaux = np.zeros((0, 0), dtype=bool)
+        self.measures = np.empty((0, 3))
+
+    def _code(self, dimension, value):
+        codes = self._codes_of[dimension]
+        if value not in codes:
+            codes[value] = len(self.values[dimension])
+            self.values[dimension].append(value)
+        return codes[value]
+
+    def _write(self, positions, rows):
+        """Store rows at positions (arrays already sized)"""
+        for position, row in zip(positions, rows):
+            for dimension, value in _dimension_values(row).items():
+                self.codes[dimension][position] = self._code(dimension, value)
+            types = [self._code('travaux', value) for value in _travaux_values(row)]
+            if len(self.values['travaux']) > self.travaux.shape[1]:
+                extra = len(self.values['travaux']) - self.travaux.shape[1]
+                self.travaux = np.hstack([self.travaux, np.zeros((len(self.travaux), extra), dtype=bool)])
+            self.travaux[position] = False
+            self.travaux[position, types] = True
+            self.measures[position] = [float(row[6] or 0), float(row[7] or 0), float(row[8] or 0)]
+
+    def _grow(self, count):
+        for dimension in _CODED_DIMENSIONS:
+            self.codes[dimension] = np.concatenate([self.codes[dimension], np.zeros(count, dtype=np.int32)])
+        self.travaux = np.vstack([self.travaux, np.zeros((count, self.travaux.shape[1]), dtype=bool)])
+        self.measures = np.vstack([self.measures, np.zeros((count, 3))])
+
+    def _rebuild(self):
+        self._reset()
+        rows = list(Chantiers.objects.order_by('id').values_list(*CUBE_FIELDS).iterator())
+        self.index = {row[0]: position for position, row in enumerate(rows)}
+        self._grow(len(rows))
+        self._write(range(len(rows)), rows)
+
+    def _apply_changes(self, since):
+        """Rewrite the chantiers changed since the watermark; False when a rebuild is needed"""
+        changed = list(Chantiers.objects.filter(updated_at__gte=since).values_list(*CUBE_FIELDS))
+        new_ids = [row[0] for row in changed if row[0] not in self.index]
+        if new_ids:
+            start = len(self.index)
+            self.index.update({chantier_id: start + offset for offset, chantier_id in enumerate(new_ids)})
+            self._grow(len(new_ids))
+        self._write([self.index[row[0]] for row in changed], changed)
+
+        # Deleted chantiers are only visible as a count mismatch
+        return Chantiers.objects.count() == len(self.index)
+
+    def sync(self):
+        """Bring the cube up to date with the database"""
+        with self._lock:
+            now = timezone.now()
+            if self._synced_at is None or not self._apply_changes(self._synced_at - SYNC_OVERLAP):
+                self._rebuild()
+            self._synced_at = now
+
+    def _filter_mask(self, filters):
+        mask = np.ones(len(self.index), dtype=bool)
+        for dimension, wanted in (filters or {}).items():
+            codes = [self._codes_of[dimension][value] for value in wanted if value in self._codes_of[dimension]]
+            if dimension == 'travaux':
+                mask &= self.travaux[:, codes].any(axis=1)
+            else:
+                mask &= np.isin(self.codes[dimension], codes)
+        return mask
+
+    def slice(self, group_by=(), filters=None):
+        """
+        Totals of the chantiers matching filters, per combination of group_by dimensions.
+
+        filters maps a dimension to the accepted values. Returns dicts with one
+        key per group_by dimension (raw values) plus count, devis, cost, va and
+        va_percent, largest VA first.
+        """
+        unknown = [dimension for dimension in list(group_by) + list(filters or {}) if dimension not in CUBE_DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Dimension inconnue : {', '.join(unknown)}")
+
+        self.sync()
+        with self._lock:
+            mask = self._filter_mask(filters)
+            if 'travaux' in group_by:
+                # One entry per (chantier, type) pair
+                rows, types = np.nonzero(self.travaux & mask[:, None])
+            else:
+                rows, types = np.flatnonzero(mask), None
+            columns = [types if dimension == 'travaux' else self.codes[dimension][rows] for dimension in group_by]
+
+            if columns:
+                keys, inverse = np.unique(np.stack(columns, axis=1), axis=0, return_inverse=True)
+                inverse = inverse.reshape(-1)
+            else:
+                keys, inverse = np.zeros((1, 0), dtype=np.int64), np.zeros(len(rows), dtype=np.int64)
+            count = np.bincount(inverse, minlength=len(keys))
+            totals = [np.bincount(inverse, weights=self.measures[rows, m], minlength=len(keys)) for m in range(3)]
+            values = {dimension: list(self.values[dimension]) for dimension in group_by}
+
+        cells = []
+        for k, key in enumerate(keys):
+            if not count[k]:
+                continue
+            devis, cost, va = (float(total[k]) for total in totals)
+            cell = {dimension: values[dimension][code] for dimension, code in zip(group_by, key)}
+            cell.update({
+                'count': int(count[k]),
+                'devis': round(devis, 2),
+                'cost': round(cost, 2),
+                'va': round(va, 2),
+                'va_percent': round(va / devis * 100, 1) if devis else None,
+            })
+            cells.append(cell)
+        return sorted(cells, key=lambda cell: -cell['va'])
+
+
+profitability_cube = ProfitabilityCube()
+
+
+def profitability(group_by=(), filters=None):
+    """Slice the shared cube and label chef cells with the chef's name"""
+    cells = profitability_cube.slice(group_by, filters)
+    if 'chef' in group_by:
+        chefs = User.objects.in_bulk({cell['chef'] for cell in cells if cell['chef']})
+        for cell in cells:
+            chef = chefs.get(cell['chef'])
+            cell['chef_name'] = chef.full_name if chef else 'Sans chef'
+    return cells
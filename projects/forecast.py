@@ -0,0 +1,167 @@
+"""
+Burn-rate forecasting of active chantiers.
+
+forecast_chantiers() projects every active chantier (avancement < 100) in one
+vectorized batch:
+- the planned hours and cost of the last FORECAST_WINDOW_DAYS are read from
+  the daily rollups in one GROUP BY and laid out as a chantier x day matrix;
+- the burn rate is an exponentially weighted mean of that matrix, recent days
+  weighing more (half-life FORECAST_HALF_LIFE_DAYS);
+- hours at completion follow the reported progress (hours so far / avancement)
+  and fall back to number_hour_planned until progress is reported;
+- the remaining hours at the burn rate give the completion date (None when it
+  falls beyond FORECAST_HORIZON_DAYS), and at the observed cost per hour the
+  cost at completion and the final VA.
+
+Results are stored in ChantierForecast with one upsert, so pages read a
+snapshot. Run it nightly with the forecast_chantiers command.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from planning.models import PlanningDailyRollup
+from .models import ChantierForecast, Chantiers, VA_THRESHOLD_PERCENT
+
+
+FORECAST_WINDOW_DAYS = 28
+FORECAST_HALF_LIFE_DAYS = 7
+
+# Completion dates further out than this are not meaningful (and may overflow date)
+FORECAST_HORIZON_DAYS = 3650
+
+FORECAST_FIELDS = (
+    'id', 'devis_ht', 'number_hour_planned', 'number_hour_spent_on_project',
+    'cost_spent_on_project', 'avancement_chantier',
+)
+
+
+def _burn_window(positions, window_start, window_days):
+    """Return (hours, cost) chantier x day matrices of the active chantiers' recent planning"""
+    hours = np.zeros((len(positions), window_days))
+    cost = np.zeros((len(positions), window_days))
+    rows = (
+        PlanningDailyRollup.objects
+        .filter(
+            chantier__avancement_chantier__lt=100,
+            date__gte=window_start,
+            date__lt=window_start + timedelta(days=window_days),
+        )
+        .order_by()
+        .values('chantier_id', 'date')
+        .annotate(total_minutes=Sum('minutes'), total_cost=Sum('cost'))
+        .values_list('chantier_id', 'date', 'total_minutes', 'total_cost')
+    )
+    cells = [
+        (positions[chantier_id], (day - window_start).days, minutes or 0, float(total_cost or 0))
+        for chantier_id, day, minutes, total_cost in rows
+        if chantier_id in positions
+    ]
+    if cells:
+        row_index, column_index, minutes, costs = (np.array(values) for values in zip(*cells))
+        hours[row_index, column_index] = minutes / 60.0
+        cost[row_index, column_index] = costs
+    return hours, cost
+
+
+def compute_forecasts(rows, hours, cost, today):
+    """
+    Project chantiers given their FORECAST_FIELDS rows and recent hours/cost matrices.
+
+    Returns a dict of arrays, one entry per chantier.
+    """
+    devis, planned, spent_hours, spent_cost, progress = (
+        np.array([float(row[k] or 0) for row in rows]) for k in range(1, 6)
+    )
+    window_days = hours.shape[1]
+
+    # Exponentially decaying weights, 1 for the most recent day
+    weights = 0.5 ** ((window_days - 1 - np.arange(window_days)) / FORECAST_HALF_LIFE_DAYS)
+    burn = hours @ weights / weights.sum()
+
+    window_hours, window_cost = hours.sum(axis=1), cost.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cost_per_hour = np.where(
+            window_hours > 0, window_cost / window_hours,
+            np.where(spent_hours > 0, spent_cost / spent_hours, 0.0),
+        )
+        at_completion = np.where(progress > 0, spent_hours / (progress / 100.0), planned)
+        at_completion = np.maximum(at_completion, spent_hours)
+        remaining = at_completion - spent_hours
+        days_left = np.where(remaining <= 0, 0.0, np.where(burn > 0, np.ceil(remaining / burn), np.nan))
+        days_left = np.where(days_left > FORECAST_HORIZON_DAYS, np.nan, days_left)
+        cost_at_completion = spent_cost + remaining * cost_per_hour
+        final_va = devis - cost_at_completion
+        final_va_percent = np.where(devis > 0, final_va / devis * 100.0, np.nan)
+
+    return {
+        'burn': burn,
+        'cost_per_hour': cost_per_hour,
+        'hours_at_completion': at_completion,
+        'completion_date': [
+            None if np.isnan(days) else today + timedelta(days=int(days)) for days in days_left
+        ],
+        'cost_at_completion': cost_at_completion,
+        'final_va': final_va,
+        'final_va_percent': final_va_percent,
+        'below_threshold': final_va_percent < float(VA_THRESHOLD_PERCENT),
+    }
+
+
+def _money(value):
+    return Decimal(str(round(float(value), 2)))
+
+
+def forecast_chantiers(today=None):
+    """
+    Recompute and store the forecast of every active chantier in one batch.
+
+    Forecasts of chantiers completed since the last run are removed. Returns
+    the stored ChantierForecast objects.
+    """
+    today = today or date.today()
+    computed_at = timezone.now()
+    rows = list(Chantiers.objects.filter(avancement_chantier__lt=100).order_by('id').values_list(*FORECAST_FIELDS))
+    positions = {row[0]: position for position, row in enumerate(rows)}
+
+    window_start = today - timedelta(days=FORECAST_WINDOW_DAYS)
+    hours, cost = _burn_window(positions, window_start, FORECAST_WINDOW_DAYS)
+    projection = compute_forecasts(rows, hours, cost, today)
+
+    forecasts = [
+        ChantierForecast(
+            chantier_id=row[0],
+            burn_hours_per_day=round(float(projection['burn'][i]), 3),
+            cost_per_hour=round(float(projection['cost_per_hour'][i]), 2),
+            hours_at_completion=round(float(projection['hours_at_completion'][i]), 2),
+            completion_date=projection['completion_date'][i],
+            cost_at_completion=_money(projection['cost_at_completion'][i]),
+            final_va=_money(projection['final_va'][i]),
+            final_va_percent=(
+                None if np.isnan(projection['final_va_percent'][i])
+                else round(float(projection['final_va_percent'][i]), 1)
+            ),
+            below_threshold=bool(projection['below_threshold'][i]),
+            computed_at=computed_at,
+        )
+        for i, row in enumerate(rows)
+    ]
+
+    with transaction.atomic():
+        ChantierForecast.objects.bulk_create(
+            forecasts,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['chantier'],
+            update_fields=[
+                'burn_hours_per_day', 'cost_per_hour', 'hours_at_completion', 'completion_date',
+                'cost_at_completion', 'final_va', 'final_va_percent', 'below_threshold', 'computed_at',
+            ],
+        )
+        ChantierForecast.objects.filter(computed_at__lt=computed_at).delete()
+
+    return forecasts
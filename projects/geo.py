@@ -0,0 +1,153 @@
+"""
+Map tiles and server-side clustering of geocoded chantiers.
+
+Tiles follow the Web Mercator (slippy map) scheme used by Leaflet and OSM, so
+a (zoom, x, y) key is stable across viewports and can be cached. Below
+CLUSTER_MAX_ZOOM each tile is cut into a CLUSTER_GRID x CLUSTER_GRID grid and
+chantiers are counted per cell by the database.
+"""
+import math
+
+from django.db.models import Avg, Count, FloatField, IntegerField, Max, Min, Value
+from django.db.models.functions import Cast, Floor, Least
+
+from .models import Chantiers
+
+
+CLUSTER_MAX_ZOOM = 13
+CLUSTER_GRID = 8
+MAX_ZOOM = 19
+MAX_LATITUDE = 85.0511287798
+
+
+def lng_to_tile_x(lng, zoom):
+    return int((lng + 180.0) / 360.0 * (1 << zoom))
+
+
+def lat_to_tile_y(lat, zoom):
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    lat_rad = math.radians(lat)
+    return int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * (1 << zoom))
+
+
+def _tile_count(west, south, east, north, zoom):
+    return (
+        (lng_to_tile_x(min(east, 180.0), zoom) - lng_to_tile_x(max(west, -180.0), zoom) + 1)
+        * (lat_to_tile_y(south, zoom) - lat_to_tile_y(north, zoom) + 1)
+    )
+
+
+def tile_bounds(zoom, x, y):
+    """Return (west, south, east, north) of a tile in degrees"""
+    n = 1 << zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def tiles_for_bbox(west, south, east, north, zoom, max_tiles=None):
+    """
+    Return the (zoom, x, y) keys of every tile covering a bounding box.
+
+    With max_tiles, coarser tiles are used until at most that many cover the box.
+    """
+    while max_tiles and zoom > 0 and _tile_count(west, south, east, north, zoom) > max_tiles:
+        zoom -= 1
+    last = (1 << zoom) - 1
+    x_min = max(0, min(lng_to_tile_x(west, zoom), last))
+    x_max = max(0, min(lng_to_tile_x(east, zoom), last))
+    y_min = max(0, min(lat_to_tile_y(north, zoom), last))
+    y_max = max(0, min(lat_to_tile_y(south, zoom), last))
+    return [(zoom, x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+
+
+def chantiers_extent():
+    """Return [[south, west], [north, east]] around every geocoded chantier, or None"""
+    extent = Chantiers.objects.filter(latitude__isnull=False, longitude__isnull=False).aggregate(
+        south=Min('latitude'), west=Min('longitude'), north=Max('latitude'), east=Max('longitude'),
+    )
+    if extent['south'] is None:
+        return None
+    return [[float(extent['south']), float(extent['west'])], [float(extent['north']), float(extent['east'])]]
+
+
+def _point_feature(chantier):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [float(chantier['longitude']), float(chantier['latitude'])]},
+        'properties': {
+            'id': chantier['id'],
+            'name': chantier['name_chantier'] or 'Sans nom',
+            'adresse': chantier['adresse_chantier'] or '',
+            'cp_ville': chantier['cp_ville_chantier'] or '',
+        },
+    }
+
+
+def _cluster_feature(cell):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [cell['lng'], cell['lat']]},
+        'properties': {'cluster': True, 'count': cell['count']},
+    }
+
+
+def _cell_index(field, origin, size):
+    """Grid cell of field along one axis: floored on every backend, clamped to the last cell"""
+    return Cast(
+        Least(Floor((Cast(field, FloatField()) - origin) / size), Value(CLUSTER_GRID - 1.0)),
+        IntegerField(),
+    )
+
+
+def tile_features(zoom, x, y, cluster=None):
+    """
+    Return the GeoJSON features of one tile: chantiers, or grid clusters.
+
+    cluster defaults to zoom < CLUSTER_MAX_ZOOM. A cell holding a single
+    chantier is returned as that chantier.
+    """
+    west, south, east, north = tile_bounds(zoom, x, y)
+    # Half-open bounds so a chantier on a tile edge belongs to exactly one tile
+    chantiers = Chantiers.objects.filter(
+        latitude__gte=south, latitude__lt=north,
+        longitude__gte=west, longitude__lt=east,
+    ).order_by()
+    point_fields = ('id', 'name_chantier', 'adresse_chantier', 'cp_ville_chantier', 'latitude', 'longitude')
+
+    if cluster is None:
+        cluster = zoom < CLUSTER_MAX_ZOOM
+    if not cluster:
+        return [_point_feature(chantier) for chantier in chantiers.order_by('id').values(*point_fields)]
+
+    cell_width = (east - west) / CLUSTER_GRID
+    cell_height = (north - south) / CLUSTER_GRID
+    cells = (
+        chantiers
+        .annotate(
+            cell_x=_cell_index('longitude', west, cell_width),
+            cell_y=_cell_index('latitude', south, cell_height),
+        )
+        .values('cell_x', 'cell_y')
+        .annotate(
+            count=Count('id'),
+            lat=Avg(Cast('latitude', FloatField())),
+            lng=Avg(Cast('longitude', FloatField())),
+            first_id=Min('id'),
+        )
+        .order_by('cell_y', 'cell_x')
+    )
+    cells = list(cells)
+
+    single_ids = [cell['first_id'] for cell in cells if cell['count'] == 1]
+    singles = {
+        chantier['id']: chantier
+        for chantier in Chantiers.objects.filter(id__in=single_ids).values(*point_fields)
+    } if single_ids else {}
+
+    return [
+        _point_feature(singles[cell['first_id']]) if cell['count'] == 1 else _cluster_feature(cell)
+        for cell in cells
+    ]
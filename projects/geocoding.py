@@ -0,0 +1,239 @@
+"""
+Batch geocoding of chantier addresses.
+
+geocode_chantiers() resolves every chantier without coordinates:
+- addresses are normalized (case, accents, punctuation, common abbreviations)
+  so the same place written twice is looked up once;
+- normalized addresses already in GeocodedAddress cost nothing, the rest are
+  sent to the provider in batches and stored, found or not;
+- coordinates are written back with one bulk UPDATE per batch.
+
+The provider is pluggable through the GEOCODING_PROVIDER setting (dotted path,
+BANProvider by default). CSVProvider resolves addresses offline from a BAN
+extract (GEOCODING_CSV_PATH), for tests and air-gapped installs.
+"""
+import csv
+import io
+import re
+import unicodedata
+from decimal import Decimal
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Chantiers, GeocodedAddress
+
+
+GEOCODING_BATCH_SIZE = 500
+
+_ABBREVIATIONS = {
+    'av': 'avenue', 'ave': 'avenue', 'bd': 'boulevard', 'bld': 'boulevard', 'bvd': 'boulevard',
+    'ch': 'chemin', 'chem': 'chemin', 'imp': 'impasse', 'pl': 'place', 'r': 'rue', 'rte': 'route',
+    'st': 'saint', 'ste': 'sainte', 'all': 'allee', 'fg': 'faubourg', 'sq': 'square',
+}
+_POSTCODE_RE = re.compile(r'\b(\d{5})\b')
+
+
+class GeocodingError(Exception):
+    """The provider could not be reached or answered with an error"""
+
+
+def normalize_address(adresse, cp_ville=''):
+    """Return the cache key of an address: lowercase ASCII words, abbreviations expanded"""
+    text = unicodedata.normalize('NFKD', f'{adresse or ""} {cp_ville or ""}')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    words = re.findall(r'[a-z0-9]+', text)
+    return ' '.join(_ABBREVIATIONS.get(word, word) for word in words)[:255]
+
+
+def split_cp_ville(cp_ville):
+    """Split '75001 Paris' into ('75001', 'Paris'); the postcode is '' when absent"""
+    cp_ville = (cp_ville or '').strip()
+    match = _POSTCODE_RE.search(cp_ville)
+    if not match:
+        return '', cp_ville
+    return match.group(1), (cp_ville[:match.start()] + cp_ville[match.end():]).strip()
+
+
+class GeocodingProvider:
+    """Base class: resolve many addresses in one call"""
+
+    name = 'base'
+
+    def geocode_batch(self, addresses):
+        """
+        Geocode {key: (adresse, cp_ville)}.
+
+        Return {key: (latitude, longitude, score)} for the addresses found;
+        missing keys were not found. Raise GeocodingError on transport errors.
+        """
+        raise NotImplementedError
+
+
+class BANProvider(GeocodingProvider):
+    """Base Adresse Nationale batch endpoint: one CSV upload per batch"""
+
+    name = 'ban'
+    url = 'https://api-adresse.data.gouv.fr/search/csv/'
+
+    def __init__(self, url=None, timeout=120, min_score=0.5):
+        self.url = url or getattr(settings, 'GEOCODING_BAN_URL', self.url)
+        self.timeout = timeout
+        self.min_score = min_score
+
+    def geocode_batch(self, addresses):
+        if not addresses:
+            return {}
+
+        upload = io.StringIO()
+        writer = csv.writer(upload)
+        writer.writerow(['key', 'adresse', 'postcode', 'city'])
+        for key, (adresse, cp_ville) in addresses.items():
+            postcode, city = split_cp_ville(cp_ville)
+            writer.writerow([key, adresse, postcode, city])
+
+        try:
+            response = requests.post(
+                self.url,
+                files={'data': ('adresses.csv', upload.getvalue().encode('utf-8'), 'text/csv')},
+                data=[('columns', 'adresse'), ('columns', 'city'), ('postcode', 'postcode')],
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise GeocodingError(str(e))
+
+        results = {}
+        for row in csv.DictReader(io.StringIO(response.content.decode('utf-8-sig'))):
+            try:
+                score = float(row.get('result_score') or 0)
+                latitude, longitude = Decimal(row['latitude']), Decimal(row['longitude'])
+            except (KeyError, ArithmeticError, ValueError):
+                continue
+            if score >= self.min_score:
+                results[row['key']] = (latitude, longitude, score)
+        return results
+
+
+class CSVProvider(GeocodingProvider):
+    """
+    Offline lookup in a BAN extract (adresses-XX.csv from adresse.data.gouv.fr).
+
+    The file is ';'-separated with numero, rep, nom_voie, code_postal,
+    nom_commune, lat and lon columns. Only exact normalized matches are found.
+    """
+
+    name = 'csv'
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'GEOCODING_CSV_PATH', None)
+        self._index = None
+
+    def _load(self):
+        if not self.path:
+            raise GeocodingError("GEOCODING_CSV_PATH n'est pas configuré.")
+        index = {}
+        try:
+            with open(self.path, newline='', encoding='utf-8-sig') as extract:
+                for row in csv.DictReader(extract, delimiter=';'):
+                    street = f"{row.get('numero', '')}{row.get('rep', '')} {row.get('nom_voie', '')}"
+                    key = normalize_address(street, f"{row.get('code_postal', '')} {row.get('nom_commune', '')}")
+                    index.setdefault(key, (Decimal(row['lat']), Decimal(row['lon']), 1.0))
+        except OSError as e:
+            raise GeocodingError(str(e))
+        return index
+
+    def geocode_batch(self, addresses):
+        if self._index is None:
+            self._index = self._load()
+        return {
+            key: self._index[normalize_address(adresse, cp_ville)]
+            for key, (adresse, cp_ville) in addresses.items()
+            if normalize_address(adresse, cp_ville) in self._index
+        }
+
+
+def get_provider(path=None):
+    """Instantiate the geocoding provider (GEOCODING_PROVIDER setting unless path is given)"""
+    path = path or getattr(settings, 'GEOCODING_PROVIDER', 'projects.geocoding.BANProvider')
+    return import_string(path)()
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def geocode_chantiers(chantiers=None, provider=None, batch_size=GEOCODING_BATCH_SIZE, retry_missing=False):
+    """
+    Fill latitude/longitude of chantiers (by default every one missing a coordinate).
+
+    Returns counts: chantiers considered, addresses served from the cache,
+    addresses sent to the provider, chantiers geocoded and chantiers not found.
+    """
+    if chantiers is None:
+        chantiers = Chantiers.objects.filter(Q(latitude__isnull=True) | Q(longitude__isnull=True))
+    provider = provider or get_provider()
+
+    # Chantiers sharing an address share one lookup
+    by_address = {}
+    raw_addresses = {}
+    for chantier_id, adresse, cp_ville in chantiers.values_list('id', 'adresse_chantier', 'cp_ville_chantier'):
+        key = normalize_address(adresse, cp_ville)
+        if not key:
+            continue
+        by_address.setdefault(key, []).append(chantier_id)
+        raw_addresses.setdefault(key, (adresse, cp_ville))
+
+    stats = {'chantiers': sum(len(ids) for ids in by_address.values()), 'cached': 0, 'requested': 0, 'geocoded': 0, 'not_found': 0}
+
+    for keys in _batches(list(by_address), batch_size):
+        known = {entry.normalized_address: entry for entry in GeocodedAddress.objects.filter(normalized_address__in=keys)}
+        to_request = [key for key in keys if key not in known or (retry_missing and not known[key].found)]
+        stats['cached'] += len(keys) - len(to_request)
+        stats['requested'] += len(to_request)
+
+        found = provider.geocode_batch({key: raw_addresses[key] for key in to_request}) if to_request else {}
+        entries = [
+            GeocodedAddress(
+                normalized_address=key,
+                latitude=found[key][0] if key in found else None,
+                longitude=found[key][1] if key in found else None,
+                score=found[key][2] if key in found else None,
+                provider=provider.name,
+            )
+            for key in to_request
+        ]
+
+        now = timezone.now()
+        updates = []
+        for key in keys:
+            if key in found:
+                latitude, longitude = found[key][:2]
+            elif key in known and known[key].found:
+                latitude, longitude = known[key].latitude, known[key].longitude
+            else:
+                stats['not_found'] += len(by_address[key])
+                continue
+            for chantier_id in by_address[key]:
+                # Bypasses save(): bump revision and updated_at by hand so caches and map tiles refresh
+                updates.append(Chantiers(
+                    id=chantier_id, latitude=round(Decimal(latitude), 6), longitude=round(Decimal(longitude), 6),
+                    revision=F('revision') + 1, updated_at=now,
+                ))
+
+        with transaction.atomic():
+            GeocodedAddress.objects.bulk_create(
+                entries,
+                update_conflicts=True,
+                unique_fields=['normalized_address'],
+                update_fields=['latitude', 'longitude', 'score', 'provider'],
+            )
+            Chantiers.objects.bulk_update(updates, ['latitude', 'longitude', 'revision', 'updated_at'])
+        stats['geocoded'] += len(updates)
+
+    return stats
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from projects.forecast import forecast_chantiers
+from projects.models import VA_THRESHOLD_PERCENT
+
+
+class Command(BaseCommand):
+    """Recompute the burn-rate forecasts of every active chantier (run nightly)"""
+    
+    help = "Projette la date d'achèvement, le coût final et la VA finale des chantiers actifs"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Date de référence au format AAAA-MM-JJ (aujourd'hui par défaut)")
+    
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("La date doit être au format AAAA-MM-JJ.")
+        
+        forecasts = forecast_chantiers(today)
+        
+        for forecast in forecasts:
+            if forecast.below_threshold:
+                self.stdout.write(self.style.WARNING(
+                    f"Chantier {forecast.chantier_id} : VA finale projetée {forecast.final_va_percent} % "
+                    f"(seuil {VA_THRESHOLD_PERCENT} %)"
+                ))
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(forecasts)} chantier(s) projeté(s), "
+            f"{sum(1 for forecast in forecasts if forecast.below_threshold)} sous le seuil de VA."
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from projects.geocoding import GEOCODING_BATCH_SIZE, GeocodingError, geocode_chantiers, get_provider
+
+
+class Command(BaseCommand):
+    """Fill missing chantier coordinates through the batch geocoding pipeline"""
+    
+    help = "Géocode les chantiers sans coordonnées, par lots, avec cache des adresses normalisées"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--provider',
+            help="Chemin du fournisseur (ex. projects.geocoding.CSVProvider), GEOCODING_PROVIDER par défaut"
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=GEOCODING_BATCH_SIZE,
+            help="Nombre d'adresses envoyées au fournisseur par lot"
+        )
+        parser.add_argument(
+            '--retry-missing',
+            action='store_true',
+            help="Renvoie au fournisseur les adresses précédemment introuvables"
+        )
+    
+    def handle(self, *args, **options):
+        try:
+            stats = geocode_chantiers(
+                provider=get_provider(options['provider']),
+                batch_size=options['batch_size'],
+                retry_missing=options['retry_missing'],
+            )
+        except GeocodingError as e:
+            raise CommandError(f"Géocodage interrompu : {e}")
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['geocoded']} chantier(s) géocodé(s) sur {stats['chantiers']} "
+            f"({stats['cached']} adresse(s) en cache, {stats['requested']} envoyée(s) au fournisseur, "
+            f"{stats['not_found']} chantier(s) introuvable(s))."
+        ))
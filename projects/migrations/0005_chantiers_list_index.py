@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-17 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_chantiers_va'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chantiers',
+            index=models.Index(fields=['-created_at', 'id'], name='chantiers_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.2.26 on 2026-10-17 13:40
+
+from django.db import migrations
+
+
+SQLITE_COLUMNS = 'name_chantier, adresse_chantier, cp_ville_chantier, ville_chantier, contact'
+
+SQLITE_FORWARD = [
+    f"CREATE VIRTUAL TABLE chantiers_fts USING fts5({SQLITE_COLUMNS}, "
+    f"content='chantiers', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER chantiers_fts_insert AFTER INSERT ON chantiers BEGIN "
+    f"INSERT INTO chantiers_fts(rowid, {SQLITE_COLUMNS}) VALUES (new.id, new.name_chantier, "
+    f"new.adresse_chantier, new.cp_ville_chantier, new.ville_chantier, new.contact); END",
+    f"CREATE TRIGGER chantiers_fts_delete AFTER DELETE ON chantiers BEGIN "
+    f"INSERT INTO chantiers_fts(chantiers_fts, rowid, {SQLITE_COLUMNS}) VALUES ('delete', old.id, "
+    f"old.name_chantier, old.adresse_chantier, old.cp_ville_chantier, old.ville_chantier, old.contact); END",
+    # Only the indexed columns: aggregate updates from planning writes must not touch the index
+    f"CREATE TRIGGER chantiers_fts_update AFTER UPDATE OF {SQLITE_COLUMNS} ON chantiers BEGIN "
+    f"INSERT INTO chantiers_fts(chantiers_fts, rowid, {SQLITE_COLUMNS}) VALUES ('delete', old.id, "
+    f"old.name_chantier, old.adresse_chantier, old.cp_ville_chantier, old.ville_chantier, old.contact); "
+    f"INSERT INTO chantiers_fts(rowid, {SQLITE_COLUMNS}) VALUES (new.id, new.name_chantier, "
+    f"new.adresse_chantier, new.cp_ville_chantier, new.ville_chantier, new.contact); END",
+    "INSERT INTO chantiers_fts(chantiers_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS chantiers_fts_update",
+    "DROP TRIGGER IF EXISTS chantiers_fts_delete",
+    "DROP TRIGGER IF EXISTS chantiers_fts_insert",
+    "DROP TABLE IF EXISTS chantiers_fts",
+]
+
+POSTGRES_DOCUMENT = (
+    "chantiers_unaccent(coalesce(name_chantier, '') || ' ' || coalesce(adresse_chantier, '') || ' ' || "
+    "coalesce(cp_ville_chantier, '') || ' ' || coalesce(ville_chantier, '') || ' ' || coalesce(contact, ''))"
+)
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # unaccent() is only STABLE; an IMMUTABLE wrapper with an explicit dictionary can be indexed
+    "CREATE OR REPLACE FUNCTION chantiers_unaccent(text) RETURNS text AS "
+    "$$ SELECT public.unaccent('public.unaccent', $1) $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT",
+    f"CREATE INDEX chantiers_search_tsv_idx ON chantiers USING gin (to_tsvector('simple', {POSTGRES_DOCUMENT}))",
+    f"CREATE INDEX chantiers_search_trgm_idx ON chantiers USING gin ({POSTGRES_DOCUMENT} gin_trgm_ops)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS chantiers_search_trgm_idx",
+    "DROP INDEX IF EXISTS chantiers_search_tsv_idx",
+    "DROP FUNCTION IF EXISTS chantiers_unaccent(text)",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_FORWARD)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_FORWARD)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_BACKWARD)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0005_chantiers_list_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
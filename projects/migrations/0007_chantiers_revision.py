@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-17 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_chantiers_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chantiers',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Incrémenté à chaque écriture du chantier ou de ses plannings (invalide les caches)'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-17 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0007_chantiers_revision'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chantiers',
+            index=models.Index(fields=['latitude', 'longitude'], name='chantiers_lat_lng_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.26 on 2026-10-17 13:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0009_geocoded_addresses'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChantierForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('burn_hours_per_day', models.FloatField(help_text='Heures planifiées par jour, moyenne récente pondérée')),
+                ('cost_per_hour', models.FloatField(help_text='Coût horaire moyen observé sur le chantier')),
+                ('hours_at_completion', models.FloatField(help_text="Heures totales estimées à l'achèvement")),
+                ('completion_date', models.DateField(blank=True, help_text="Date d'achèvement projetée (vide sans activité récente)", null=True)),
+                ('cost_at_completion', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('final_va', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('final_va_percent', models.FloatField(blank=True, null=True)),
+                ('below_threshold', models.BooleanField(db_index=True, default=False, help_text='VA finale projetée sous VA_THRESHOLD_PERCENT')),
+                ('computed_at', models.DateTimeField()),
+                ('chantier', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='forecast', to='projects.chantiers')),
+            ],
+            options={
+                'verbose_name': 'Prévision chantier',
+                'verbose_name_plural': 'Prévisions chantiers',
+                'db_table': 'chantier_forecasts',
+            },
+        ),
+    ]
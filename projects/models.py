@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import F
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.utils import timezone
@@ -6,6 +7,10 @@ from decimal import Decimal
 import math
 
 
+# A chantier is healthy while its VA stays at or above this share of the devis HT
+VA_THRESHOLD_PERCENT = Decimal('55')
+
+
 class Chantiers(models.Model):
     """Construction site/project model"""
     
@@ -104,6 +109,11 @@ class Chantiers(models.Model):
         default=0,
         help_text="Valeur ajoutée = Devis HT - Coût réel"
     )
+    revision = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Incrémenté à chaque écriture du chantier ou de ses plannings (invalide les caches)"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -112,6 +122,12 @@ class Chantiers(models.Model):
         verbose_name = 'Chantier'
         verbose_name_plural = 'Chantiers'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of list_chantiers
+            models.Index(fields=['-created_at', 'id'], name='chantiers_created_id_idx'),
+            # Viewport queries of the map
+            models.Index(fields=['latitude', 'longitude'], name='chantiers_lat_lng_idx'),
+        ]
     
     def clean(self):
         """Validate model data"""
@@ -201,7 +217,79 @@ class Chantiers(models.Model):
         self.number_hour_planned = self._compute_number_hour_planned()
         # Recompute VA
         self.va = self._compute_va()
+        bump_revision = not self._state.adding
+        if bump_revision:
+            # Incremented in SQL so a stale instance never reuses a revision
+            self.revision = F('revision') + 1
         super().save(*args, **kwargs)
+        if bump_revision:
+            self.refresh_from_db(fields=['revision'])
     
     def __str__(self):
         return self.name_chantier
+
+
+class GeocodedAddress(models.Model):
+    """
+    Persistent geocoding cache, keyed by normalized address.
+    
+    Addresses the provider could not resolve are kept with empty coordinates so
+    they are not sent again (see geocode_chantiers --retry-missing).
+    """
+    
+    normalized_address = models.CharField(max_length=255, unique=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    score = models.FloatField(null=True, blank=True, help_text="Score de confiance du fournisseur (0-1)")
+    provider = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'geocoded_addresses'
+        verbose_name = 'Adresse géocodée'
+        verbose_name_plural = 'Adresses géocodées'
+    
+    @property
+    def found(self):
+        return self.latitude is not None and self.longitude is not None
+    
+    def __str__(self):
+        return self.normalized_address
+
+
+class ChantierForecast(models.Model):
+    """
+    Burn-rate projection of an active chantier, refreshed in one batch
+    (see projects.forecast and the forecast_chantiers command).
+    """
+    
+    chantier = models.OneToOneField(
+        Chantiers,
+        on_delete=models.CASCADE,
+        related_name='forecast'
+    )
+    burn_hours_per_day = models.FloatField(help_text="Heures planifiées par jour, moyenne récente pondérée")
+    cost_per_hour = models.FloatField(help_text="Coût horaire moyen observé sur le chantier")
+    hours_at_completion = models.FloatField(help_text="Heures totales estimées à l'achèvement")
+    completion_date = models.DateField(
+        null=True,
+        blank=True,
+        help_text="Date d'achèvement projetée (vide sans activité récente)"
+    )
+    cost_at_completion = models.DecimalField(max_digits=12, decimal_places=2)
+    final_va = models.DecimalField(max_digits=12, decimal_places=2)
+    final_va_percent = models.FloatField(null=True, blank=True)
+    below_threshold = models.BooleanField(
+        default=False,
+        db_index=True,
+        help_text="VA finale projetée sous VA_THRESHOLD_PERCENT"
+    )
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'chantier_forecasts'
+        verbose_name = 'Prévision chantier'
+        verbose_name_plural = 'Prévisions chantiers'
+    
+    def __str__(self):
+        return f"Prévision {self.chantier_id} au {self.computed_at:%d/%m/%Y}"
@@ -0,0 +1,136 @@
+"""
+Full-text search over chantiers.
+
+The index is created by migration 0006 and depends on the database backend:
+- SQLite: an FTS5 table (chantiers_fts) kept in sync by triggers, with the
+  unicode61 tokenizer stripping diacritics, ranked with bm25().
+- PostgreSQL: GIN indexes on an unaccented tsvector and on trigrams of the same
+  text, ranked with ts_rank() plus trigram word similarity for typos.
+Other backends fall back to an unindexed icontains filter.
+
+SQLite drops a table's triggers whenever a migration rebuilds that table, so
+repair_sqlite_search_index() recreates them after every migrate.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+
+from .models import Chantiers
+
+
+SEARCH_FIELDS = ('name_chantier', 'adresse_chantier', 'cp_ville_chantier', 'ville_chantier', 'contact')
+SEARCH_MAX_RESULTS = 50
+
+# Words are letters and digits; everything else (quotes, operators, dashes) separates terms
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+SQLITE_COLUMNS = ', '.join(SEARCH_FIELDS)
+_SQLITE_OLD_ROW = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+_SQLITE_NEW_ROW = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+
+SQLITE_TRIGGERS = {
+    'chantiers_fts_insert': (
+        f"CREATE TRIGGER chantiers_fts_insert AFTER INSERT ON chantiers BEGIN "
+        f"INSERT INTO chantiers_fts(rowid, {SQLITE_COLUMNS}) VALUES (new.id, {_SQLITE_NEW_ROW}); END"
+    ),
+    'chantiers_fts_delete': (
+        f"CREATE TRIGGER chantiers_fts_delete AFTER DELETE ON chantiers BEGIN "
+        f"INSERT INTO chantiers_fts(chantiers_fts, rowid, {SQLITE_COLUMNS}) "
+        f"VALUES ('delete', old.id, {_SQLITE_OLD_ROW}); END"
+    ),
+    'chantiers_fts_update': (
+        f"CREATE TRIGGER chantiers_fts_update AFTER UPDATE OF {SQLITE_COLUMNS} ON chantiers BEGIN "
+        f"INSERT INTO chantiers_fts(chantiers_fts, rowid, {SQLITE_COLUMNS}) "
+        f"VALUES ('delete', old.id, {_SQLITE_OLD_ROW}); "
+        f"INSERT INTO chantiers_fts(rowid, {SQLITE_COLUMNS}) VALUES (new.id, {_SQLITE_NEW_ROW}); END"
+    ),
+}
+
+
+def repair_sqlite_search_index(using='default', **kwargs):
+    """post_migrate receiver: recreate missing FTS triggers and resync the index"""
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+            ['chantiers_fts%']
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if 'chantiers_fts' not in existing:
+            # Search migration not applied yet
+            return
+        missing = [name for name in SQLITE_TRIGGERS if name not in existing]
+        if not missing:
+            return
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        cursor.execute("INSERT INTO chantiers_fts(chantiers_fts) VALUES ('rebuild')")
+
+
+def search_terms(query):
+    """Split a user query into search terms"""
+    return _TERM_RE.findall(query or '')
+
+
+def search_chantiers(query, limit=SEARCH_MAX_RESULTS):
+    """
+    Return the ids of chantiers matching query, best match first.
+
+    Every term must match (prefix match, so "bord" finds "Bordeaux"), accents
+    and case are ignored.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(terms, limit)
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(terms, query, limit)
+    return _search_fallback(terms, limit)
+
+
+def _search_sqlite(terms, limit):
+    # Each term quoted so FTS5 never parses user input as operators
+    match = ' '.join(f'"{term}"*' for term in terms)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT rowid FROM chantiers_fts WHERE chantiers_fts MATCH %s '
+            'ORDER BY bm25(chantiers_fts, 10.0, 3.0, 5.0, 5.0, 3.0) LIMIT %s',
+            [match, limit]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+POSTGRES_DOCUMENT = (
+    "chantiers_unaccent(coalesce(name_chantier, '') || ' ' || coalesce(adresse_chantier, '') || ' ' || "
+    "coalesce(cp_ville_chantier, '') || ' ' || coalesce(ville_chantier, '') || ' ' || coalesce(contact, ''))"
+)
+
+
+def _search_postgresql(terms, query, limit):
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id FROM chantiers "
+            f"WHERE to_tsvector('simple', {POSTGRES_DOCUMENT}) @@ to_tsquery('simple', chantiers_unaccent(%s)) "
+            f"OR chantiers_unaccent(%s) <%% {POSTGRES_DOCUMENT} "
+            f"ORDER BY ts_rank(to_tsvector('simple', {POSTGRES_DOCUMENT}), to_tsquery('simple', chantiers_unaccent(%s))) "
+            f"+ word_similarity(chantiers_unaccent(%s), {POSTGRES_DOCUMENT}) DESC, id LIMIT %s",
+            [tsquery, query, tsquery, query, limit]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_fallback(terms, limit):
+    chantiers = Chantiers.objects.all()
+    for term in terms:
+        term_filter = Q()
+        for field in SEARCH_FIELDS:
+            term_filter |= Q(**{f'{field}__icontains': term})
+        chantiers = chantiers.filter(term_filter)
+    return list(chantiers.order_by('-created_at', 'id').values_list('id', flat=True)[:limit])
@@ -1,3 +1,550 @@
+import os
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from accounts.models import User
+from planning.models import Planning
+from . import geo
+from .cube import ProfitabilityCube
+from .forecast import forecast_chantiers
+from .geocoding import BANProvider, CSVProvider, geocode_chantiers, normalize_address, split_cp_ville
+from .models import ChantierForecast, Chantiers
+from .search import repair_sqlite_search_index, search_chantiers
+from .utils import chantier_employee_rollup
 
-# Create your tests here.
+
+class ListChantiersTestCase(TestCase):
+    """Test the keyset-paginated chantiers list"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.chef = User.objects.create_user(
+            email='chef@example.com',
+            password='testpass123',
+            prenom='Chef',
+            nom='Equipe',
+            user_type='Chef d\'équipe'
+        )
+        self.client.force_login(self.chef)
+        self.chantiers = [
+            Chantiers.objects.create(
+                contact=f'Client {i}',
+                adresse_chantier=f'{i} rue A',
+                cp_ville_chantier='75001 Paris',
+                ville_chantier='Paris',
+                chef_chantier=self.chef,
+            )
+            for i in range(5)
+        ]
+        # Two chantiers sharing a created_at exercise the id tie-break
+        now = timezone.now()
+        for i, chantier in enumerate(self.chantiers):
+            Chantiers.objects.filter(id=chantier.id).update(created_at=now - timedelta(minutes=min(i, 3)))
+    
+    def test_pages_cover_every_chantier_once(self):
+        """Following next_cursor walks the whole list newest first without gaps"""
+        seen = []
+        response = self.client.get('/chantiers/list/', {'limit': 2}).json()
+        while True:
+            seen += [chantier['id'] for chantier in response['chantiers']]
+            cursor = response['next_cursor']
+            if not cursor:
+                break
+            response = self.client.get('/chantiers/list/', {'limit': 2, 'cursor': cursor}).json()
+        
+        self.assertEqual(seen, [chantier.id for chantier in self.chantiers])
+        self.assertEqual(response['chantiers'][0]['chef_chantier'], 'Chef Equipe')
+    
+    def test_invalid_cursor(self):
+        """A malformed cursor is rejected"""
+        response = self.client.get('/chantiers/list/', {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ChantierSearchTestCase(TestCase):
+    """Test the chantiers full-text index"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            email='secretaire@example.com', password='testpass123', prenom='Test', nom='Secretaire'
+        )
+        self.client.force_login(self.user)
+        self.lyon = Chantiers.objects.create(
+            contact='Hélène Béranger',
+            adresse_chantier='12 rue de la République',
+            cp_ville_chantier='69002 Lyon',
+            ville_chantier='Lyon',
+        )
+        self.paris = Chantiers.objects.create(
+            contact='Jean Dupont',
+            adresse_chantier='3 avenue Foch',
+            cp_ville_chantier='75016 Paris',
+            ville_chantier='Paris',
+        )
+    
+    def test_search_ignores_accents_and_matches_prefixes(self):
+        """Unaccented prefixes find accented names, every term must match"""
+        self.assertEqual(search_chantiers('helene bera'), [self.lyon.id])
+        self.assertEqual(search_chantiers('69002'), [self.lyon.id])
+        self.assertEqual(search_chantiers('republique paris'), [])
+        self.assertEqual(search_chantiers('"*) OR'), [])
+    
+    def test_index_follows_edits_and_deletes(self):
+        """Triggers keep the index in sync with the chantiers table"""
+        self.paris.adresse_chantier = '8 boulevard Haussmann'
+        self.paris.save()
+        self.assertEqual(search_chantiers('foch'), [])
+        self.assertEqual(search_chantiers('haussmann'), [self.paris.id])
+        
+        self.paris.delete()
+        self.assertEqual(search_chantiers('haussmann'), [])
+    
+    def test_repair_recreates_dropped_triggers(self):
+        """Triggers dropped by a SQLite table rebuild are restored after migrate"""
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER chantiers_fts_update')
+        repair_sqlite_search_index()
+        
+        Chantiers.objects.filter(id=self.paris.id).update(ville_chantier='Versailles')
+        self.assertEqual(search_chantiers('versailles'), [self.paris.id])
+    
+    def test_search_endpoint(self):
+        """The endpoint returns list rows in rank order"""
+        response = self.client.get('/chantiers/search/', {'q': 'Dupont'})
+        self.assertEqual([row['id'] for row in response.json()['chantiers']], [self.paris.id])
+        self.assertEqual(self.client.get('/chantiers/search/').status_code, 400)
+
+
+class ChantierDetailCacheTestCase(TestCase):
+    """Test the revision-keyed cache of chantier_detail sections"""
+    
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='worker@example.com', password='testpass123', prenom='Test', nom='Worker',
+            cout_h=Decimal('20.00')
+        )
+        self.client.force_login(self.user)
+        self.chantier = Chantiers.objects.create(
+            contact='Client A',
+            adresse_chantier='1 rue A',
+            cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris',
+            devis_ht='1000.00',
+        )
+    
+    def test_revision_bumped_by_saves_and_planning_writes(self):
+        """Chantiers saves and slot writes (even without a total change) bump the revision"""
+        self.chantier.refresh_from_db()
+        self.chantier.save()
+        self.assertEqual(self.chantier.revision, 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            slot = Planning.objects.create(
+                user=self.user, chantier=self.chantier,
+                date=date.today(), start_hour='08:00', end_hour='12:00'
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            slot.start_hour, slot.end_hour = '09:00', '13:00'
+            slot.save()
+        self.chantier.refresh_from_db()
+        self.assertEqual(self.chantier.revision, 3)
+    
+    def test_sections_served_from_cache_until_revision_changes(self):
+        """A repeat view skips planning queries; a slot write shows up on the next view"""
+        url = f'/chantiers/{self.chantier.id}/'
+        self.client.get(url)
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([query for query in queries if 'FROM "planning"' in query['sql']])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Planning.objects.create(
+                user=self.user, chantier=self.chantier,
+                date=date.today(), start_hour='08:00', end_hour='12:00'
+            )
+        response = self.client.get(url)
+        self.assertEqual(response.context['planning_summary']['week_hours'], 4)
+        self.assertEqual(response.context['assigned_employees'][0]['full_name'], 'Test Worker')
+        
+        # Renaming a planned user changes the key as well
+        self.user.prenom = 'Renamed'
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.context['assigned_employees'][0]['full_name'], 'Renamed Worker')
+
+
+class ChantierPlanningHistoryTestCase(TestCase):
+    """Test the paginated planning history and its weekly rollup"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.workers = [
+            User.objects.create_user(
+                email=f'worker{i}@example.com', password='testpass123', prenom='Test', nom=f'Worker{i}',
+                cout_h=Decimal('20.00')
+            )
+            for i in range(2)
+        ]
+        self.client.force_login(self.workers[0])
+        self.chantier = Chantiers.objects.create(
+            contact='Client A',
+            adresse_chantier='1 rue A',
+            cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris',
+        )
+        # Monday 15 to Wednesday 17 and Monday 22 January 2024
+        for day in (15, 16, 17, 22):
+            for worker in self.workers:
+                Planning.objects.create(
+                    user=worker, chantier=self.chantier,
+                    date=date(2024, 1, day), start_hour='08:00', end_hour='12:00'
+                )
+        self.url = f'/chantiers/{self.chantier.id}/plannings/'
+    
+    def test_history_is_paginated_filtered_and_sorted(self):
+        """Pages follow the requested sort and filters"""
+        data = self.client.get(self.url, {'page_size': 3, 'page': 2}).json()
+        self.assertEqual((data['total'], data['has_next']), (8, True))
+        self.assertEqual([slot['date'] for slot in data['slots']], ['2024-01-17', '2024-01-16', '2024-01-16'])
+        
+        data = self.client.get(self.url, {
+            'user_id': self.workers[1].id, 'date_from': '2024-01-16', 'sort': 'date',
+        }).json()
+        self.assertEqual([slot['date'] for slot in data['slots']], ['2024-01-16', '2024-01-17', '2024-01-22'])
+        self.assertEqual({slot['user'] for slot in data['slots']}, {'Test Worker1'})
+        
+        self.assertEqual(self.client.get(self.url, {'sort': 'password'}).status_code, 400)
+    
+    def test_rollup_groups_by_week_and_employee(self):
+        """One row per (week, employee) with summed hours and cost"""
+        weeks = self.client.get(f'{self.url}rollup/').json()['weeks']
+        self.assertEqual(
+            [(week['week_start'], week['user'], week['hours'], week['cost'], week['slots']) for week in weeks],
+            [
+                ('2024-01-15', 'Test Worker0', 12.0, 240.0, 3),
+                ('2024-01-15', 'Test Worker1', 12.0, 240.0, 3),
+                ('2024-01-22', 'Test Worker0', 4.0, 80.0, 1),
+                ('2024-01-22', 'Test Worker1', 4.0, 80.0, 1),
+            ]
+        )
+    
+    def test_employee_rollup_is_one_query(self):
+        """Each assigned employee comes with totals and first/last day from a single query"""
+        Planning.objects.create(
+            user=self.workers[0], chantier=Chantiers.objects.create(
+                contact='Client B', adresse_chantier='2 rue B', cp_ville_chantier='69001 Lyon', ville_chantier='Lyon',
+            ),
+            date=date(2024, 1, 23), start_hour='08:00', end_hour='12:00'
+        )
+        with self.assertNumQueries(1):
+            employees = chantier_employee_rollup(self.chantier.id)
+        
+        self.assertEqual(
+            [(employee['full_name'], employee['hours'], employee['cost'], employee['slots'],
+              employee['first_day'], employee['last_day']) for employee in employees],
+            [
+                ('Test Worker0', 16.0, 320.0, 4, date(2024, 1, 15), date(2024, 1, 22)),
+                ('Test Worker1', 16.0, 320.0, 4, date(2024, 1, 15), date(2024, 1, 22)),
+            ]
+        )
+
+
+class MapGeoJSONTestCase(TestCase):
+    """Test the viewport GeoJSON endpoint and its tile clustering"""
+    
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='secretaire@example.com', password='testpass123', prenom='Test', nom='Secretaire'
+        )
+        self.client.force_login(self.user)
+        # Three chantiers in central Paris, one in Lyon
+        coordinates = [('48.856600', '2.352200'), ('48.857000', '2.353000'), ('48.858000', '2.351000'), ('45.764000', '4.835700')]
+        self.chantiers = [
+            Chantiers.objects.create(
+                contact=f'Client {i}',
+                adresse_chantier=f'{i} rue A',
+                cp_ville_chantier='75001 Paris',
+                ville_chantier='Paris',
+                latitude=Decimal(lat),
+                longitude=Decimal(lng),
+            )
+            for i, (lat, lng) in enumerate(coordinates)
+        ]
+        self.france = {'bbox': '-5.0,42.0,8.0,51.0'}
+    
+    def test_tile_math_round_trips(self):
+        """A point falls inside the bounds of the tile computed for it"""
+        zoom = 12
+        x, y = geo.lng_to_tile_x(2.3522, zoom), geo.lat_to_tile_y(48.8566, zoom)
+        west, south, east, north = geo.tile_bounds(zoom, x, y)
+        self.assertTrue(west <= 2.3522 < east and south <= 48.8566 < north)
+        self.assertLessEqual(len(geo.tiles_for_bbox(-180, -85, 180, 85, 10, max_tiles=64)), 64)
+    
+    def test_low_zoom_clusters_and_high_zoom_points(self):
+        """Nearby chantiers are counted in one cluster at low zoom and listed at high zoom"""
+        features = self.client.get('/map/chantiers/', {**self.france, 'zoom': 6}).json()['features']
+        clusters = sorted(
+            (feature['properties'].get('count', 1), feature['properties'].get('id')) for feature in features
+        )
+        self.assertEqual(clusters, [(1, self.chantiers[3].id), (3, None)])
+        
+        features = self.client.get('/map/chantiers/', {'bbox': '2.34,48.85,2.36,48.86', 'zoom': 15}).json()['features']
+        self.assertEqual(
+            sorted(feature['properties']['id'] for feature in features),
+            [chantier.id for chantier in self.chantiers[:3]]
+        )
+    
+    def test_page_opens_on_chantiers_extent(self):
+        """The map page fits every geocoded chantier"""
+        response = self.client.get('/map/')
+        self.assertEqual(response.context['map_extent'], [[45.764, 2.351], [48.858, 4.8357]])
+    
+    def test_tiles_cached_until_chantiers_move(self):
+        """A repeat viewport is served from the tile cache; moving a chantier invalidates it"""
+        self.client.get('/map/chantiers/', {**self.france, 'zoom': 6})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/map/chantiers/', {**self.france, 'zoom': 6})
+        self.assertFalse([query for query in queries if 'GROUP BY' in query['sql']])
+        # The data version is read once, for the ETag and the tile keys
+        self.assertEqual(len([query for query in queries if 'COUNT(' in query['sql']]), 1)
+        
+        lyon = self.chantiers[3]
+        lyon.refresh_from_db()
+        lyon.latitude, lyon.longitude = Decimal('48.856000'), Decimal('2.352000')
+        lyon.save()
+        features = self.client.get('/map/chantiers/', {**self.france, 'zoom': 6}).json()['features']
+        self.assertEqual([feature['properties']['count'] for feature in features], [4])
+
+
+class GeocodingTestCase(TestCase):
+    """Test the batch geocoding pipeline with the offline CSV provider"""
+    
+    def setUp(self):
+        """Set up test data"""
+        extract = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8')
+        extract.write(
+            'id;numero;rep;nom_voie;code_postal;nom_commune;lon;lat\n'
+            '69382_1;12;;Rue de la République;69002;Lyon;4.835700;45.764000\n'
+        )
+        extract.close()
+        self.addCleanup(os.unlink, extract.name)
+        self.provider = CSVProvider(path=extract.name)
+        
+        self.chantiers = [
+            Chantiers.objects.create(
+                contact=f'Client {i}',
+                adresse_chantier=adresse,
+                cp_ville_chantier='69002 Lyon',
+                ville_chantier='Lyon',
+            )
+            for i, adresse in enumerate(['12 rue de la République', '12, R. de la Republique', '1 impasse Inconnue'])
+        ]
+    
+    def test_normalize_address(self):
+        """Case, accents, punctuation and abbreviations do not change the key"""
+        self.assertEqual(
+            normalize_address('12, R. de la République', '69002 LYON'),
+            '12 rue de la republique 69002 lyon'
+        )
+        self.assertEqual(split_cp_ville('69002 Lyon'), ('69002', 'Lyon'))
+    
+    def test_backlog_geocoded_in_batches_and_cached(self):
+        """Duplicate addresses are looked up once and a second run only hits the cache"""
+        with mock.patch.object(self.provider, 'geocode_batch', wraps=self.provider.geocode_batch) as lookup:
+            stats = geocode_chantiers(provider=self.provider)
+        lookup.assert_called_once()
+        self.assertEqual(
+            stats, {'chantiers': 3, 'cached': 0, 'requested': 2, 'geocoded': 2, 'not_found': 1}
+        )
+        
+        lyon = Chantiers.objects.get(id=self.chantiers[1].id)
+        self.assertEqual((lyon.latitude, lyon.longitude), (Decimal('45.764000'), Decimal('4.835700')))
+        self.assertEqual(lyon.revision, 1)
+        
+        with mock.patch.object(self.provider, 'geocode_batch') as lookup:
+            stats = geocode_chantiers(provider=self.provider)
+        lookup.assert_not_called()
+        self.assertEqual(stats['cached'], 1)
+        self.assertEqual(stats['not_found'], 1)
+    
+    def test_ban_provider_parses_batch_response(self):
+        """The BAN CSV answer is mapped back to keys, low scores are dropped"""
+        answer = mock.Mock(content=(
+            'key,adresse,postcode,city,latitude,longitude,result_score\n'
+            'a,12 rue de la République,69002,Lyon,45.764,4.8357,0.93\n'
+            'b,nulle part,,,44.0,1.0,0.21\n'
+        ).encode('utf-8'))
+        with mock.patch('projects.geocoding.requests.post', return_value=answer) as post:
+            found = BANProvider().geocode_batch({'a': ('12 rue de la République', '69002 Lyon'), 'b': ('nulle part', '')})
+        
+        post.assert_called_once()
+        self.assertEqual(found, {'a': (Decimal('45.764'), Decimal('4.8357'), 0.93)})
+
+
+class ProfitabilityCubeTestCase(TestCase):
+    """Test the portfolio profitability cube and its endpoint"""
+    
+    def setUp(self):
+        """Set up three chantiers across two chefs, two cities and three travaux types"""
+        self.chef = User.objects.create_user(
+            email='chef@example.com', password='testpass123', prenom='Jean', nom='Chef',
+            user_type="Chef d'équipe"
+        )
+        self.client.force_login(self.chef)
+        specs = [
+            (self.chef, 'Paris', 'Particulier', date(2024, 1, 10), ['Peinture', 'Plomberie'], '1000.00'),
+            (self.chef, 'Lyon', 'Professionnel', date(2024, 2, 1), ['Peinture'], '2000.00'),
+            (None, 'Paris', 'Particulier', None, [], '500.00'),
+        ]
+        self.chantiers = [
+            Chantiers.objects.create(
+                contact=f'Client {i}',
+                adresse_chantier=f'{i} rue A',
+                cp_ville_chantier='75001 Paris',
+                ville_chantier=ville,
+                chef_chantier=chef,
+                client_final_type=client,
+                date_debut_chantier=start,
+                travaux_type=travaux,
+                devis_ht=devis,
+            )
+            for i, (chef, ville, client, start, travaux, devis) in enumerate(specs)
+        ]
+        self.cube = ProfitabilityCube()
+    
+    def test_slices(self):
+        """Cells sum per dimension; a multi-type chantier counts in each of its types"""
+        by_chef = self.cube.slice(['chef'])
+        self.assertEqual(
+            [(cell['chef'], cell['count'], cell['va']) for cell in by_chef],
+            [(self.chef.id, 2, 3000.0), (None, 1, 500.0)]
+        )
+        
+        by_travaux = {cell['travaux']: cell['count'] for cell in self.cube.slice(['travaux'])}
+        self.assertEqual(by_travaux, {'Peinture': 2, 'Plomberie': 1, None: 1})
+        
+        paris = self.cube.slice(['month'], {'ville': ['Paris'], 'travaux': ['Plomberie', None]})
+        self.assertEqual([(cell['month'], cell['devis']) for cell in paris], [('2024-01', 1000.0), (None, 500.0)])
+        
+        with self.assertRaises(ValueError):
+            self.cube.slice(['couleur'])
+    
+    def test_incremental_refresh(self):
+        """Aggregate writes are picked up without a rebuild; deletions rebuild"""
+        self.cube.sync()
+        Chantiers.objects.filter(id=self.chantiers[0].id).update(
+            cost_spent_on_project=Decimal('400.00'), va=Decimal('600.00'), updated_at=timezone.now()
+        )
+        
+        with mock.patch.object(self.cube, '_rebuild', wraps=self.cube._rebuild) as rebuild:
+            total = self.cube.slice()
+            rebuild.assert_not_called()
+            self.assertEqual(total, [{'count': 3, 'devis': 3500.0, 'cost': 400.0, 'va': 3100.0, 'va_percent': 88.6}])
+            
+            self.chantiers[2].delete()
+            self.assertEqual(self.cube.slice()[0]['count'], 2)
+            rebuild.assert_called_once()
+    
+    def test_endpoint_labels_chefs(self):
+        """The endpoint parses filters and names chefs"""
+        with mock.patch('projects.cube.profitability_cube', self.cube):
+            response = self.client.get('/chantiers/profitability/', {'group_by': 'chef', 'client': 'Particulier'})
+        
+        cells = response.json()['cells']
+        self.assertEqual([(cell['chef_name'], cell['va']) for cell in cells], [('Jean Chef', 1000.0), ('Sans chef', 500.0)])
+        self.assertEqual(self.client.get('/chantiers/profitability/', {'chef': 'x'}).status_code, 400)
+
+
+class ChantierForecastTestCase(TestCase):
+    """Test the burn-rate forecasts"""
+    
+    def setUp(self):
+        """Set up two active chantiers planned 4h a day the week before the reference date"""
+        self.user = User.objects.create_user(
+            email='worker@example.com', password='testpass123', prenom='Test', nom='Worker',
+            cout_h=Decimal('20.00')
+        )
+        self.client.force_login(self.user)
+        # 1500 EUR of devis plans 24 hours, 500 EUR plans 8 hours
+        self.healthy, self.overrun = [
+            Chantiers.objects.create(
+                contact=f'Client {devis}',
+                adresse_chantier='1 rue A',
+                cp_ville_chantier='75001 Paris',
+                ville_chantier='Paris',
+                devis_ht=devis,
+            )
+            for devis in ('1500.00', '500.00')
+        ]
+        Chantiers.objects.create(
+            contact='Client done', adresse_chantier='2 rue A', cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris', devis_ht='1000.00', avancement_chantier=100,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            for day in range(22, 27):
+                for chantier, start, end in [(self.healthy, '08:00', '12:00'), (self.overrun, '13:00', '17:00')]:
+                    Planning.objects.create(
+                        user=self.user, chantier=chantier,
+                        date=date(2024, 1, day), start_hour=start, end_hour=end
+                    )
+        self.today = date(2024, 1, 29)
+    
+    def test_projection(self):
+        """Remaining hours are costed at the observed rate and overruns are flagged"""
+        forecasts = {forecast.chantier_id: forecast for forecast in forecast_chantiers(self.today)}
+        
+        self.assertEqual(set(forecasts), {self.healthy.id, self.overrun.id})
+        healthy = forecasts[self.healthy.id]
+        self.assertGreater(healthy.burn_hours_per_day, 0)
+        self.assertEqual(healthy.hours_at_completion, 24.0)
+        self.assertEqual(healthy.cost_at_completion, Decimal('480.00'))
+        self.assertEqual(healthy.final_va, Decimal('1020.00'))
+        self.assertGreater(healthy.completion_date, self.today)
+        self.assertFalse(healthy.below_threshold)
+        
+        # Already past its planned hours: done today at the cost spent, 20 % VA
+        overrun = forecasts[self.overrun.id]
+        self.assertEqual(overrun.completion_date, self.today)
+        self.assertEqual(overrun.final_va_percent, 20.0)
+        self.assertTrue(overrun.below_threshold)
+    
+    def test_near_zero_burn_has_no_completion_date(self):
+        """A completion date beyond the horizon is left empty instead of overflowing"""
+        stalled = Chantiers.objects.create(
+            contact='Client stalled', adresse_chantier='3 rue A', cp_ville_chantier='75001 Paris',
+            ville_chantier='Paris', devis_ht='1000.00', avancement_chantier=1,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Planning.objects.create(
+                user=self.user, chantier=stalled,
+                date=self.today - timedelta(days=28), start_hour='08:00', end_hour='08:15'
+            )
+        Chantiers.objects.filter(id=stalled.id).update(number_hour_spent_on_project=1000)
+        
+        forecasts = {forecast.chantier_id: forecast for forecast in forecast_chantiers(self.today)}
+        self.assertIsNone(forecasts[stalled.id].completion_date)
+        self.assertEqual(forecasts[self.overrun.id].completion_date, self.today)
+    
+    def test_refresh_replaces_snapshot(self):
+        """A refresh drops completed chantiers and the endpoint filters on the threshold"""
+        forecast_chantiers(self.today)
+        Chantiers.objects.filter(id=self.healthy.id).update(avancement_chantier=100)
+        
+        response = self.client.post('/chantiers/forecasts/refresh/')
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(list(ChantierForecast.objects.values_list('chantier_id', flat=True)), [self.overrun.id])
+        
+        forecasts = self.client.get('/chantiers/forecasts/', {'below_threshold': '1'}).json()['forecasts']
+        self.assertEqual([forecast['chantier_id'] for forecast in forecasts], [self.overrun.id])
@@ -0,0 +1,93 @@
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncWeek
+
+from accounts.models import User
+from planning.models import Planning
+
+
+# Sort keys accepted by the planning history table, mapped to ORDER BY columns
+PLANNING_HISTORY_SORTS = {
+    'date': ('date', 'start_hour', 'id'),
+    '-date': ('-date', '-start_hour', '-id'),
+    'user': ('user__nom', 'user__prenom', 'date', 'start_hour', 'id'),
+    '-user': ('-user__nom', '-user__prenom', '-date', '-start_hour', '-id'),
+    'hours': ('duration_minutes', 'date', 'start_hour', 'id'),
+    '-hours': ('-duration_minutes', '-date', '-start_hour', '-id'),
+    'cost': ('cout_planning', 'date', 'start_hour', 'id'),
+    '-cost': ('-cout_planning', '-date', '-start_hour', '-id'),
+}
+
+
+def chantier_plannings(chantier_id, user_id=None, date_from=None, date_to=None):
+    """Planning slots of a chantier, optionally restricted to one employee and a date range"""
+    plannings = Planning.objects.filter(chantier_id=chantier_id)
+    if user_id:
+        plannings = plannings.filter(user_id=user_id)
+    if date_from:
+        plannings = plannings.filter(date__gte=date_from)
+    if date_to:
+        plannings = plannings.filter(date__lte=date_to)
+    return plannings
+
+
+def chantier_week_rollup(plannings):
+    """
+    Hours and cost per employee and per week, in one GROUP BY query.
+
+    plannings is a chantier_plannings() queryset. Weeks start on Monday.
+    """
+    rows = (
+        plannings.order_by()
+        .annotate(week_start=TruncWeek('date'))
+        .values('week_start', 'user_id', 'user__prenom', 'user__nom')
+        .annotate(minutes=Sum('duration_minutes'), cost=Sum('cout_planning'), slots=Count('id'))
+        .order_by('week_start', 'user__nom', 'user__prenom')
+    )
+    return [
+        {
+            'week_start': row['week_start'],
+            'user_id': row['user_id'],
+            'user': f"{row['user__prenom']} {row['user__nom']}",
+            'hours': round((row['minutes'] or 0) / 60.0, 2),
+            'cost': float(row['cost'] or 0),
+            'slots': row['slots'],
+        }
+        for row in rows
+    ]
+
+
+def chantier_employee_rollup(chantier_id):
+    """
+    Employees assigned to a chantier with their totals on it, in one query.
+
+    Each row has the employee fields, hours, cost, slots and the first and
+    last planned day. Ordered by first name, then last name.
+    """
+    # filter() before annotate() so the sums join on the same, chantier-restricted plannings
+    rows = (
+        User.objects.filter(plannings__chantier_id=chantier_id)
+        .values('id', 'prenom', 'nom', 'user_type')
+        .annotate(
+            minutes=Sum('plannings__duration_minutes'),
+            cost=Sum('plannings__cout_planning'),
+            slots=Count('plannings'),
+            first_day=Min('plannings__date'),
+            last_day=Max('plannings__date'),
+        )
+        .order_by('prenom', 'nom')
+    )
+    return [
+        {
+            'id': row['id'],
+            'prenom': row['prenom'],
+            'nom': row['nom'],
+            'full_name': f"{row['prenom']} {row['nom']}",
+            'user_type': row['user_type'],
+            'hours': round((row['minutes'] or 0) / 60.0, 2),
+            'cost': float(row['cost'] or 0),
+            'slots': row['slots'],
+            'first_day': row['first_day'],
+            'last_day': row['last_day'],
+        }
+        for row in rows
+    ]
@@ -1,39 +1,137 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
+from django.core.cache import cache
+from django.db.models import Max, Q
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
+from django.utils.dateparse import parse_datetime
 from datetime import datetime, timedelta, date
-from .models import Chantiers
+import base64
+from .models import ChantierForecast, Chantiers, VA_THRESHOLD_PERCENT
 from .forms import ChantierForm
-from planning.models import Planning
+from . import cube, geo, search
+from .forecast import forecast_chantiers
+from .utils import PLANNING_HISTORY_SORTS, chantier_employee_rollup, chantier_plannings, chantier_week_rollup
 from accounts.models import User
+from MyBTP.utils import conditional_json, queryset_version
+
+
+def _chantiers_list_version(request):
+    """Chantiers plus users, whose names appear as chef_chantier"""
+    return queryset_version(Chantiers.objects.all()) + queryset_version(User.objects.all())
+
+
+CHANTIERS_PAGE_SIZE = 100
+CHANTIERS_MAX_PAGE_SIZE = 500
+
+CHANTIER_LIST_FIELDS = (
+    'id', 'name_chantier', 'adresse_chantier', 'cp_ville_chantier', 'date_debut_chantier',
+    'avancement_chantier', 'devis_ht', 'nombre_de_jours_chantier', 'created_at',
+    'chef_chantier_id', 'chef_chantier__prenom', 'chef_chantier__nom',
+)
+
+
+def _serialize_chantier_row(row):
+    """Serialize a CHANTIER_LIST_FIELDS values() row for the chantiers table"""
+    return {
+        'id': row['id'],
+        'name_chantier': row['name_chantier'],
+        'adresse_chantier': row['adresse_chantier'],
+        'cp_ville_chantier': row['cp_ville_chantier'],
+        'date_debut_chantier': row['date_debut_chantier'].isoformat() if row['date_debut_chantier'] else None,
+        'chef_chantier': (
+            f"{row['chef_chantier__prenom']} {row['chef_chantier__nom']}"
+            if row['chef_chantier_id'] else None
+        ),
+        'avancement_chantier': row['avancement_chantier'],
+        'devis_ht': float(row['devis_ht']) if row['devis_ht'] else 0,
+        'nombre_de_jours_chantier': row['nombre_de_jours_chantier'],
+    }
+
+
+def _encode_chantiers_cursor(created_at, chantier_id):
+    """Opaque cursor pointing after (created_at, id) in list_chantiers order"""
+    raw = f'{created_at.isoformat()}|{chantier_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_chantiers_cursor(cursor):
+    """Return (created_at, id) from a cursor, or raise ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, chantier_id = raw.split('|')
+        created_at = parse_datetime(created_at)
+        chantier_id = int(chantier_id)
+    except (ValueError, UnicodeError):
+        raise ValueError(cursor)
+    if created_at is None:
+        raise ValueError(cursor)
+    return created_at, chantier_id
 
 
 @login_required
 @require_http_methods(["GET"])
 @ensure_csrf_cookie
+@conditional_json(_chantiers_list_version)
 def list_chantiers(request):
-    """Get list of chantiers via AJAX"""
-    chantiers_list = Chantiers.objects.all().order_by('-created_at')
-    
-    chantiers_data = []
-    for chantier in chantiers_list:
-        chantiers_data.append({
-            'id': chantier.id,
-            'name_chantier': chantier.name_chantier,
-            'adresse_chantier': chantier.adresse_chantier,
-            'cp_ville_chantier': chantier.cp_ville_chantier,
-            'date_debut_chantier': chantier.date_debut_chantier.isoformat() if chantier.date_debut_chantier else None,
-            'chef_chantier': chantier.chef_chantier.full_name if chantier.chef_chantier else None,
-            'avancement_chantier': chantier.avancement_chantier,
-            'devis_ht': float(chantier.devis_ht) if chantier.devis_ht else 0,
-            'nombre_de_jours_chantier': chantier.nombre_de_jours_chantier,
-        })
+    """
+    Get a page of chantiers via AJAX, newest first.
+    
+    Keyset-paginated on (-created_at, id): pass the returned next_cursor as
+    ?cursor= to get the following page, next_cursor is null on the last one.
+    """
+    try:
+        limit = min(int(request.GET.get('limit', CHANTIERS_PAGE_SIZE)), CHANTIERS_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Paramètre limit invalide.'}, status=400)
+    if limit < 1:
+        return JsonResponse({'success': False, 'message': 'Paramètre limit invalide.'}, status=400)
+    
+    chantiers_list = Chantiers.objects.order_by('-created_at', 'id')
+    
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            created_at, chantier_id = _decode_chantiers_cursor(cursor)
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Curseur invalide.'}, status=400)
+        chantiers_list = chantiers_list.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__gt=chantier_id)
+        )
+    
+    # Only the listed columns, chef name joined in the same query; one extra row tells if a page follows
+    rows = list(chantiers_list.values(*CHANTIER_LIST_FIELDS)[:limit + 1])
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_chantiers_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    
+    chantiers_data = [_serialize_chantier_row(row) for row in rows]
     
     return JsonResponse({
         'success': True,
-        'chantiers': chantiers_data
+        'chantiers': chantiers_data,
+        'next_cursor': next_cursor,
+    }, status=200)
+
+
+@login_required
+@require_http_methods(["GET"])
+def search_chantiers(request):
+    """Search chantiers by name, address, postcode, city or contact, best match first"""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'success': False, 'message': 'Le paramètre q est requis.'}, status=400)
+    
+    chantier_ids = search.search_chantiers(query)
+    rows = Chantiers.objects.filter(id__in=chantier_ids).values(*CHANTIER_LIST_FIELDS)
+    rank = {chantier_id: position for position, chantier_id in enumerate(chantier_ids)}
+    
+    return JsonResponse({
+        'success': True,
+        'chantiers': [_serialize_chantier_row(row) for row in sorted(rows, key=lambda row: rank[row['id']])],
     }, status=200)
 
 
@@ -66,64 +164,56 @@ def create_chantier(request):
         }, status=400)
 
 
-@login_required
-def chantier_detail(request, id):
-    """Display detail page for a single chantier with tabs"""
-    chantier = get_object_or_404(
-        Chantiers.objects.select_related('chef_chantier'),
-        id=id
-    )
+CHANTIER_DETAIL_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def chantier_detail_cache_key(chantier, week_start):
+    """
+    Cache key of a chantier's computed detail sections.
     
-    # Get current week for planning summary
-    today = date.today()
-    week_start = today - timedelta(days=today.weekday())
-    week_end = week_start + timedelta(days=6)
+    Versioned by the chantier's revision and by the last update of the users
+    planned on it, whose names appear in the sections.
+    """
+    users_updated = (
+        User.objects.filter(planning_rollups__chantier_id=chantier.id)
+        .aggregate(latest=Max('updated_at'))['latest']
+    )
+    users_version = users_updated.timestamp() if users_updated else 0
+    return f'chantier_detail:{chantier.id}:{chantier.revision}:{users_version}:{week_start.isoformat()}'
+
+
+def _chantier_detail_sections(chantier, week_start, week_end):
+    """
+    Compute the week summary, progress bar, VA card and team sections of chantier_detail.
     
-    # Get planning for current week
+    The full planning history is not rendered here, the page loads it page by
+    page from chantier_planning_history. The result only holds plain values so
+    it can be cached.
+    """
     week_planning = (
-        Planning.objects.filter(
-            chantier=chantier,
-            date__gte=week_start,
-            date__lte=week_end
-        )
+        chantier_plannings(chantier.id, date_from=week_start, date_to=week_end)
         .select_related('user')
         .order_by('date', 'start_hour')
     )
     
-    # Calculate week summary
     planning_data = []
-    week_hours = 0
-    week_cost = 0
-    
+    week_minutes = 0
+    week_cost = 0.0
     for slot in week_planning:
-        start = datetime.combine(slot.date, slot.start_hour)
-        end = datetime.combine(slot.date, slot.end_hour)
-        if end < start:
-            end += timedelta(days=1)
-        delta = end - start
-        hours = delta.total_seconds() / 3600.0
-        week_hours += hours
         cost = float(slot.cout_planning) if slot.cout_planning else 0
-        week_cost += cost
-        
         planning_data.append({
             'date': slot.date,
             'user': slot.user.full_name if slot.user else 'N/A',
             'start_hour': slot.start_hour.strftime('%H:%M'),
             'end_hour': slot.end_hour.strftime('%H:%M'),
-            'hours': round(hours, 2),
+            'hours': round(slot.duration_minutes / 60.0, 2),
             'cost': cost,
         })
+        week_minutes += slot.duration_minutes
+        week_cost += cost
     
-    # Get all assigned employees (distinct users who have planning entries)
-    assigned_employees = (
-        User.objects.filter(plannings__chantier=chantier)
-        .distinct()
-        .order_by('prenom', 'nom')
-    )
-    
-    # Get ALL plannings for this chantier (not just current week)
-    all_plannings = chantier.plannings.select_related('user').order_by('date', 'start_hour')
+    # Assigned employees (users with planning entries) with their totals on this chantier
+    assigned_employees = chantier_employee_rollup(chantier.id)
     
     # Calculate progress data for "Avancement du chantier"
     from decimal import Decimal
@@ -171,26 +261,6 @@ def chantier_detail(request, id):
         "has_hours": has_hours,
     }
     
-    # Build all plannings data for the table
-    all_planning_data = []
-    for slot in all_plannings:
-        start = datetime.combine(slot.date, slot.start_hour)
-        end = datetime.combine(slot.date, slot.end_hour)
-        if end < start:
-            end += timedelta(days=1)
-        delta = end - start
-        hours = delta.total_seconds() / 3600.0
-        cost = float(slot.cout_planning) if slot.cout_planning else 0
-        
-        all_planning_data.append({
-            'date': slot.date,
-            'user': slot.user.full_name if slot.user else 'N/A',
-            'start_hour': slot.start_hour.strftime('%H:%M'),
-            'end_hour': slot.end_hour.strftime('%H:%M'),
-            'hours': round(hours, 2),
-            'cost': cost,
-        })
-    
     # Calculate VA metrics for the VA card
     devis = chantier.devis_ht or Decimal('0')
     va_euros = chantier.va or Decimal('0')
@@ -201,10 +271,9 @@ def chantier_detail(request, id):
         va_percent = None
     
     # Determine status
-    threshold = Decimal('55')  # 55%
     if va_percent is None:
         va_status = "unknown"
-    elif va_percent >= threshold:
+    elif va_percent >= VA_THRESHOLD_PERCENT:
         va_status = "good"
     else:
         va_status = "bad"
@@ -225,54 +294,282 @@ def chantier_detail(request, id):
         else:
             status_badge = str(chantier.avancement_statut)
     
-    context = {
-        'chantier': chantier,
+    return {
         'status_badge': status_badge,
         'planning_summary': {
-            'week_hours': round(week_hours, 2),
+            'week_hours': round(week_minutes / 60.0, 2),
             'week_cost': round(week_cost, 2),
             'planning_data': planning_data,
         },
         'assigned_employees': assigned_employees,
-        'week_range': {
-            'start': week_start,
-            'end': week_end,
-        },
         # Progress data for "Avancement du chantier" card
         'progress': progress,
-        # All plannings for the full table
-        'all_planning_data': all_planning_data,
         # VA (Valeur Ajoutée) context
         'va_context': va_context,
     }
+
+
+@login_required
+def chantier_detail(request, id):
+    """
+    Display detail page for a single chantier with tabs.
+    
+    The computed sections are cached under the chantier's revision, which every
+    Chantiers save and Planning write bumps, and the last update of its planned
+    users, so a repeat view is one version query and one cache lookup.
+    The planning history table is filled by chantier_planning_history.
+    """
+    chantier = get_object_or_404(
+        Chantiers.objects.select_related('chef_chantier'),
+        id=id
+    )
+    
+    # Get current week for planning summary
+    today = date.today()
+    week_start = today - timedelta(days=today.weekday())
+    week_end = week_start + timedelta(days=6)
+    
+    cache_key = chantier_detail_cache_key(chantier, week_start)
+    sections = cache.get(cache_key)
+    if sections is None:
+        sections = _chantier_detail_sections(chantier, week_start, week_end)
+        cache.set(cache_key, sections, CHANTIER_DETAIL_CACHE_TIMEOUT)
+    
+    context = {
+        'chantier': chantier,
+        'week_range': {
+            'start': week_start,
+            'end': week_end,
+        },
+        # Refreshed nightly without a revision bump, so read outside the cached sections
+        'forecast': ChantierForecast.objects.filter(chantier=chantier).first(),
+        **sections,
+    }
     
     return render(request, 'chantier_detail.html', context)
 
 
+PLANNING_HISTORY_PAGE_SIZE = 50
+PLANNING_HISTORY_MAX_PAGE_SIZE = 200
+
+
+def _planning_history_filters(request, chantier_id):
+    """Build the filtered plannings queryset from ?user_id=&date_from=&date_to=, or raise ValueError"""
+    user_id = request.GET.get('user_id') or None
+    date_from = request.GET.get('date_from') or None
+    date_to = request.GET.get('date_to') or None
+    return chantier_plannings(
+        chantier_id,
+        user_id=int(user_id) if user_id else None,
+        date_from=datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None,
+        date_to=datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None,
+    )
+
+
+@login_required
+@require_http_methods(["GET"])
+def chantier_planning_history(request, id):
+    """
+    Get one page of a chantier's planning history via AJAX.
+    
+    Filters: user_id, date_from, date_to. Sort: one of PLANNING_HISTORY_SORTS
+    (default -date). Pages are numbered from 1.
+    """
+    chantier = get_object_or_404(Chantiers.objects.only('id'), id=id)
+    
+    sort = request.GET.get('sort', '-date')
+    if sort not in PLANNING_HISTORY_SORTS:
+        return JsonResponse({'success': False, 'message': 'Tri invalide.'}, status=400)
+    try:
+        plannings = _planning_history_filters(request, chantier.id)
+        page_number = int(request.GET.get('page', 1))
+        page_size = min(int(request.GET.get('page_size', PLANNING_HISTORY_PAGE_SIZE)), PLANNING_HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Paramètres invalides.'}, status=400)
+    if page_number < 1 or page_size < 1:
+        return JsonResponse({'success': False, 'message': 'Paramètres invalides.'}, status=400)
+    
+    total = plannings.count()
+    offset = (page_number - 1) * page_size
+    rows = (
+        plannings.order_by(*PLANNING_HISTORY_SORTS[sort])
+        .values(
+            'id', 'date', 'start_hour', 'end_hour', 'duration_minutes', 'cout_planning',
+            'user_id', 'user__prenom', 'user__nom',
+        )[offset:offset + page_size]
+    )
+    
+    slots_data = [{
+        'id': row['id'],
+        'date': row['date'].isoformat(),
+        'user_id': row['user_id'],
+        'user': f"{row['user__prenom']} {row['user__nom']}",
+        'start_hour': row['start_hour'].strftime('%H:%M'),
+        'end_hour': row['end_hour'].strftime('%H:%M'),
+        'hours': round(row['duration_minutes'] / 60.0, 2),
+        'cost': float(row['cout_planning']) if row['cout_planning'] else 0,
+    } for row in rows]
+    
+    return JsonResponse({
+        'success': True,
+        'slots': slots_data,
+        'page': page_number,
+        'page_size': page_size,
+        'total': total,
+        'has_next': offset + page_size < total,
+    }, status=200)
+
+
+@login_required
+@require_http_methods(["GET"])
+def chantier_planning_rollup(request, id):
+    """Get hours and cost per employee and per week of a chantier via AJAX (same filters as the history)"""
+    chantier = get_object_or_404(Chantiers.objects.only('id'), id=id)
+    try:
+        plannings = _planning_history_filters(request, chantier.id)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Paramètres invalides.'}, status=400)
+    
+    rollup = chantier_week_rollup(plannings)
+    for row in rollup:
+        row['week_start'] = row['week_start'].isoformat()
+    
+    return JsonResponse({'success': True, 'weeks': rollup}, status=200)
+
+
 @login_required
 def map_chantiers(request):
-    """Display map view with all chantiers that have coordinates"""
-    import json
-    
-    # Query all chantiers with non-null latitude and longitude
-    chantiers_with_coords = Chantiers.objects.filter(
-        latitude__isnull=False,
-        longitude__isnull=False
-    ).order_by('name_chantier')
-    
-    # Serialize chantiers data
-    chantiers_data = []
-    for chantier in chantiers_with_coords:
-        chantiers_data.append({
-            'name': chantier.name_chantier or 'Sans nom',
-            'adresse': chantier.adresse_chantier or '',
-            'cp_ville': chantier.cp_ville_chantier or '',
-            'lat': float(chantier.latitude),
-            'lng': float(chantier.longitude),
-        })
+    """
+    Display map view, chantiers are loaded per viewport from map_chantiers_geojson.
     
-    context = {
-        'chantiers': json.dumps(chantiers_data),
+    The page opens on the extent of every geocoded chantier.
+    """
+    return render(request, 'map.html', {'map_extent': geo.chantiers_extent()})
+
+
+MAP_TILE_CACHE_TIMEOUT = 60 * 60
+MAP_MAX_TILES = 64
+
+
+def _map_version(request):
+    """Geocoded chantiers: any move, addition or removal changes every tile key"""
+    return queryset_version(Chantiers.objects.filter(latitude__isnull=False, longitude__isnull=False))
+
+
+@login_required
+@require_http_methods(["GET"])
+@conditional_json(_map_version)
+def map_chantiers_geojson(request):
+    """
+    Get the chantiers of a viewport as a GeoJSON FeatureCollection.
+    
+    ?bbox=west,south,east,north&zoom=z. The bbox is widened to whole map tiles
+    (at most MAP_MAX_TILES) and each tile is computed once per data version and
+    cached, clustered below geo.CLUSTER_MAX_ZOOM.
+    """
+    try:
+        west, south, east, north = (float(value) for value in request.GET['bbox'].split(','))
+        zoom = int(request.GET['zoom'])
+    except (KeyError, ValueError):
+        return JsonResponse({'success': False, 'message': 'bbox et zoom sont requis.'}, status=400)
+    if not 0 <= zoom <= geo.MAX_ZOOM or west > east or south > north:
+        return JsonResponse({'success': False, 'message': 'bbox ou zoom invalide.'}, status=400)
+    
+    # Large screens get coarser tiles rather than more of them; clustering still follows the map zoom
+    tiles = geo.tiles_for_bbox(west, south, east, north, zoom, max_tiles=MAP_MAX_TILES)
+    cluster = zoom < geo.CLUSTER_MAX_ZOOM
+    
+    # Computed once by conditional_json for the ETag
+    count, latest = request.fingerprint
+    version = f"{count}:{latest.isoformat() if latest else ''}"
+    keys = {f'map_tile:{version}:{int(cluster)}:{z}:{x}:{y}': (z, x, y) for z, x, y in tiles}
+    cached = cache.get_many(keys)
+    missing = {key: geo.tile_features(*tile, cluster=cluster) for key, tile in keys.items() if key not in cached}
+    if missing:
+        cache.set_many(missing, MAP_TILE_CACHE_TIMEOUT)
+    
+    features = []
+    for key in keys:
+        features.extend(cached.get(key) or missing.get(key) or [])
+    
+    return JsonResponse({'type': 'FeatureCollection', 'features': features}, status=200)
+
+
+def _profitability_filters(request):
+    """Read ?chef=1,2&ville=Paris&... into cube filters; 'none' selects chantiers without a value"""
+    filters = {}
+    for dimension in cube.CUBE_DIMENSIONS:
+        raw = request.GET.get(dimension)
+        if not raw:
+            continue
+        values = [None if value == 'none' else value for value in (part.strip() for part in raw.split(',')) if value]
+        if dimension == 'chef':
+            values = [None if value is None else int(value) for value in values]
+        filters[dimension] = values
+    return filters
+
+
+@login_required
+@require_http_methods(["GET"])
+def chantiers_profitability(request):
+    """
+    Get devis, cost, VA and VA % of chantiers sliced by the cube dimensions.
+    
+    ?group_by=chef,month groups (chef, ville, client, month, travaux) and
+    ?ville=Paris,Lyon&travaux=Peinture filter; without group_by the portfolio total is returned.
+    """
+    try:
+        group_by = tuple(part for part in request.GET.get('group_by', '').split(',') if part)
+        filters = _profitability_filters(request)
+        cells = cube.profitability(group_by, filters)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    
+    return JsonResponse({'success': True, 'group_by': list(group_by), 'cells': cells}, status=200)
+
+
+def _serialize_forecast(forecast):
+    return {
+        'chantier_id': forecast.chantier_id,
+        'name': forecast.chantier.name_chantier or 'Sans nom',
+        'burn_hours_per_day': forecast.burn_hours_per_day,
+        'cost_per_hour': forecast.cost_per_hour,
+        'hours_at_completion': forecast.hours_at_completion,
+        'completion_date': forecast.completion_date.isoformat() if forecast.completion_date else None,
+        'cost_at_completion': float(forecast.cost_at_completion),
+        'final_va': float(forecast.final_va),
+        'final_va_percent': forecast.final_va_percent,
+        'below_threshold': forecast.below_threshold,
+        'computed_at': forecast.computed_at.isoformat(),
     }
+
+
+@login_required
+@require_http_methods(["GET"])
+def chantier_forecasts(request):
+    """
+    Get the stored burn-rate forecasts of active chantiers, worst final VA first.
     
-    return render(request, 'map.html', context)
+    ?below_threshold=1 keeps the chantiers projected under VA_THRESHOLD_PERCENT.
+    """
+    forecasts = ChantierForecast.objects.select_related('chantier').order_by('final_va_percent', 'chantier_id')
+    if request.GET.get('below_threshold') in ('1', 'true'):
+        forecasts = forecasts.filter(below_threshold=True)
+    
+    return JsonResponse({
+        'success': True,
+        'threshold_percent': float(VA_THRESHOLD_PERCENT),
+        'forecasts': [_serialize_forecast(forecast) for forecast in forecasts],
+    }, status=200)
+
+
+@login_required
+@require_http_methods(["POST"])
+def refresh_chantier_forecasts(request):
+    """Recompute every forecast now instead of waiting for the nightly run"""
+    forecasts = forecast_chantiers()
+    return JsonResponse({
+        'success': True,
+        'count': len(forecasts),
+        'below_threshold': sum(1 for item in forecasts if item.below_threshold),
+    }, status=200)
@@ -0,0 +1,141 @@
+/**
+ * Chantier Detail Page JavaScript - planning history table
+ */
+
+const planningHistory = {
+    chantierId: null,
+    page: 1,
+    sort: '-date',
+    requestId: 0,
+};
+
+document.addEventListener('DOMContentLoaded', function() {
+    const container = document.getElementById('planning-history');
+    if (!container) return;
+
+    planningHistory.chantierId = container.dataset.chantierId;
+    setupPlanningHistoryListeners(container);
+    loadPlanningHistory();
+});
+
+function setupPlanningHistoryListeners(container) {
+    ['history-user', 'history-date-from', 'history-date-to'].forEach(id => {
+        document.getElementById(id)?.addEventListener('change', () => {
+            planningHistory.page = 1;
+            loadPlanningHistory();
+        });
+    });
+
+    container.querySelectorAll('th[data-sort]').forEach(header => {
+        header.addEventListener('click', () => {
+            // Click toggles the direction of the current column, a new column starts ascending
+            const column = header.dataset.sort;
+            planningHistory.sort = planningHistory.sort === column ? `-${column}` : column;
+            planningHistory.page = 1;
+            loadPlanningHistory();
+        });
+    });
+
+    document.getElementById('history-prev')?.addEventListener('click', () => {
+        if (planningHistory.page > 1) {
+            planningHistory.page--;
+            loadPlanningHistory({ rollup: false });
+        }
+    });
+    document.getElementById('history-next')?.addEventListener('click', () => {
+        planningHistory.page++;
+        loadPlanningHistory({ rollup: false });
+    });
+}
+
+function planningHistoryFilters() {
+    const params = new URLSearchParams();
+    const userId = document.getElementById('history-user')?.value;
+    const dateFrom = document.getElementById('history-date-from')?.value;
+    const dateTo = document.getElementById('history-date-to')?.value;
+    if (userId) params.set('user_id', userId);
+    if (dateFrom) params.set('date_from', dateFrom);
+    if (dateTo) params.set('date_to', dateTo);
+    return params;
+}
+
+function loadPlanningHistory({ rollup = true } = {}) {
+    const requestId = ++planningHistory.requestId;
+    const params = planningHistoryFilters();
+    const baseUrl = `/chantiers/${planningHistory.chantierId}/plannings/`;
+
+    const pageParams = new URLSearchParams(params);
+    pageParams.set('page', planningHistory.page);
+    pageParams.set('sort', planningHistory.sort);
+
+    fetch(`${baseUrl}?${pageParams}`)
+        .then(response => response.json())
+        .then(data => {
+            if (requestId !== planningHistory.requestId) return;
+            if (data.success) {
+                renderPlanningHistory(data);
+            }
+        })
+        .catch(error => console.error('Error loading planning history:', error));
+
+    if (rollup) {
+        fetch(`${baseUrl}rollup/?${params}`)
+            .then(response => response.json())
+            .then(data => {
+                if (requestId !== planningHistory.requestId) return;
+                if (data.success) {
+                    renderPlanningRollup(data.weeks);
+                }
+            })
+            .catch(error => console.error('Error loading planning rollup:', error));
+    }
+}
+
+function renderPlanningHistory(data) {
+    const tbody = document.getElementById('history-body');
+    if (!tbody) return;
+
+    if (data.slots.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="6" style="color: var(--muted); font-style: italic; text-align: center;">Aucun planning pour ce chantier</td></tr>';
+    } else {
+        tbody.innerHTML = data.slots.map(slot => `
+            <tr>
+                <td>${utils.formatDateShort(slot.date)}</td>
+                <td>${utils.escapeHtml(slot.user)}</td>
+                <td>${slot.start_hour}</td>
+                <td>${slot.end_hour}</td>
+                <td>${slot.hours.toFixed(2)}h</td>
+                <td>${utils.formatCurrency(slot.cost)}</td>
+            </tr>
+        `).join('');
+    }
+
+    const pageCount = Math.max(1, Math.ceil(data.total / data.page_size));
+    const info = document.getElementById('history-page-info');
+    if (info) info.textContent = `Page ${data.page} / ${pageCount} (${data.total} créneaux)`;
+
+    const prev = document.getElementById('history-prev');
+    const next = document.getElementById('history-next');
+    if (prev) prev.disabled = data.page <= 1;
+    if (next) next.disabled = !data.has_next;
+}
+
+function renderPlanningRollup(weeks) {
+    const tbody = document.getElementById('history-rollup-body');
+    if (!tbody) return;
+
+    if (weeks.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="5" style="color: var(--muted); font-style: italic; text-align: center;">-</td></tr>';
+        return;
+    }
+
+    tbody.innerHTML = weeks.map(week => `
+        <tr>
+            <td>${utils.formatDateShort(week.week_start)}</td>
+            <td>${utils.escapeHtml(week.user)}</td>
+            <td>${week.slots}</td>
+            <td>${week.hours.toFixed(2)}h</td>
+            <td>${utils.formatCurrency(week.cost)}</td>
+        </tr>
+    `).join('');
+}
@@ -4,31 +4,44 @@
 
 let chantiers = [];
 let filteredChantiers = [];
+let searchResults = null; // Ranked matches from /chantiers/search/, null when the search box is empty
+let searchRequestId = 0;
 
 document.addEventListener('DOMContentLoaded', function() {
     loadChantiers();
     setupEventListeners();
 });
 
+let chantiersLoadId = 0; // Incremented on each reload so stale page fetches are dropped
+
 function loadChantiers() {
-    fetch('/chantiers/list/')
+    const loadId = ++chantiersLoadId;
+    chantiers = [];
+    filteredChantiers = [];
+    loadChantiersPage(loadId, null);
+}
+
+function loadChantiersPage(loadId, cursor) {
+    // Pages are appended as they arrive so the table is usable before the last one
+    const url = cursor ? `/chantiers/list/?cursor=${encodeURIComponent(cursor)}` : '/chantiers/list/';
+    fetch(url)
         .then(response => response.json())
         .then(data => {
+            if (loadId !== chantiersLoadId) return;
             if (data.success) {
-                chantiers = data.chantiers;
-                filteredChantiers = [...chantiers];
-                renderChantiers();
+                chantiers = chantiers.concat(data.chantiers);
+                filterChantiers();
                 updateStats();
+                if (data.next_cursor) {
+                    loadChantiersPage(loadId, data.next_cursor);
+                }
             } else {
-                chantiers = [];
-                filteredChantiers = [];
                 renderChantiers();
             }
         })
         .catch(error => {
+            if (loadId !== chantiersLoadId) return;
             console.error('Error loading chantiers:', error);
-            chantiers = [];
-            filteredChantiers = [];
             renderChantiers();
         });
 }
@@ -85,7 +98,7 @@ function setupEventListeners() {
     const addBtn = document.getElementById('add-chantier-btn');
 
     if (searchInput) {
-        searchInput.addEventListener('input', utils.debounce(filterChantiers, 300));
+        searchInput.addEventListener('input', utils.debounce(searchChantiers, 300));
     }
 
     if (filterManager) {
@@ -101,13 +114,38 @@ function setupEventListeners() {
     }
 }
 
+function searchChantiers() {
+    // Text search runs on the server index so it also finds chantiers not loaded yet
+    const query = document.getElementById('search-input')?.value.trim() || '';
+    const requestId = ++searchRequestId;
+    if (!query) {
+        searchResults = null;
+        filterChantiers();
+        return;
+    }
+
+    fetch(`/chantiers/search/?q=${encodeURIComponent(query)}`)
+        .then(response => response.json())
+        .then(data => {
+            if (requestId !== searchRequestId) return;
+            searchResults = data.success ? data.chantiers : [];
+            filterChantiers();
+        })
+        .catch(error => {
+            if (requestId !== searchRequestId) return;
+            console.error('Error searching chantiers:', error);
+            searchResults = null;
+            filterChantiers();
+        });
+}
+
 function filterChantiers() {
-    const searchTerm = document.getElementById('search-input')?.value.toLowerCase() || '';
+    const searchTerm = searchResults === null ? (document.getElementById('search-input')?.value.toLowerCase() || '') : '';
     const managerFilter = document.getElementById('filter-manager')?.value || '';
     const statusFilter = document.getElementById('filter-status')?.value || '';
 
-    filteredChantiers = chantiers.filter(chantier => {
-        // Search filter
+    filteredChantiers = (searchResults || chantiers).filter(chantier => {
+        // Search filter (server results are already matched)
         const matchesSearch = !searchTerm || 
             (chantier.name_chantier && chantier.name_chantier.toLowerCase().includes(searchTerm)) ||
             (chantier.adresse_chantier && chantier.adresse_chantier.toLowerCase().includes(searchTerm)) ||
@@ -14,6 +14,9 @@ let expandedItems = new Set(); // Track expanded items
 let searchFilter = '';
 let sitesViewInitialized = false; // Track if sites view has been initialized with expanded items
 let workersViewInitialized = false; // Track if workers view has been initialized with expanded items
+let planningCursor = null; // Sync cursor returned by /planning/list/ and /planning/sync/
+let planningEvents = null; // EventSource pushing other users' changes for the displayed range
+let planningEventsRange = '';
 
 document.addEventListener('DOMContentLoaded', function() {
     setupDateRange();
@@ -52,7 +55,9 @@ async function loadPlanning() {
                 users: result.users || [],
                 chantiers: result.chantiers || []
             };
+            planningCursor = result.cursor || null;
             renderPlanning();
+            subscribePlanningEvents(dateFrom.value, dateTo.value);
         } else {
             console.error('Error loading planning:', result.error);
             renderPlanning(); // Render with empty data
@@ -63,6 +68,80 @@ async function loadPlanning() {
     }
 }
 
+async function syncPlanning() {
+    // Fetch only the slots changed since the last load/sync and patch the grid in place
+    const dateFrom = document.getElementById('date-from');
+    const dateTo = document.getElementById('date-to');
+    
+    if (!planningCursor || !dateFrom || !dateTo || !dateFrom.value || !dateTo.value) {
+        return loadPlanning();
+    }
+    
+    try {
+        const params = new URLSearchParams({
+            since: planningCursor,
+            date_from: dateFrom.value,
+            date_to: dateTo.value
+        });
+        const response = await fetch(`/planning/sync/?${params}`, {
+            method: 'GET',
+            credentials: 'include'
+        });
+        
+        const result = await response.json();
+        
+        if (!response.ok || !result.success || result.full_reload) {
+            return loadPlanning();
+        }
+        
+        const removedIds = new Set([...(result.deleted || []), ...(result.moved_out || [])]);
+        const changedSlots = [...(result.created || []), ...(result.updated || [])];
+        changedSlots.forEach(slot => removedIds.add(slot.id));
+        
+        planningData.slots = planningData.slots
+            .filter(slot => !removedIds.has(slot.id))
+            .concat(changedSlots);
+        planningCursor = result.cursor;
+        renderPlanning();
+    } catch (error) {
+        console.error('Error syncing planning:', error);
+        return loadPlanning();
+    }
+}
+
+// Coalesce bursts of pushed events (e.g. a bulk creation) into one delta sync
+const syncPlanningSoon = utils.debounce(() => syncPlanning(), 300);
+
+function subscribePlanningEvents(dateFrom, dateTo) {
+    // Server-Sent Events: small messages when someone else edits the displayed range
+    if (!window.EventSource) return;
+    
+    const range = `${dateFrom}|${dateTo}`;
+    if (planningEvents && planningEventsRange === range) return;
+    if (planningEvents) planningEvents.close();
+    
+    const params = new URLSearchParams({ date_from: dateFrom, date_to: dateTo });
+    planningEvents = new EventSource(`/planning/events/?${params}`, { withCredentials: true });
+    planningEventsRange = range;
+    
+    ['created', 'updated', 'deleted', 'resync'].forEach(type => {
+        planningEvents.addEventListener(type, syncPlanningSoon);
+    });
+    // The server closes streams periodically: catch up on what changed while reconnecting
+    let streamOpened = false;
+    planningEvents.onopen = () => {
+        if (streamOpened) syncPlanningSoon();
+        streamOpened = true;
+    };
+    planningEvents.onerror = () => {
+        // Endpoint unavailable (e.g. served without ASGI): fall back to manual refresh
+        if (planningEvents.readyState === EventSource.CLOSED) {
+            planningEvents = null;
+            planningEventsRange = '';
+        }
+    };
+}
+
 function renderPlanning() {
     const container = document.getElementById('planning-calendar');
     if (!container) return;
@@ -772,7 +851,7 @@ function showAddSlotModalForCell(userId, chantierId, date) {
             
             if (response.ok && result.success) {
                 modal.remove();
-                await loadPlanning(); // Reload data
+                await syncPlanning(); // Fetch only the changes
                 // Show success notification (quiet)
                 showNotification('success', '', 'Créneau créé avec succès', true);
             } else {
@@ -989,7 +1068,7 @@ function showAddSlotModal() {
             
             if (response.ok && result.success) {
                 modal.remove();
-                await loadPlanning(); // Reload data
+                await syncPlanning(); // Fetch only the changes
                 // Show success notification (quiet)
                 showNotification('success', '', 'Créneau créé avec succès', true);
             } else {
@@ -43,6 +43,14 @@ function formatPercentage(value) {
     return `${value}%`;
 }
 
+// Escape text before inserting it into innerHTML
+function escapeHtml(text) {
+    if (!text) return '';
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
 // ===== Sidebar Theme Toggle =====
 (function() {
     'use strict';
@@ -242,6 +250,7 @@ if (typeof window !== 'undefined') {
         formatDateShort,
         formatTime,
         formatPercentage,
+        escapeHtml,
         debounce,
         showLoading,
         showError,
@@ -3,13 +3,30 @@ from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
+from accounts.models import User
+from MyBTP.utils import conditional_json, queryset_version
 from .models import Equipe
 from .forms import TeamForm
 
 
+def _teams_list_version(request):
+    """
+    Teams, users (chef names) and memberships.
+
+    Membership rows are only ever inserted or deleted, so count + max(id) of the
+    through table changes on every add or remove.
+    """
+    return (
+        queryset_version(Equipe.objects.all())
+        + queryset_version(User.objects.all())
+        + queryset_version(Equipe.members.through.objects.all(), field='id')
+    )
+
+
 @login_required
 @require_http_methods(["GET"])
 @ensure_csrf_cookie
+@conditional_json(_teams_list_version)
 def list_teams(request):
     """Get list of teams via AJAX"""
     teams_list = Equipe.objects.all().order_by('name')